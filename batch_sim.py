@@ -0,0 +1,455 @@
+"""Simulación por lotes: N partidas independientes avanzando a la vez con NumPy.
+
+Reproduce tick a tick la lógica de pacman.Simulation. Las decisiones aleatorias
+(fantasmas asustados o en scatter y frutas) se sacan de un random.Random por
+partida en el mismo orden que la versión escalar, así que la partida i de un
+lote con semilla s coincide con Simulation(seed=s).
+"""
+import random
+
+import numpy as np
+
+from pacman import (MAZE_GRID, BONUS_FRUITS, GHOSTS, DOT, POWER_PELLET, ALL_EXITS,
+                    DIRECTION_OPTIONS, SUBPIXELS, CELL_SUBPIXELS, PACMAN_SPEED, GHOST_SPEED,
+                    GHOST_FRIGHTENED_SPEED, GHOST_HIT_DISTANCE_SQ, FRUIT_HIT_DISTANCE_SQ)
+
+# Modos de fantasma
+CHASE = 0
+SCATTER = 1
+FRIGHTENED = 2
+
+# Desplazamiento por dirección: 0=derecha, 1=abajo, 2=izquierda, 3=arriba
+DX = np.array([1, 0, -1, 0])
+DY = np.array([0, 1, 0, -1])
+
+FRUIT_POINTS = np.array([fruit["points"] for fruit in BONUS_FRUITS])
+
+
+def compile_maze(grid):
+    """Pasa el laberinto compilado a arrays: salidas (con borde de dos celdas),
+    puntos y power pellets."""
+    cells = np.frombuffer(bytes(grid.cells), dtype=np.uint8).reshape(grid.height, grid.width)
+    exits = np.frombuffer(bytes(grid.exits), dtype=np.uint8).reshape(grid.height + 2, grid.width + 2)
+    # Más allá del borde de la tabla todas las direcciones están libres
+    exits = np.pad(exits, 1, constant_values=ALL_EXITS).astype(np.int64)
+    dots = cells == DOT
+    pellets = cells == POWER_PELLET
+    return exits, dots, pellets
+
+
+class BatchSimulation:
+    """N partidas en arrays NumPy. step(actions) las avanza todas un tick"""
+    def __init__(self, n, seeds=None, grid=MAZE_GRID):
+        self.n = n
+        self.grid = grid
+        self.exits, self.initial_dots, self.initial_pellets = compile_maze(grid)
+        self.free_cells = grid.free_cells
+        self.start_cell = grid.start_cell
+        self.height, self.width = self.initial_dots.shape
+        self.fruit_spawn_interval = 1800
+
+        # Distancias por el laberinto para la persecución (tabla completa)
+        distances = grid.distances()
+        if distances.table is None:
+            raise ValueError("BatchSimulation necesita la tabla completa de distancias "
+                             "(laberinto de más de %d celdas transitables)" % distances.ALL_PAIRS_LIMIT)
+        self.unreachable = distances.unreachable
+        self.distance_table = np.frombuffer(distances.table, dtype=np.uint16).reshape(
+            distances.count, distances.count).astype(np.int64)
+        self.walk_index = np.array(distances.walk_index, dtype=np.int64)
+        self.neighbors = np.array(distances.neighbors, dtype=np.int64)
+
+        # Pacman (posiciones en subpíxeles, como en pacman.GridMover)
+        self.px = np.zeros(n, dtype=np.int64)
+        self.py = np.zeros(n, dtype=np.int64)
+        self.ptx = np.zeros(n, dtype=np.int64)
+        self.pty = np.zeros(n, dtype=np.int64)
+        self.pdir = np.zeros(n, dtype=np.int64)
+        self.pnext = np.full(n, -1, dtype=np.int64)
+        self.pmoving = np.zeros(n, dtype=bool)
+        self.anim_frame = np.zeros(n, dtype=np.int64)
+        self.mouth_open = np.ones(n, dtype=bool)
+
+        # Fantasmas (N, 4)
+        ghost_starts = grid.ghost_start_cells[:len(GHOSTS)]
+        shape = (n, len(ghost_starts))
+        self.ghost_start_x = np.array([x * CELL_SUBPIXELS for x, _ in ghost_starts], dtype=np.int64)
+        self.ghost_start_y = np.array([y * CELL_SUBPIXELS for _, y in ghost_starts], dtype=np.int64)
+        self.gx = np.zeros(shape, dtype=np.int64)
+        self.gy = np.zeros(shape, dtype=np.int64)
+        self.gtx = np.zeros(shape, dtype=np.int64)
+        self.gty = np.zeros(shape, dtype=np.int64)
+        self.gdir = np.zeros(shape, dtype=np.int64)
+        self.gmode = np.zeros(shape, dtype=np.int64)
+        self.gmode_timer = np.zeros(shape, dtype=np.int64)
+        self.gfrightened = np.zeros(shape, dtype=bool)
+        self.gfrightened_timer = np.zeros(shape, dtype=np.int64)
+        self.gblink_timer = np.zeros(shape, dtype=np.int64)
+        self.gmoving = np.zeros(shape, dtype=bool)
+
+        # Puntos y power pellets por partida
+        self.dots = np.zeros((n, self.height, self.width), dtype=bool)
+        self.pellets = np.zeros((n, self.height, self.width), dtype=bool)
+        self.dots_left = np.zeros(n, dtype=np.int64)
+        self.pellets_left = np.zeros(n, dtype=np.int64)
+
+        # Fruta bonus
+        self.fruit_active = np.zeros(n, dtype=bool)
+        self.fruit_x = np.zeros(n, dtype=np.int64)
+        self.fruit_y = np.zeros(n, dtype=np.int64)
+        self.fruit_type = np.zeros(n, dtype=np.int64)
+        self.fruit_timer = np.zeros(n, dtype=np.int64)
+        self.fruit_blink_timer = np.zeros(n, dtype=np.int64)
+        self.fruit_visible = np.zeros(n, dtype=bool)
+        self.fruit_spawn_timer = np.zeros(n, dtype=np.int64)
+
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lives = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.win = np.zeros(n, dtype=bool)
+        self.power_pellet_mode = np.zeros(n, dtype=bool)
+        self.power_pellet_timer = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+
+        self.rngs = [None] * n
+        self.reset(seeds=seeds)
+
+    @property
+    def done(self):
+        return self.game_over | self.win
+
+    def reset(self, indices=None, seeds=None):
+        """Reinicia las partidas indicadas (todas por defecto)"""
+        if indices is None:
+            indices = np.arange(self.n)
+        indices = np.asarray(indices, dtype=np.int64)
+        if seeds is None:
+            seeds = [None] * len(indices)
+
+        start_x = self.start_cell[0] * CELL_SUBPIXELS
+        start_y = self.start_cell[1] * CELL_SUBPIXELS
+        self.px[indices] = start_x
+        self.py[indices] = start_y
+        self.ptx[indices] = start_x
+        self.pty[indices] = start_y
+        self.pdir[indices] = 0
+        self.pnext[indices] = -1
+        self.pmoving[indices] = False
+        self.anim_frame[indices] = 0
+        self.mouth_open[indices] = True
+
+        self.gx[indices] = self.ghost_start_x
+        self.gy[indices] = self.ghost_start_y
+        self.gtx[indices] = self.ghost_start_x
+        self.gty[indices] = self.ghost_start_y
+        self.gmode[indices] = CHASE
+        self.gmode_timer[indices] = 0
+        self.gfrightened[indices] = False
+        self.gfrightened_timer[indices] = 0
+        self.gblink_timer[indices] = 0
+        self.gmoving[indices] = False
+
+        self.dots[indices] = self.initial_dots
+        self.pellets[indices] = self.initial_pellets
+        self.dots_left[indices] = self.initial_dots.sum()
+        self.pellets_left[indices] = self.initial_pellets.sum()
+
+        self.fruit_active[indices] = False
+        self.fruit_visible[indices] = False
+        self.fruit_spawn_timer[indices] = 0
+
+        self.score[indices] = 0
+        self.lives[indices] = 3
+        self.game_over[indices] = False
+        self.win[indices] = False
+        self.power_pellet_mode[indices] = False
+        self.power_pellet_timer[indices] = 0
+        self.ticks[indices] = 0
+
+        # Dirección inicial de cada fantasma, en el mismo orden que Ghost.__init__
+        for i, seed in zip(indices.tolist(), seeds):
+            rng = random.Random(seed)
+            self.rngs[i] = rng
+            for k in range(self.ghost_start_x.size):
+                self.gdir[i, k] = rng.randint(0, 3)
+
+    def _exits_at(self, cell_x, cell_y):
+        # La tabla tiene dos celdas de borde: lo que queda fuera se recorta a ALL_EXITS
+        return self.exits[np.clip(cell_y + 2, 0, self.height + 3),
+                          np.clip(cell_x + 2, 0, self.width + 3)]
+
+    def _walk_index_at(self, cell_x, cell_y):
+        # Índice compacto de celda transitable, -1 fuera del laberinto o en pared
+        inside = (cell_x >= 0) & (cell_x < self.width) & (cell_y >= 0) & (cell_y < self.height)
+        index = np.clip(cell_y, 0, self.height - 1) * self.width + np.clip(cell_x, 0, self.width - 1)
+        return np.where(inside, self.walk_index[index], -1)
+
+    def _pacman_can_move(self, direction):
+        cell_x = self.px // CELL_SUBPIXELS
+        cell_y = self.py // CELL_SUBPIXELS
+        return (self._exits_at(cell_x, cell_y) >> direction & 1).astype(bool)
+
+    def step(self, actions=None):
+        """Avanza un tick. actions: array de N direcciones, -1 sin cambio. Devuelve los puntos ganados"""
+        if actions is not None:
+            actions = np.asarray(actions, dtype=np.int64)
+            has_action = actions >= 0
+            action_dir = np.where(has_action, actions, 0)
+            change_now = has_action & ~self.pmoving & self._pacman_can_move(action_dir)
+            self.pdir = np.where(change_now, action_dir, self.pdir)
+            self.pnext = np.where(has_action & ~change_now, action_dir, self.pnext)
+
+        active = ~(self.game_over | self.win)
+        score_before = self.score.copy()
+        self.ticks += active
+
+        self._update_pacman(active)
+        self._update_ghosts(active)
+
+        # Manejar modo power pellet
+        power = active & self.power_pellet_mode
+        self.power_pellet_timer -= power
+        self.power_pellet_mode &= ~(power & (self.power_pellet_timer <= 0))
+
+        self._update_fruit(active)
+        self._check_dot_collision(active)
+        self._check_ghost_collision(active)
+
+        return self.score - score_before
+
+    def _update_pacman(self, active):
+        # Animación de la boca
+        self.anim_frame += active
+        toggle = self.anim_frame >= 6
+        self.mouth_open ^= toggle
+        self.anim_frame[toggle] = 0
+
+        # Cambio de dirección pendiente
+        has_next = active & (self.pnext >= 0)
+        next_dir = np.where(has_next, self.pnext, 0)
+        apply = has_next & self._pacman_can_move(next_dir)
+        self.pdir = np.where(apply, next_dir, self.pdir)
+        self.pnext[apply] = -1
+
+        # Empezar nuevo movimiento
+        start = active & ~self.pmoving & self._pacman_can_move(self.pdir)
+        cell_x = self.px // CELL_SUBPIXELS
+        cell_y = self.py // CELL_SUBPIXELS
+        self.ptx = np.where(start, (cell_x + DX[self.pdir]) * CELL_SUBPIXELS, self.ptx)
+        self.pty = np.where(start, (cell_y + DY[self.pdir]) * CELL_SUBPIXELS, self.pty)
+        self.pmoving |= start
+
+        self._move_towards_target(active & self.pmoving, self.px, self.py,
+                                  self.ptx, self.pty, self.pmoving,
+                                  PACMAN_SPEED, PACMAN_SPEED)
+
+    def _move_towards_target(self, mask, x, y, target_x, target_y, moving,
+                             arrive_within, speed):
+        # Opera en el sitio sobre los arrays recibidos; igual que GridMover.move_towards_target
+        dx = target_x - x
+        dy = target_y - y
+        arrive = mask & (np.abs(dx) + np.abs(dy) <= arrive_within)
+        advance = mask & ~arrive
+
+        # Por ejes y sin pasarse del objetivo
+        np.add(x, np.clip(dx, -speed, speed), out=x, where=advance)
+        np.add(y, np.clip(dy, -speed, speed), out=y, where=advance)
+
+        np.copyto(x, target_x, where=arrive)
+        np.copyto(y, target_y, where=arrive)
+        moving &= ~arrive
+
+        # Teletransporte horizontal
+        left = arrive & (x < 0)
+        right = arrive & (x >= self.grid.sub_width)
+        x[left] = self.grid.tunnel_left_x * SUBPIXELS
+        x[right] = self.grid.tunnel_right_x * SUBPIXELS
+        np.copyto(target_x, x, where=left | right)
+
+    def _update_ghosts(self, active):
+        act = active[:, None]
+        self.gmode_timer += act
+
+        # Modo asustado
+        frightened = act & self.gfrightened
+        self.gfrightened_timer -= frightened
+        self.gblink_timer += frightened
+        ends = frightened & (self.gfrightened_timer <= 0)
+        self.gfrightened &= ~ends
+        self.gmode[ends] = CHASE
+
+        # Alternar chase/scatter
+        toggle = act & ~self.gfrightened & (self.gmode_timer > 300)
+        self.gmode = np.where(toggle, np.where(self.gmode == CHASE, SCATTER, CHASE), self.gmode)
+        self.gmode_timer[toggle] = 0
+
+        start = act & ~self.gmoving
+        if start.any():
+            self._start_ghost_movement(start)
+
+        moving = act & self.gmoving
+        move_speed = np.where(self.gfrightened, GHOST_FRIGHTENED_SPEED, GHOST_SPEED)
+        self._move_towards_target(moving, self.gx, self.gy, self.gtx, self.gty,
+                                  self.gmoving, GHOST_SPEED, move_speed)
+
+    def _start_ghost_movement(self, start):
+        cell_x = self.gx // CELL_SUBPIXELS
+        cell_y = self.gy // CELL_SUBPIXELS
+
+        # possible[i, k, d]: el fantasma k de la partida i puede ir en dirección d
+        exits = self._exits_at(cell_x, cell_y)
+        possible = (exits[..., None] >> np.arange(4) & 1).astype(bool)
+        any_possible = exits != 0
+        next_x = cell_x[..., None] + DX
+        next_y = cell_y[..., None] + DY
+
+        # Persecución: la dirección posible que más acerca a Pacman por el
+        # laberinto; si ninguna tiene camino conocido, en línea recta
+        chase = start & any_possible & ~self.gfrightened & (self.gmode == CHASE)
+        if chase.any():
+            target_x = (self.px + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+            target_y = (self.py + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+            target = self._walk_index_at(target_x, target_y)
+
+            inside = ((cell_x >= 0) & (cell_x < self.width) &
+                      (cell_y >= 0) & (cell_y < self.height))
+            cell_index = np.clip(cell_y, 0, self.height - 1) * self.width + np.clip(cell_x, 0, self.width - 1)
+            neighbors = np.where(inside[..., None], self.neighbors[cell_index], -1)
+
+            known = possible & (neighbors >= 0) & (target >= 0)[:, None, None]
+            path = self.distance_table[np.maximum(target, 0)[:, None, None], np.maximum(neighbors, 0)]
+            known &= path != self.unreachable
+            path_direction = np.where(known, path, self.unreachable).argmin(axis=2)
+
+            dist_x = next_x * CELL_SUBPIXELS - self.px[:, None, None]
+            dist_y = next_y * CELL_SUBPIXELS - self.py[:, None, None]
+            straight = np.where(possible, dist_x * dist_x + dist_y * dist_y, np.iinfo(np.int64).max)
+            straight_direction = straight.argmin(axis=2)
+
+            best = np.where(known.any(axis=2), path_direction, straight_direction)
+            self.gdir = np.where(chase, best, self.gdir)
+
+        # Asustado o scatter: decisiones aleatorias por partida, fantasma a fantasma
+        frightened = start & any_possible & self.gfrightened
+        scatter = start & any_possible & ~self.gfrightened & (self.gmode == SCATTER)
+        random_pick = frightened | scatter
+        if random_pick.any():
+            # Orden fantasma a fantasma: dentro de cada partida se respeta el orden escalar
+            ks, games = np.nonzero(random_pick.T)
+            for k, i, is_scatter, code in zip(ks.tolist(), games.tolist(),
+                                              scatter[games, ks].tolist(),
+                                              exits[games, ks].tolist()):
+                rng = self.rngs[i]
+                if is_scatter and rng.randint(0, 5) != 0:
+                    continue
+                self.gdir[i, k] = rng.choice(DIRECTION_OPTIONS[code])
+
+        # Calcular objetivo
+        self.gtx = np.where(start, (cell_x + DX[self.gdir]) * CELL_SUBPIXELS, self.gtx)
+        self.gty = np.where(start, (cell_y + DY[self.gdir]) * CELL_SUBPIXELS, self.gty)
+        self.gmoving |= start
+
+    def _update_fruit(self, active):
+        self.fruit_spawn_timer += active
+        due = active & (self.fruit_spawn_timer >= self.fruit_spawn_interval)
+        if due.any():
+            for i in np.flatnonzero(due & ~self.fruit_active).tolist():
+                rng = self.rngs[i]
+                self.fruit_type[i] = rng.choice(range(len(BONUS_FRUITS)))
+                x, y = 1, 1
+                if self.free_cells:
+                    y, x = divmod(rng.choice(self.free_cells), self.width)
+                self.fruit_x[i] = x * CELL_SUBPIXELS
+                self.fruit_y[i] = y * CELL_SUBPIXELS
+                self.fruit_timer[i] = 600
+                self.fruit_blink_timer[i] = 0
+                self.fruit_visible[i] = True
+                self.fruit_active[i] = True
+            self.fruit_spawn_timer[due] = 0
+
+        fruit = active & self.fruit_active
+        self.fruit_timer -= fruit
+        self.fruit_blink_timer += fruit
+        blink = fruit & (self.fruit_timer < 120)
+        self.fruit_visible = np.where(blink, self.fruit_blink_timer % 10 < 5, self.fruit_visible)
+        self.fruit_active &= ~(fruit & (self.fruit_timer <= 0))
+
+    def _check_dot_collision(self, active):
+        # Solo la celda más cercana al centro de Pacman puede estar a menos de media celda
+        cell_x = (self.px + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+        cell_y = (self.py + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+        dx = self.px - cell_x * CELL_SUBPIXELS
+        dy = self.py - cell_y * CELL_SUBPIXELS
+        inside = ((cell_x >= 0) & (cell_x < self.width) &
+                  (cell_y >= 0) & (cell_y < self.height))
+        close = active & inside & (dx * dx + dy * dy < (CELL_SUBPIXELS // 2) ** 2)
+
+        games = np.flatnonzero(close)
+        if len(games):
+            cx = cell_x[games]
+            cy = cell_y[games]
+
+            # Puntos normales
+            eaten = self.dots[games, cy, cx]
+            self.dots[games, cy, cx] = False
+            self.dots_left[games] -= eaten
+            self.score[games] += 10 * eaten
+
+            # Power pellets
+            eaten = self.pellets[games, cy, cx]
+            if eaten.any():
+                powered = games[eaten]
+                self.pellets[powered, cy[eaten], cx[eaten]] = False
+                self.pellets_left[powered] -= 1
+                self.score[powered] += 50
+                self.power_pellet_mode[powered] = True
+                self.power_pellet_timer[powered] = 300
+                self.gfrightened[powered] = True
+                self.gfrightened_timer[powered] = 300
+                self.gblink_timer[powered] = 0
+                self.gmode[powered] = FRIGHTENED
+
+        # Fruta bonus
+        dx = self.px - self.fruit_x
+        dy = self.py - self.fruit_y
+        fruit = active & self.fruit_active & (dx * dx + dy * dy < FRUIT_HIT_DISTANCE_SQ)
+        self.score += np.where(fruit, FRUIT_POINTS[self.fruit_type], 0)
+        self.fruit_active &= ~fruit
+
+        # Victoria
+        self.win |= active & (self.dots_left == 0) & (self.pellets_left == 0)
+
+    def _check_ghost_collision(self, active):
+        dx = self.px[:, None] - self.gx
+        dy = self.py[:, None] - self.gy
+        collide = active[:, None] & (dx * dx + dy * dy < GHOST_HIT_DISTANCE_SQ)
+        if not collide.any():
+            return
+
+        # Se recorren los fantasmas en orden: los asustados anteriores al
+        # primero que mata a Pacman se comen; el resto no se llega a mirar
+        deadly = collide & ~self.gfrightened
+        dies = deadly.any(axis=1)
+        first_deadly = np.where(dies, deadly.argmax(axis=1), collide.shape[1])
+        ghost_index = np.arange(collide.shape[1])
+        eaten = collide & self.gfrightened & (ghost_index < first_deadly[:, None])
+
+        if eaten.any():
+            self.score += 200 * eaten.sum(axis=1)
+            np.copyto(self.gx, self.ghost_start_x, where=eaten)
+            np.copyto(self.gy, self.ghost_start_y, where=eaten)
+            np.copyto(self.gtx, self.ghost_start_x, where=eaten)
+            np.copyto(self.gty, self.ghost_start_y, where=eaten)
+            self.gmoving &= ~eaten
+            self.gfrightened &= ~eaten
+            self.gmode[eaten] = CHASE
+
+        if dies.any():
+            self.lives -= dies
+            self.game_over |= dies & (self.lives <= 0)
+            respawn = dies & (self.lives > 0)
+            self.px[respawn] = self.start_cell[0] * CELL_SUBPIXELS
+            self.py[respawn] = self.start_cell[1] * CELL_SUBPIXELS
+            self.ptx[respawn] = self.px[respawn]
+            self.pty[respawn] = self.py[respawn]
+            self.pmoving &= ~respawn
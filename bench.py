@@ -0,0 +1,262 @@
+"""Benchmarks de la simulación, la IA de los fantasmas y el dibujado.
+
+Se ejecuta sin ventana (SDL_VIDEODRIVER=dummy), escribe los resultados en JSON
+y opcionalmente los compara con una línea base guardada:
+
+    python bench.py --output resultados.json
+    python bench.py --baseline bench_baseline.json --threshold 0.15
+    python bench.py --save-baseline bench_baseline.json
+
+Con --baseline el código de salida es 1 si alguna medida empeora más que el
+umbral. Cada ejecución cronometra también un bucle de referencia en Python
+puro, y la línea base se escala por la razón entre las dos referencias antes de
+comparar: así se compara el coste relativo al intérprete y la máquina de cada
+ejecución y no los tiempos absolutos de la máquina que generó la línea base.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from pacman import Simulation, Game, MAZE_GRID
+from mazegen import generate_grid
+
+DEFAULT_THRESHOLD = 0.20
+LARGE_MAZE = (1000, 1000)  # Laberinto generado para comprobar que el coste no crece con el tamaño
+
+
+def sample_states(count, seed=0, spacing=37):
+    """Copias de partidas en distintos momentos, jugadas con un bot aleatorio"""
+    rng = random.Random(seed)
+    states = []
+    game_seed = seed
+    sim = Simulation(seed=game_seed)
+    while len(states) < count:
+        if sim.done:
+            game_seed += 1
+            sim = Simulation(seed=game_seed)
+        if not sim.pacman.moving or rng.random() < 0.02:
+            sim.change_direction(rng.randint(0, 3))
+        sim.step()
+        if sim.ticks % spacing == 0:
+            states.append(sim.clone())
+    return states
+
+
+def best_time(function, repeat, number=1, setup=None):
+    """Segundos por llamada: el mínimo de varias repeticiones de number llamadas,
+    sin el recolector de basura, que es la medida menos afectada por ruido.
+    Con setup, cada llamada recibe lo que devuelve setup(), que no se cronometra"""
+    best = float("inf")
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if setup is None:
+                start = time.perf_counter()
+                for _ in range(number):
+                    function()
+                elapsed = time.perf_counter() - start
+            else:
+                elapsed = 0.0
+                for _ in range(number):
+                    argument = setup()
+                    start = time.perf_counter()
+                    function(argument)
+                    elapsed += time.perf_counter() - start
+            best = min(best, elapsed / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def reference_loop(iterations=100000):
+    """Bucle fijo en Python puro (índices, diccionario, aritmética entera) que
+    solo depende del intérprete y la máquina, nunca del código del juego"""
+    cells = list(range(64))
+    table = {cell: cell * 3 for cell in cells}
+    total = 0
+    for index in range(iterations):
+        total += table[cells[index & 63]] ^ index
+    return total
+
+
+def bench_reference(repeat, iterations=100000):
+    """µs por pasada de reference_loop"""
+    return best_time(lambda: reference_loop(iterations), repeat) * 1e6
+
+
+def bench_update_loop(repeat, ticks=20000, grid=MAZE_GRID):
+    """Ticks por segundo de Simulation.step con un bot aleatorio"""
+    def run():
+        rng = random.Random(1)
+        sim = Simulation(seed=1, grid=grid)
+        game_seed = 1
+        for _ in range(ticks):
+            if sim.done:
+                game_seed += 1
+                sim = Simulation(seed=game_seed, grid=grid)
+            sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+    # Primera partida fuera de la medida: tablas de distancias y demás cachés
+    Simulation(seed=0, grid=grid).step()
+    return ticks / best_time(run, repeat)
+
+
+def bench_per_call(states, call, repeat, number=20):
+    """µs por llamada de call(estado) sobre una lista de estados.
+
+    call cambia el estado (se come el punto, cuenta la colisión), así que cada
+    pasada trabaja sobre copias nuevas hechas fuera de la medida"""
+    def run(copies):
+        for state in copies:
+            call(state)
+    return best_time(run, repeat, number, lambda: [state.clone() for state in states]) / len(states) * 1e6
+
+
+def bench_ghost_decision(states, repeat, number=10):
+    """µs por decisión de Ghost.start_movement, con copias nuevas en cada pasada"""
+    def fresh_pairs():
+        return [(ghost, copy.pacman) for copy in (state.clone() for state in states) for ghost in copy.ghosts]
+
+    def run(pairs):
+        for ghost, pacman in pairs:
+            ghost.start_movement(pacman.sub_x, pacman.sub_y)
+    return best_time(run, repeat, number, fresh_pairs) / sum(len(state.ghosts) for state in states) * 1e6
+
+
+def bench_render(repeat, frames=120, grid=MAZE_GRID, phases=True):
+    """ms por frame completo y (si phases) por cada fase del dibujado"""
+    game = Game(Simulation(seed=3, grid=grid))
+    draws = {"frame": game.draw_frame}
+    if phases:
+        draws = {
+            "draw_maze": game.draw_maze,
+            "draw_dots": game.draw_dots,
+            "draw_sprites": lambda: game.draw_sprites(game.sprite_positions()),
+            "draw_ui": game.draw_ui,
+            **draws,
+        }
+    results = {}
+    for name, draw in draws.items():
+        best = float("inf")
+        gc.disable()
+        for _ in range(repeat):
+            # Misma partida cada vez; solo se cronometra el dibujado, no los ticks
+            rng = random.Random(3)
+            game.sim = Simulation(seed=3, grid=grid)
+            game.draw_frame()  # Capas construidas antes de medir
+            elapsed = 0.0
+            for _ in range(frames):
+                game.sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+                start = time.perf_counter()
+                draw()
+                elapsed += time.perf_counter() - start
+            best = min(best, elapsed)
+        gc.enable()
+        results[name] = best / frames * 1e3
+    pygame.quit()
+    return results
+
+
+def run_benchmarks(repeat=7, quick=False):
+    """Devuelve {nombre: {"value", "unit", "higher_is_better"}}"""
+    states = sample_states(100 if quick else 400)
+    results = {
+        "update_loop_ticks_per_sec": (bench_update_loop(repeat, 5000 if quick else 30000), "ticks/s", True),
+        "check_dot_collision_us": (bench_per_call(states, Simulation.check_dot_collision, repeat), "us", False),
+        "check_ghost_collision_us": (bench_per_call(states, Simulation.check_ghost_collision, repeat), "us", False),
+        "ghost_start_movement_us": (bench_ghost_decision(states, repeat), "us", False),
+    }
+    for name, value in bench_render(repeat, 30 if quick else 300).items():
+        results[f"render_{name}_ms"] = (value, "ms", False)
+
+    # Mismas medidas en un laberinto enorme: deberían quedar cerca de las anteriores
+    large = generate_grid(*LARGE_MAZE, seed=0)
+    results["large_maze_update_loop_ticks_per_sec"] = (
+        bench_update_loop(repeat, 5000 if quick else 30000, large), "ticks/s", True)
+    results["large_maze_render_frame_ms"] = (
+        bench_render(repeat, 30 if quick else 300, large, phases=False)["frame"], "ms", False)
+    return {name: {"value": value, "unit": unit, "higher_is_better": higher}
+            for name, (value, unit, higher) in results.items()}
+
+
+def compare(results, baseline, threshold, scale=1.0):
+    """Lista de (nombre, actual, base, cambio relativo, empeora) de las medidas comunes.
+
+    scale es cuánto más lento es el bucle de referencia en esta ejecución que
+    en la de la línea base; los tiempos base se multiplican por él y los ritmos
+    se dividen, así que base ya es lo esperado en esta máquina"""
+    rows = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        value = result["value"]
+        base = baseline[name]["value"]
+        base = base / scale if result["higher_is_better"] else base * scale
+        change = (value - base) / base if base else 0.0
+        # Cambio positivo = peor, sea cual sea el sentido de la medida
+        worse = -change if result["higher_is_better"] else change
+        rows.append((name, value, base, change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de Pacman Vintage")
+    parser.add_argument("--output", help="archivo JSON donde escribir los resultados")
+    parser.add_argument("--baseline", help="JSON de referencia con el que comparar")
+    parser.add_argument("--save-baseline", metavar="PATH", help="guardar los resultados como referencia")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="empeoramiento relativo tolerado (0.20 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--quick", action="store_true", help="menos muestras, para comprobar que todo funciona")
+    args = parser.parse_args(argv)
+
+    reference = bench_reference(args.repeat)
+    results = run_benchmarks(args.repeat, args.quick)
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "reference_us": reference,
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+    if not args.baseline:
+        print(f"{'reference_loop_us':34} {reference:12.3f} us")
+        for name, result in results.items():
+            print(f"{name:34} {result['value']:12.3f} {result['unit']}")
+        return 0
+
+    with open(args.baseline) as f:
+        saved = json.load(f)
+    # Líneas base sin bucle de referencia: comparación absoluta
+    scale = reference / saved["reference_us"] if saved.get("reference_us") else 1.0
+    print(f"bucle de referencia {reference:.1f} us; la línea base se escala x{scale:.2f}")
+    regressions = 0
+    for name, value, base, change, regressed in compare(results, saved["results"], args.threshold, scale):
+        regressions += regressed
+        print(f"{name:34} {value:12.3f} {base:12.3f} {change:+8.1%}{'  PEOR' if regressed else ''}")
+    if regressions:
+        print(f"{regressions} medidas empeoran más de un {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
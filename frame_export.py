@@ -0,0 +1,218 @@
+"""Exporta repeticiones a imágenes o vídeo sin ventana y más rápido que en tiempo real.
+
+Game(offscreen=True) dibuja cada frame en una Surface normal y su contenido se
+lee como vista NumPy (pygame.surfarray) sin copias. Los frames se copian por
+bloques en un anillo de memoria compartida y un pool de procesos los codifica
+en paralelo: una secuencia PNG o vídeo RGB24 sin comprimir. Como mucho hay dos
+bloques por proceso en vuelo, así que la memoria no crece con la partida.
+Requiere NumPy.
+
+    python frame_export.py replays/partida.pmr --output clip/ --start 600 --end 1800
+    python frame_export.py replays/partida.pmr --format raw --output partida.rgb
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x600 -r 60 -i partida.rgb partida.mp4
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Los procesos hijos importan pacman; no hace falta el saludo de pygame en cada uno
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from pacman import Game, SCREEN_WIDTH, SCREEN_HEIGHT, TICK_RATE
+from replay import Replay
+
+FORMATS = ("png", "raw")
+CHUNK_FRAMES = 8  # Frames por bloque; cada uno ocupa ancho * alto * 4 bytes
+PNG_LEVEL = 3  # Nivel de zlib: con 3 cada frame se comprime unas 3 veces más rápido que con pygame.image.save
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class SharedFrames:
+    """Anillo de slots con bloques de frames (alto, ancho) uint32 en memoria compartida.
+
+    El proceso principal crea el bloque y escribe en self.array; los
+    trabajadores se enganchan por nombre con attach().
+    """
+    def __init__(self, slots, frames, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, name=None, create=True):
+        self.shape = (slots, frames, height, width)
+        self.owner = create
+        size = int(np.prod(self.shape)) * 4
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.array = np.ndarray(self.shape, dtype=np.uint32, buffer=self.memory.buf)
+
+    @classmethod
+    def attach(cls, name, slots, frames, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        return cls(slots, frames, width, height, name=name, create=False)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def close(self):
+        # Quien creó el bloque también lo borra
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def frame_pixels(screen):
+    """Vista (alto, ancho) uint32 de la Surface, sin copia.
+
+    Mientras exista la Surface queda bloqueada: hay que soltarla antes de volver a dibujar.
+    """
+    return pygame.surfarray.pixels2d(screen).T
+
+
+def rgb_channels(screen):
+    # Byte de cada canal (R, G, B) dentro del píxel de 32 bits, según el formato de la Surface
+    shifts = screen.get_shifts()[:3]
+    if sys.byteorder == "little":
+        return [shift // 8 for shift in shifts]
+    return [3 - shift // 8 for shift in shifts]
+
+
+def png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def encode_png(pixels, channels, level=PNG_LEVEL):
+    """PNG RGB de 8 bits de un frame (alto, ancho, 4) en bytes, sin filtros por fila"""
+    height, width = pixels.shape[:2]
+    # Cada fila empieza con el tipo de filtro (0: ninguno)
+    rows = np.zeros((height, 1 + width * 3), dtype=np.uint8)
+    rows[:, 1:].reshape(height, width, 3)[...] = pixels[..., channels]
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (PNG_SIGNATURE + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(rows, level)) + png_chunk(b"IEND", b""))
+
+
+# Bloque compartido en cada proceso trabajador (se engancha al arrancar)
+worker_frames = None
+
+
+def attach_worker(name, slots, frames, width, height):
+    global worker_frames
+    worker_frames = SharedFrames.attach(name, slots, frames, width, height)
+
+
+def encode_chunk(slot, count, first_frame, fmt, output, channels, png_level=PNG_LEVEL):
+    """Codifica count frames del slot; el primero es el frame first_frame de la exportación"""
+    height, width = worker_frames.shape[2:]
+    pixels = worker_frames.array[slot, :count].view(np.uint8).reshape(count, height, width, 4)
+    if fmt == "png":
+        for index in range(count):
+            with open(os.path.join(output, f"frame-{first_frame + index:06d}.png"), "wb") as f:
+                f.write(encode_png(pixels[index], channels, png_level))
+    else:
+        # Frames de tamaño fijo: cada bloque va directo a su sitio en el archivo
+        rgb = np.ascontiguousarray(pixels[..., channels])
+        with open(output, "r+b") as f:
+            f.seek(first_frame * width * height * 3)
+            f.write(rgb)
+    return count
+
+
+def export_replay(replay, output, fmt="png", start=0, end=None, step=1, workers=None,
+                  chunk_frames=CHUNK_FRAMES, png_level=PNG_LEVEL):
+    """Dibuja sin ventana los ticks start..end (cada step) de la repetición y los codifica en paralelo.
+
+    Genera el número de frames terminados a medida que los trabajadores acaban bloques.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"formato desconocido: {fmt}")
+    end = replay.final_tick if end is None else min(end, replay.final_tick)
+    ticks = range(start, end + 1, step)
+    workers = workers or os.cpu_count() or 1
+
+    if fmt == "png":
+        os.makedirs(output, exist_ok=True)
+    else:
+        with open(output, "wb") as f:
+            f.truncate(len(ticks) * SCREEN_WIDTH * SCREEN_HEIGHT * 3)
+
+    sim = replay.seek(start)
+    game = Game(sim, offscreen=True)
+    channels = rgb_channels(game.screen)
+    slots = workers * 2
+    frames = SharedFrames(slots, chunk_frames)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_worker,
+                                 initargs=(frames.name, slots, chunk_frames,
+                                           SCREEN_WIDTH, SCREEN_HEIGHT)) as pool:
+            free = list(range(slots))
+            pending = {}  # Future -> slot
+            frame = 0
+            while frame < len(ticks) or pending:
+                # Si no queda slot libre se espera a que un trabajador suelte alguno
+                if not free or frame == len(ticks):
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        free.append(pending.pop(future))
+                        yield future.result()
+                    continue
+
+                slot = free.pop()
+                count = 0
+                while count < chunk_frames and frame < len(ticks):
+                    replay.advance(sim, ticks[frame])
+                    pixels = frame_pixels(game.render_frame())
+                    frames.array[slot, count] = pixels
+                    del pixels
+                    count += 1
+                    frame += 1
+                future = pool.submit(encode_chunk, slot, count, frame - count, fmt, output,
+                                     channels, png_level)
+                pending[future] = slot
+    finally:
+        frames.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta una repetición a PNG o vídeo RGB24 sin ventana")
+    parser.add_argument("path")
+    parser.add_argument("--output", required=True, help="carpeta (png) o archivo (raw)")
+    parser.add_argument("--format", choices=FORMATS, default="png")
+    parser.add_argument("--start", type=int, default=0, help="primer tick")
+    parser.add_argument("--end", type=int, default=None, help="último tick (por defecto el final)")
+    parser.add_argument("--step", type=int, default=1, help="ticks entre frames (2 = vídeo a 30 FPS)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-frames", type=int, default=CHUNK_FRAMES)
+    parser.add_argument("--png-level", type=int, default=PNG_LEVEL, help="compresión zlib de los PNG (0-9)")
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.path)
+    end = replay.final_tick if args.end is None else min(args.end, replay.final_tick)
+    total = len(range(args.start, end + 1, args.step))
+
+    start = time.perf_counter()
+    exported = 0
+    for count in export_replay(replay, args.output, args.format, args.start, args.end, args.step,
+                               args.workers, args.chunk_frames, args.png_level):
+        exported += count
+        print(f"\r{exported}/{total} frames", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    # Segundos de partida exportados por segundo de reloj
+    speed = exported * args.step / TICK_RATE / elapsed if elapsed else 0.0
+    print(f"{exported} frames en {elapsed:.1f}s  {exported / elapsed:.0f} frames/s  "
+          f"{speed:.1f}x tiempo real")
+    if args.format == "raw":
+        fps = TICK_RATE / args.step
+        print(f"ffmpeg -f rawvideo -pix_fmt rgb24 -s {SCREEN_WIDTH}x{SCREEN_HEIGHT} "
+              f"-r {fps:g} -i {args.output} salida.mp4")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Paquetes de niveles: una fuente de texto y su forma compilada, mapeada en memoria.
+
+En la fuente cada nivel empieza con "level NOMBRE", seguido opcionalmente de
+"ghosts x,y x,y ..." (celdas de salida de los fantasmas) y "start x,y" (de
+Pacman), y después las filas del laberinto en el formato de pacman.MAZE. Las
+líneas que empiezan con ";" son comentarios.
+
+El paquete compilado guarda cada nivel ya listo para MazeGrid: celdas, tabla
+de salidas, plantillas de puntos, celdas libres, salidas, columnas del túnel,
+índice de celdas transitables y, si el laberinto es pequeño, la tabla de
+distancias entre todos los pares. Al abrirlo se mapea en memoria y un nivel
+solo lee sus propias páginas al usarlo, sin volver a analizar ni recorrer nada.
+
+    python levels.py compile levels.txt levels.pml
+    python levels.py info levels.pml
+    python pacman.py --levels levels.pml --level 2
+"""
+import argparse
+import mmap
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from pacman import MazeGrid, MazeDistances, GHOST_START_CELLS
+
+FILE_MAGIC = b"PMLEVELS"
+FILE_VERSION = 1
+PACK_HEADER = struct.Struct("<8sBI")  # firma, versión, nº de niveles
+INDEX_ENTRY = struct.Struct("<32sQ")  # nombre, posición de la cabecera del nivel
+# ancho, alto, salida de Pacman, columnas del túnel (izquierda, derecha),
+# nº de fantasmas, nº de power pellets
+LEVEL_HEADER = struct.Struct("<IIiiiiII")
+CELL = struct.Struct("<ii")
+SECTION = struct.Struct("<QQ")  # posición y tamaño en bytes
+
+# Tablas de cada nivel, en este orden, con el tipo de sus elementos ('B' = bytes)
+SECTIONS = (("cells", "B"), ("exits", "B"), ("dot_bits", "B"), ("power_pellet_bits", "B"),
+            ("free_cells", "I"), ("walk_index", "i"), ("walk_cells", "i"), ("distances", "H"))
+ALIGNMENT = 8
+
+LevelSource = namedtuple("LevelSource", ["name", "rows", "ghost_start_cells", "start_cell"])
+
+
+def parse_cell(text):
+    x, y = text.split(",")
+    return (int(x), int(y))
+
+
+def parse_source(text):
+    """Niveles (LevelSource) de una fuente de texto"""
+    levels = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.startswith(";"):
+            continue
+        if line.startswith("level "):
+            levels.append(LevelSource(line[6:].strip(), [], GHOST_START_CELLS, None))
+        elif not levels:
+            raise ValueError(f"línea {number}: falta 'level NOMBRE' antes del laberinto")
+        elif line.startswith("ghosts "):
+            levels[-1] = levels[-1]._replace(ghost_start_cells=tuple(parse_cell(cell) for cell in line.split()[1:]))
+        elif line.startswith("start "):
+            levels[-1] = levels[-1]._replace(start_cell=parse_cell(line.split()[1]))
+        else:
+            levels[-1].rows.append(line)
+    for level in levels:
+        if not level.rows:
+            raise ValueError(f"el nivel {level.name!r} no tiene laberinto")
+    return levels
+
+
+def compile_level(source):
+    """MazeGrid y MazeDistances de un nivel de la fuente"""
+    grid = MazeGrid(source.rows, source.ghost_start_cells, source.start_cell)
+    return grid, MazeDistances(grid)
+
+
+def little_endian(values):
+    # Las tablas se guardan en little-endian sea cual sea la máquina
+    if sys.byteorder != "little" and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return bytes(values)
+
+
+def level_bytes(grid, distances, offset):
+    """Cabecera y tablas de un nivel que empieza en la posición offset del archivo"""
+    ghosts = grid.ghost_start_cells
+    tables = [bytes(grid.cells), bytes(grid.exits), bytes(grid.dot_bits), bytes(grid.power_pellet_bits),
+              little_endian(array('I', grid.free_cells)), little_endian(array('i', distances.walk_index)),
+              little_endian(array('i', distances.cells)),
+              little_endian(distances.table) if distances.table is not None else b""]
+    header = LEVEL_HEADER.pack(grid.width, grid.height, *grid.start_cell, *grid.tunnel_columns,
+                               len(ghosts), len(grid.power_pellet_indices))
+    header += b"".join(CELL.pack(*cell) for cell in ghosts)
+    header += little_endian(array('I', grid.power_pellet_indices))
+
+    # Las tablas empiezan alineadas para poder verlas como arrays sin copiar
+    position = offset + len(header) + SECTION.size * len(SECTIONS)
+    sections = []
+    body = bytearray()
+    for table in tables:
+        padding = -position % ALIGNMENT
+        body += bytes(padding)
+        position += padding
+        sections.append(SECTION.pack(position, len(table)))
+        body += table
+        position += len(table)
+    return header + b"".join(sections) + body
+
+
+def pack_bytes(levels):
+    """Paquete compilado de una lista de (nombre, MazeGrid, MazeDistances)"""
+    out = bytearray(PACK_HEADER.pack(FILE_MAGIC, FILE_VERSION, len(levels)))
+    index_position = len(out)
+    out += bytes(INDEX_ENTRY.size * len(levels))
+    for number, (name, grid, distances) in enumerate(levels):
+        out += bytes(-len(out) % ALIGNMENT)
+        encoded = name.encode("utf-8")
+        if len(encoded) > INDEX_ENTRY.size - 8:
+            raise ValueError(f"nombre de nivel demasiado largo: {name!r}")
+        INDEX_ENTRY.pack_into(out, index_position + number * INDEX_ENTRY.size, encoded, len(out))
+        out += level_bytes(grid, distances, len(out))
+    return bytes(out)
+
+
+def compile_source(text):
+    return pack_bytes([(level.name, *compile_level(level)) for level in parse_source(text)])
+
+
+class LevelPack:
+    """Niveles de un paquete compilado, leídos sin copiar de un buffer (normalmente un mmap).
+
+    grid(nivel) crea el MazeGrid la primera vez que se pide y lo guarda; sus
+    tablas son vistas de solo lectura del buffer.
+    """
+    def __init__(self, data):
+        self.data = memoryview(data)
+        magic, version, count = PACK_HEADER.unpack_from(self.data)
+        if magic != FILE_MAGIC:
+            raise ValueError("no es un paquete de niveles")
+        if version != FILE_VERSION:
+            raise ValueError(f"versión de paquete de niveles no soportada: {version}")
+        self.names = []
+        self.offsets = []
+        for number in range(count):
+            name, offset = INDEX_ENTRY.unpack_from(self.data, PACK_HEADER.size + number * INDEX_ENTRY.size)
+            self.names.append(name.rstrip(b"\0").decode("utf-8"))
+            self.offsets.append(offset)
+        self.grids = {}
+
+    @classmethod
+    def open(cls, path):
+        """Paquete compilado mapeado en memoria; una fuente de texto se compila al vuelo"""
+        with open(path, "rb") as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                f.seek(0)
+                return cls(compile_source(f.read().decode("utf-8")))
+            # El mapa sigue abierto después de cerrar el archivo
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, level):
+        """Número de un nivel dado por número o por nombre"""
+        if isinstance(level, str):
+            if level in self.names:
+                return self.names.index(level)
+            if not level.isdigit():
+                raise KeyError(f"no hay ningún nivel {level!r}")
+            level = int(level)
+        if not 0 <= level < len(self.names):
+            raise IndexError(f"el paquete tiene {len(self.names)} niveles")
+        return level
+
+    def table(self, position, size, typecode):
+        view = self.data[position:position + size]
+        if typecode == "B":
+            return view
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        values = array(typecode, view)
+        values.byteswap()
+        return values
+
+    def grid(self, level=0):
+        index = self.index(level)
+        grid = self.grids.get(index)
+        if grid is not None:
+            return grid
+
+        offset = self.offsets[index]
+        (width, height, start_x, start_y, tunnel_left, tunnel_right,
+         ghost_count, power_pellet_count) = LEVEL_HEADER.unpack_from(self.data, offset)
+        offset += LEVEL_HEADER.size
+        ghosts = [CELL.unpack_from(self.data, offset + number * CELL.size) for number in range(ghost_count)]
+        offset += CELL.size * ghost_count
+        power_pellet_indices = self.table(offset, 4 * power_pellet_count, "I")
+        offset += 4 * power_pellet_count
+
+        tables = {}
+        for number, (name, typecode) in enumerate(SECTIONS):
+            position, size = SECTION.unpack_from(self.data, offset + number * SECTION.size)
+            tables[name] = self.table(position, size, typecode) if size else None
+
+        grid = MazeGrid.from_tables(
+            width, height, tables["cells"], tables["exits"], tables["dot_bits"],
+            tables["power_pellet_bits"], power_pellet_indices, tables["free_cells"],
+            (start_x, start_y), ghosts, (tunnel_left, tunnel_right),
+            (tables["distances"], tables["walk_index"], tables["walk_cells"]))
+        self.grids[index] = grid
+        return grid
+
+
+def check_pack(pack, text):
+    """Compara cada nivel del paquete con la fuente compilada de nuevo; devuelve las diferencias"""
+    problems = []
+    sources = parse_source(text)
+    if [level.name for level in sources] != pack.names:
+        return ["los niveles del paquete no son los de la fuente"]
+    for number, source in enumerate(sources):
+        expected, expected_distances = compile_level(source)
+        grid = pack.grid(number)
+        distances = grid.distances()
+        for name in ("width", "height", "start_cell", "ghost_start_cells", "tunnel_left_x",
+                     "tunnel_right_x", "power_pellet_indices", "dot_count", "power_pellet_count"):
+            if getattr(grid, name) != getattr(expected, name):
+                problems.append(f"{source.name}: {name} no coincide")
+        for name in ("cells", "exits", "dot_bits", "power_pellet_bits", "free_cells"):
+            if bytes(getattr(grid, name)) != bytes(getattr(expected, name)):
+                problems.append(f"{source.name}: {name} no coincide")
+        if (list(distances.walk_index) != list(expected_distances.walk_index) or
+                (distances.table is None) != (expected_distances.table is None) or
+                distances.table is not None and bytes(distances.table) != bytes(expected_distances.table)):
+            problems.append(f"{source.name}: las distancias no coinciden")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila y revisa paquetes de niveles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_command = commands.add_parser("compile", help="compila una fuente de texto")
+    compile_command.add_argument("source")
+    compile_command.add_argument("output")
+    info_command = commands.add_parser("info", help="lista los niveles de un paquete")
+    info_command.add_argument("path")
+    check_command = commands.add_parser("check", help="comprueba un paquete contra su fuente")
+    check_command.add_argument("path")
+    check_command.add_argument("source")
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        with open(args.source, encoding="utf-8") as f:
+            data = compile_source(f.read())
+        with open(args.output, "wb") as f:
+            f.write(data)
+        print(f"{args.output}: {len(LevelPack(data))} niveles, {len(data)} bytes")
+        return 0
+
+    start = time.perf_counter()
+    pack = LevelPack.open(args.path)
+    opened = time.perf_counter() - start
+    if args.command == "check":
+        with open(args.source, encoding="utf-8") as f:
+            problems = check_pack(pack, f.read())
+        for problem in problems:
+            print(problem)
+        print("OK" if not problems else "NO COINCIDE")
+        return 1 if problems else 0
+
+    print(f"{len(pack)} niveles (abierto en {opened * 1000:.2f} ms)")
+    for number, name in enumerate(pack.names):
+        start = time.perf_counter()
+        grid = pack.grid(number)
+        distances = grid.distances()
+        elapsed = time.perf_counter() - start
+        print(f"{number:3} {name:20} {grid.width}x{grid.height}  puntos {grid.dot_count}  "
+              f"power pellets {grid.power_pellet_count}  "
+              f"distancias {'tabla' if distances.table is not None else 'por objetivo'}  "
+              f"({elapsed * 1000:.2f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
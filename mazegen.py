@@ -0,0 +1,84 @@
+"""Laberintos generados a partir de una semilla, para pruebas de carga.
+
+Mismo formato que pacman.MAZE (una cadena por fila), con pasillos de una
+celda, sin callejones sin salida, una casa de fantasmas en el centro y cuatro
+power pellets:
+
+    from mazegen import generate_grid
+    from pacman import Simulation
+
+    sim = Simulation(seed=1, grid=generate_grid(1000, 1000, seed=7))
+
+    python pacman.py --maze 300x200 --maze-seed 7
+"""
+import random
+
+from pacman import MazeGrid
+
+MIN_SIZE = 15  # La casa de fantasmas y el borde tienen que caber
+HOUSE_WIDTH = 7
+HOUSE_HEIGHT = 3
+
+
+def generate_maze(width, height, seed=None):
+    """Laberinto de width x height celdas como lista de cadenas (misma semilla, mismo laberinto)"""
+    if width < MIN_SIZE or height < MIN_SIZE:
+        raise ValueError(f"el laberinto debe medir al menos {MIN_SIZE}x{MIN_SIZE}")
+    rng = random.Random(seed)
+    rows = [bytearray(b"#" * width) for _ in range(height)]
+
+    # Los pasillos pasan por las celdas de coordenadas impares; con un ancho
+    # o alto par la última columna o fila queda como pared
+    last_x = width - 2 if width % 2 else width - 3
+    last_y = height - 2 if height % 2 else height - 3
+
+    # Árbol de expansión con búsqueda en profundidad (iterativa, sin límite de recursión)
+    rows[1][1] = ord(".")
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack[-1]
+        options = [(x + dx, y + dy) for dx, dy in ((2, 0), (0, 2), (-2, 0), (0, -2))
+                   if 1 <= x + dx <= last_x and 1 <= y + dy <= last_y
+                   and rows[y + dy][x + dx] == ord("#")]
+        if not options:
+            stack.pop()
+            continue
+        next_x, next_y = rng.choice(options)
+        rows[(y + next_y) // 2][(x + next_x) // 2] = ord(".")
+        rows[next_y][next_x] = ord(".")
+        stack.append((next_x, next_y))
+
+    # Sin callejones sin salida: cada uno se abre hacia otro pasillo vecino
+    for y in range(1, last_y + 1, 2):
+        for x in range(1, last_x + 1, 2):
+            walls = [(dx, dy) for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1))
+                     if rows[y + dy][x + dx] == ord("#")]
+            if len(walls) == 3:
+                # El borde exterior no se abre
+                dx, dy = rng.choice([(dx, dy) for dx, dy in walls
+                                     if 1 <= x + 2 * dx <= last_x and 1 <= y + 2 * dy <= last_y])
+                rows[y + dy][x + dx] = ord(".")
+
+    # Casa de fantasmas vacía en el centro; corta pasillos, así que queda conectada
+    house_x = (width // 2 - HOUSE_WIDTH // 2) | 1
+    house_y = (height // 2 - HOUSE_HEIGHT // 2) | 1
+    for y in range(house_y - 1, house_y + HOUSE_HEIGHT - 1):
+        rows[y][house_x:house_x + HOUSE_WIDTH] = b" " * HOUSE_WIDTH
+
+    # Power pellets cerca de las esquinas, lejos de la salida de Pacman
+    for x, y in ((1, 3), (last_x, 3), (1, last_y - 2), (last_x, last_y - 2)):
+        rows[y][x] = ord("o")
+
+    return [row.decode() for row in rows]
+
+
+def ghost_start_cells(width, height):
+    """Celdas de salida de los cuatro fantasmas: la fila central de la casa"""
+    house_x = (width // 2 - HOUSE_WIDTH // 2) | 1
+    house_y = (height // 2 - HOUSE_HEIGHT // 2) | 1
+    return tuple((house_x + 2 + index, house_y) for index in range(4))
+
+
+def generate_grid(width, height, seed=None):
+    """MazeGrid compilado de generate_maze, con los fantasmas en su casa"""
+    return MazeGrid(generate_maze(width, height, seed), ghost_start_cells(width, height))
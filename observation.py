@@ -0,0 +1,227 @@
+"""Observaciones del tablero para agentes de aprendizaje (requiere NumPy).
+
+Una observación es un array (canales, alto, ancho) de uint8 con un 1 en cada
+celda ocupada: paredes, puntos, power pellets, Pacman, un canal por fantasma y
+los fantasmas asustados. Se reserva una vez y update(sim) solo toca las celdas
+que cambiaron desde la llamada anterior (puntos comidos, entidades que se
+movieron); lo que devuelve es siempre el mismo array, sin copias.
+
+Con SharedObservations las observaciones viven en un bloque de
+multiprocessing.shared_memory: cada proceso trabajador escribe en su hueco y
+el proceso que aprende las lee sin serializar nada.
+
+    python observation.py --workers 4 --ticks 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from multiprocessing import Process, shared_memory
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import Simulation, MAZE_GRID, GHOSTS, WALL
+
+# Canales, en este orden; los fantasmas van a partir de FIRST_GHOST_CHANNEL en
+# el orden de sim.ghosts y el canal de asustados es el último
+CHANNEL_WALLS = 0
+CHANNEL_DOTS = 1
+CHANNEL_POWER_PELLETS = 2
+CHANNEL_PACMAN = 3
+FIRST_GHOST_CHANNEL = 4
+
+
+def observation_shape(grid=MAZE_GRID, ghosts=len(GHOSTS)):
+    return (FIRST_GHOST_CHANNEL + ghosts + 1, grid.height, grid.width)
+
+
+def unpack_bitset(bits, size):
+    # Bit i del byte i // 8, como PelletStore
+    return np.unpackbits(np.frombuffer(bits, dtype=np.uint8), bitorder="little")[:size]
+
+
+class Observation:
+    """Tablero de una partida en un array preasignado que se actualiza por cambios.
+
+    buffer y offset permiten colocarlo en memoria ajena (por ejemplo un bloque
+    compartido); sin buffer se reserva un array propio.
+    """
+    def __init__(self, grid=MAZE_GRID, ghosts=len(GHOSTS), buffer=None, offset=0):
+        self.grid = grid
+        self.shape = observation_shape(grid, ghosts)
+        if buffer is None:
+            self.array = np.zeros(self.shape, dtype=np.uint8)
+        else:
+            self.array = np.ndarray(self.shape, dtype=np.uint8, buffer=buffer, offset=offset)
+        self.frightened_channel = FIRST_GHOST_CHANNEL + ghosts
+
+        # Vistas planas (sin copia): los puntos por índice de celda y el array
+        # entero por canal * alto * ancho + índice de celda
+        self.flat = self.array.reshape(-1)
+        self.channel_size = grid.width * grid.height
+        self.dots = self.array[CHANNEL_DOTS].reshape(-1)
+        self.power_pellets = self.array[CHANNEL_POWER_PELLETS].reshape(-1)
+
+        self.pellets = None
+        self.pellet_generation = 0
+        self.pellets_eaten = 0
+        self.marked = []  # Posiciones en flat de las entidades marcadas en la última actualización
+
+        self.array[:] = 0
+        cells = np.frombuffer(bytes(grid.cells), dtype=np.uint8).reshape(grid.height, grid.width)
+        self.array[CHANNEL_WALLS] = cells >= WALL
+
+    def load_pellets(self, pellets):
+        # Partida nueva o estado restaurado: los canales de puntos se rellenan enteros
+        size = self.grid.width * self.grid.height
+        self.dots[:] = unpack_bitset(pellets.dots, size)
+        self.power_pellets[:] = unpack_bitset(pellets.power_pellets, size)
+        self.pellets = pellets
+        self.pellet_generation = pellets.generation
+        self.pellets_eaten = len(pellets.eaten)
+
+    def cell_index(self, entity):
+        # Celda más cercana; en el túnel puede asomar una columna por la derecha
+        cell_x, cell_y = entity.get_nearest_cell()
+        return min(max(cell_y, 0), self.grid.height - 1) * self.grid.width + cell_x % self.grid.width
+
+    def update(self, sim):
+        """Pone la observación al día con sim y la devuelve (siempre el mismo array)"""
+        array = self.array
+        pellets = sim.pellets
+        if pellets is not self.pellets or pellets.generation != self.pellet_generation:
+            self.load_pellets(pellets)
+        elif len(pellets.eaten) > self.pellets_eaten:
+            eaten = pellets.eaten[self.pellets_eaten:]
+            self.dots[eaten] = 0
+            self.power_pellets[eaten] = 0
+            self.pellets_eaten = len(pellets.eaten)
+
+        # Borrar las marcas anteriores antes de poner las nuevas: dos fantasmas
+        # pueden compartir celda en el canal de asustados
+        channel_size = self.channel_size
+        marked = [CHANNEL_PACMAN * channel_size + self.cell_index(sim.pacman)]
+        for channel, ghost in enumerate(sim.ghosts, FIRST_GHOST_CHANNEL):
+            index = self.cell_index(ghost)
+            marked.append(channel * channel_size + index)
+            if ghost.is_frightened:
+                marked.append(self.frightened_channel * channel_size + index)
+        if marked != self.marked:
+            self.flat[self.marked] = 0
+            self.flat[marked] = 1
+            self.marked = marked
+        return array
+
+    def rebuild(self, sim):
+        """Reconstruye la observación entera (para comprobar update)"""
+        self.pellets = None
+        for channel in range(CHANNEL_PACMAN, self.shape[0]):
+            self.array[channel] = 0
+        self.marked = []
+        return self.update(sim)
+
+
+class SharedObservations:
+    """count observaciones seguidas en un bloque de multiprocessing.shared_memory.
+
+    El proceso que aprende crea el bloque y lee self.array, de forma
+    (count, canales, alto, ancho), sin copias. Cada trabajador se engancha por
+    nombre con attach() y escribe en su hueco con slot(i). Antes de close()
+    hay que soltar los arrays y observaciones que apuntan al bloque.
+    """
+    def __init__(self, count, grid=MAZE_GRID, ghosts=len(GHOSTS), name=None, create=True):
+        self.count = count
+        self.grid = grid
+        self.ghosts = ghosts
+        self.shape = (count,) + observation_shape(grid, ghosts)
+        self.slot_size = int(np.prod(self.shape[1:]))
+        self.owner = create
+        self.memory = shared_memory.SharedMemory(name=name, create=create,
+                                                 size=self.slot_size * count if create else 0)
+        self.array = np.ndarray(self.shape, dtype=np.uint8, buffer=self.memory.buf)
+
+    @classmethod
+    def attach(cls, name, count, grid=MAZE_GRID, ghosts=len(GHOSTS)):
+        """Engancha un bloque ya creado por otro proceso"""
+        return cls(count, grid, ghosts, name=name, create=False)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def slot(self, index):
+        return Observation(self.grid, self.ghosts, self.memory.buf, index * self.slot_size)
+
+    def close(self):
+        # Quien creó el bloque también lo borra
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def play_into_slot(name, count, index, seed, ticks):
+    # Proceso trabajador: juega con un bot aleatorio y deja la observación final en su hueco
+    shared = SharedObservations.attach(name, count)
+    observation = shared.slot(index)
+    sim = Simulation(seed=seed)
+    rng = random.Random(seed)
+    for _ in range(ticks):
+        sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+        observation.update(sim)
+    del observation
+    shared.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide y comprueba las observaciones")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    # Actualización por cambios frente a reconstrucción completa en cada tick
+    sim = Simulation(seed=0)
+    incremental = Observation()
+    full = Observation()
+    rng = random.Random(0)
+    update_time = rebuild_time = 0.0
+    mismatches = 0
+    for _ in range(args.ticks):
+        if sim.done:
+            sim.reset(rng.randrange(2**64))
+        sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+        start = time.perf_counter()
+        incremental.update(sim)
+        update_time += time.perf_counter() - start
+        start = time.perf_counter()
+        full.rebuild(sim)
+        rebuild_time += time.perf_counter() - start
+        mismatches += not np.array_equal(incremental.array, full.array)
+    print(f"forma {incremental.shape}  update {update_time / args.ticks * 1e6:.1f} us  "
+          f"reconstrucción {rebuild_time / args.ticks * 1e6:.1f} us  ticks distintos {mismatches}")
+
+    # Trabajadores escribiendo en memoria compartida; aquí se comparan con una partida local
+    shared = SharedObservations(args.workers)
+    workers = [Process(target=play_into_slot, args=(shared.name, args.workers, index, index, args.ticks))
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    matched = 0
+    for index in range(args.workers):
+        sim = Simulation(seed=index)
+        rng = random.Random(index)
+        for _ in range(args.ticks):
+            sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+        matched += np.array_equal(shared.array[index], Observation().update(sim))
+    shared.close()
+    print(f"memoria compartida: {matched}/{args.workers} observaciones coinciden")
+    return 0 if matched == args.workers and not mismatches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
 import pygame
 import sys
+import time
 import random
 import math
+import os
+import hashlib
+import struct
+import tempfile
+import zlib
+import threading
+from array import array
+from collections import OrderedDict, deque
 
-# Inicializar Pygame
-pygame.init()
+from profiler import FrameProfiler
+from quality import QualityGovernor, QUALITY_LEVELS
 
 # Constantes
 SCREEN_WIDTH = 800
@@ -12,6 +21,20 @@ SCREEN_HEIGHT = 600
 CELL_SIZE = 20
 MAZE_WIDTH = SCREEN_WIDTH // CELL_SIZE
 MAZE_HEIGHT = (SCREEN_HEIGHT - 100) // CELL_SIZE  # Espacio para UI
+TICK_RATE = 60  # Ticks de simulación por segundo; los timers del juego cuentan ticks
+
+# Posiciones en punto fijo: enteros en subpíxeles, SUBPIXELS por píxel
+SUBPIXELS = 10
+CELL_SUBPIXELS = CELL_SIZE * SUBPIXELS
+PACMAN_SPEED = 3 * SUBPIXELS  # Subpíxeles por tick
+GHOST_SPEED = 2 * SUBPIXELS
+GHOST_FRIGHTENED_SPEED = GHOST_SPEED * 7 // 10
+GHOST_HIT_DISTANCE_SQ = (CELL_SUBPIXELS * 8 // 10) ** 2  # Pacman muere (o come) a menos de 0.8 celdas
+FRUIT_HIT_DISTANCE_SQ = (CELL_SUBPIXELS // 2) ** 2
+MAX_TICKS_PER_FRAME = 5  # Como mucho se recuperan tantos ticks por frame
+
+# Carpeta opcional donde guardar las tablas de distancias del laberinto
+DISTANCE_CACHE_DIR = os.environ.get("PACMAN_CACHE_DIR")
 
 # Colores estilo arcade vintage
 BLACK = (0, 0, 0)
@@ -62,22 +85,754 @@ BONUS_FRUITS = [
     {"name": "melon", "color": CYAN, "points": 1000},
 ]
 
-class Pacman:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+# Tipos de celda del laberinto compilado
+EMPTY = 0
+DOT = 1
+POWER_PELLET = 2
+WALL = 3
+VOID = 4  # Relleno de filas cortas: bloquea como una pared pero no se dibuja
+CELL_CODES = {' ': EMPTY, '.': DOT, 'o': POWER_PELLET, '#': WALL}
+CELL_TABLE = bytes(CELL_CODES.get(chr(code), EMPTY) for code in range(256))  # Para bytes.translate
+CELL_CHARS = {code: char for char, code in CELL_CODES.items()}
+FREE_TABLE = bytes(int(code < WALL) for code in range(256))  # Tipo de celda -> 1 si no bloquea
+
+# Desplazamiento por dirección: 0=derecha, 1=abajo, 2=izquierda, 3=arriba
+DIRECTION_DX = (1, 0, -1, 0)
+DIRECTION_DY = (0, 1, 0, -1)
+
+# Máscara de salidas (bit d = se puede ir en dirección d) -> direcciones en orden
+DIRECTION_OPTIONS = [[d for d in range(4) if exits & (1 << d)] for exits in range(16)]
+ALL_EXITS = 15
+NO_DIRECTION = 255
+
+# Fantasmas (nombre, color) y sus celdas de salida en MAZE
+GHOSTS = (("Blinky", RED), ("Pinky", PINK), ("Inky", CYAN), ("Clyde", ORANGE))
+GHOST_START_CELLS = ((18, 10), (19, 10), (20, 10), (21, 10))
+
+# Formatos binarios del estado de una partida (Simulation.snapshot)
+GHOST_MODES = ("chase", "scatter", "frightened")
+SIM_STATE = struct.Struct("<IiiBBBiiB")        # ticks, puntos, vidas, flags, timers, hay fruta
+PACMAN_STATE = struct.Struct("<iiBbiBiiB")     # x, y, dirección, siguiente, animación, boca, objetivo, moviéndose
+GHOST_STATE = struct.Struct("<ii3BBBiiiBiiB")  # x, y, color, dirección, modo, timers, asustado, objetivo, moviéndose
+FRUIT_STATE = struct.Struct("<iiBiiB")         # x, y, tipo, timers, visible
+RNG_STATE = struct.Struct("<625IBd")           # estado del Mersenne Twister y gauss_next
+MAZE_HEADER = struct.Struct("<IIiiiiI")        # ancho, alto, salida de Pacman, columnas del túnel, nº de fantasmas
+MAZE_CELL = struct.Struct("<ii")
+
+def make_bitset(cells, kind):
+    """Bitset (bit i del byte i // 8) de las celdas de un tipo"""
+    # Un dígito '0'/'1' por celda; al revés, la celda 0 queda en el bit menos significativo
+    digits = bytes(cells).translate(bytes(ord("1") if code == kind else ord("0") for code in range(256)))
+    return int(digits[::-1] or b"0", 2).to_bytes((len(cells) + 7) // 8, "little")
+
+def count_bits(bits):
+    return bin(int.from_bytes(bits, "little")).count("1")
+
+class MazeGrid:
+    """Laberinto compilado una sola vez: rectangular, en un bytearray y con tablas de salidas"""
+    def __init__(self, maze, ghost_start_cells=GHOST_START_CELLS, start_cell=None, tunnel_columns=None):
+        self.width = len(maze[0])
+        self.height = len(maze)
+        self.pixel_width = self.width * CELL_SIZE
+
+        # Celdas en orden fila a fila; las filas cortas se rellenan con VOID
+        self.cells = bytearray()
+        for row in maze:
+            row = row[:self.width].encode("latin-1", "replace").translate(CELL_TABLE)
+            self.cells += row + bytes([VOID]) * (self.width - len(row))
+
+        # Salidas de cada celda, con un borde de una celda alrededor del laberinto.
+        # Fuera del ancho es túnel y fuera del alto no hay pared, así que más
+        # allá del borde todas las direcciones están libres (ALL_EXITS)
+        self.stride = self.width + 2
+        self.exits = bytearray()
+        # Filas de 0/1 (1 = libre) con dos celdas libres de margen. Cada fila de
+        # salidas se calcula entera sumando las filas vecinas como enteros grandes:
+        # cada byte queda en 0..15, así que no hay acarreo entre celdas
+        margin = bytes([1, 1])
+        free_rows = [bytes([1]) * (self.width + 4)] * 2
+        free_rows += [margin + self.cells[y * self.width:(y + 1) * self.width].translate(FREE_TABLE) + margin
+                      for y in range(self.height)]
+        free_rows += free_rows[:2]
+        for y in range(1, self.height + 3):
+            right = int.from_bytes(free_rows[y][2:], "little")
+            down = int.from_bytes(free_rows[y + 1][1:-1], "little")
+            left = int.from_bytes(free_rows[y][:-2], "little")
+            up = int.from_bytes(free_rows[y - 1][1:-1], "little")
+            self.exits += (right + (down << 1) + (left << 2) + (up << 3)).to_bytes(self.stride, "little")
+
+        # Plantillas de puntos y power pellets (un bit por celda) para copiar
+        # al empezar cada partida
+        self.dot_bits = make_bitset(self.cells, DOT)
+        self.power_pellet_bits = make_bitset(self.cells, POWER_PELLET)
+        self.power_pellet_indices = tuple(index for index, cell in enumerate(self.cells)
+                                          if cell == POWER_PELLET)
+        self.dot_count = self.cells.count(DOT)
+        self.power_pellet_count = len(self.power_pellet_indices)
+        
+        # Túnel horizontal: al salir por la izquierda se aparece en la última columna
+        left, right = tunnel_columns or (self.width - 1, 0)
+        self.tunnel_left_x = left * CELL_SIZE
+        self.tunnel_right_x = right * CELL_SIZE
+        self.sub_width = self.pixel_width * SUBPIXELS
+        
+        # Índice de celdas libres (sin pared ni power pellet) en orden, para
+        # elegir una al azar en O(1) al sacar una fruta
+        self.free_cells = array('I', (index for index, cell in enumerate(self.cells)
+                                      if cell == EMPTY or cell == DOT))
+        
+        # Celda de salida de Pacman: si no se indica, la primera libre leyendo fila a fila
+        if start_cell is not None:
+            self.start_cell = tuple(start_cell)
+        elif self.free_cells:
+            self.start_cell = (self.free_cells[0] % self.width, self.free_cells[0] // self.width)
+        else:
+            self.start_cell = (1, 1)
+        self.ghost_start_cells = tuple(ghost_start_cells)
+        
+        self.path_data = None  # (tabla, índices, celdas) ya calculados para MazeDistances
+        self._distances = None
+
+    @classmethod
+    def from_tables(cls, width, height, cells, exits, dot_bits, power_pellet_bits, power_pellet_indices,
+                    free_cells, start_cell, ghost_start_cells, tunnel_columns=None, path_data=None):
+        """Laberinto ya compilado (levels.LevelPack), sin volver a recorrer las celdas.
+        
+        Las tablas pueden ser vistas de solo lectura de un archivo mapeado en memoria.
+        """
+        grid = cls.__new__(cls)
+        grid.width = width
+        grid.height = height
+        grid.pixel_width = width * CELL_SIZE
+        grid.stride = width + 2
+        grid.cells = cells
+        grid.exits = exits
+        grid.dot_bits = dot_bits
+        grid.power_pellet_bits = power_pellet_bits
+        grid.power_pellet_indices = tuple(power_pellet_indices)
+        grid.dot_count = count_bits(dot_bits)
+        grid.power_pellet_count = len(grid.power_pellet_indices)
+        left, right = tunnel_columns or (width - 1, 0)
+        grid.tunnel_left_x = left * CELL_SIZE
+        grid.tunnel_right_x = right * CELL_SIZE
+        grid.sub_width = grid.pixel_width * SUBPIXELS
+        grid.free_cells = free_cells
+        grid.start_cell = tuple(start_cell)
+        grid.ghost_start_cells = tuple(ghost_start_cells)
+        grid.path_data = path_data
+        grid._distances = None
+        return grid
+
+    @property
+    def tunnel_columns(self):
+        """Columnas a las que lleva el túnel al salir por la izquierda y por la derecha"""
+        return (self.tunnel_left_x // CELL_SIZE, self.tunnel_right_x // CELL_SIZE)
+
+    def cell(self, cell_x, cell_y):
+        return self.cells[cell_y * self.width + cell_x]
+
+    def is_blocked(self, cell_x, cell_y):
+        return (0 <= cell_x < self.width and 0 <= cell_y < self.height and
+                self.cells[cell_y * self.width + cell_x] >= WALL)
+
+    def exits_at(self, cell_x, cell_y):
+        if -1 <= cell_x <= self.width and -1 <= cell_y <= self.height:
+            return self.exits[(cell_y + 1) * self.stride + cell_x + 1]
+        return ALL_EXITS
+
+    def can_move(self, cell_x, cell_y, direction):
+        return self.exits_at(cell_x, cell_y) >> direction & 1
+
+    def wrap_x(self, x):
+        """Aplica el túnel horizontal a una posición en píxeles"""
+        if x < 0:
+            return self.tunnel_left_x
+        if x >= self.pixel_width:
+            return self.tunnel_right_x
+        return x
+    
+    def wrap_sub_x(self, sub_x):
+        """wrap_x para posiciones en subpíxeles"""
+        if sub_x < 0:
+            return self.tunnel_left_x * SUBPIXELS
+        if sub_x >= self.sub_width:
+            return self.tunnel_right_x * SUBPIXELS
+        return sub_x
+    
+    def to_bytes(self):
+        """Laberinto completo (celdas en zlib, salidas y túnel) para rehacerlo con from_bytes"""
+        data = MAZE_HEADER.pack(self.width, self.height, *self.start_cell, *self.tunnel_columns,
+                                len(self.ghost_start_cells))
+        data += b"".join(MAZE_CELL.pack(*cell) for cell in self.ghost_start_cells)
+        return data + zlib.compress(bytes(self.cells))
+    
+    @classmethod
+    def from_bytes(cls, data):
+        (width, height, start_x, start_y, tunnel_left, tunnel_right,
+         ghost_count) = MAZE_HEADER.unpack_from(data)
+        offset = MAZE_HEADER.size
+        ghost_cells = [MAZE_CELL.unpack_from(data, offset + index * MAZE_CELL.size)
+                       for index in range(ghost_count)]
+        offset += ghost_count * MAZE_CELL.size
+        cells = zlib.decompress(data[offset:])
+        if len(cells) != width * height:
+            raise ValueError("las celdas del laberinto no coinciden con sus dimensiones")
+        # Las filas cortas se rellenaron con VOID al compilar: basta con recortarlas
+        rows = ["".join(CELL_CHARS[code] for code in cells[y * width:(y + 1) * width].rstrip(bytes([VOID])))
+                for y in range(height)]
+        return cls(rows, ghost_cells, (start_x, start_y), (tunnel_left, tunnel_right))
+    
+    def same_maze(self, other):
+        """Mismas celdas, salidas y túnel (aunque sean objetos distintos)"""
+        return (self.maze_hash() == other.maze_hash() and self.start_cell == other.start_cell and
+                self.ghost_start_cells == other.ghost_start_cells and
+                self.tunnel_columns == other.tunnel_columns)
+    
+    def maze_hash(self):
+        return hashlib.sha1(b"%d,%d:" % (self.width, self.height) + bytes(self.cells)).hexdigest()
+    
+    def distances(self):
+        # Se calculan la primera vez que se piden y se comparten entre partidas
+        if self._distances is None:
+            if self.path_data is not None:
+                self._distances = MazeDistances(self, *self.path_data)
+            else:
+                self._distances = MazeDistances.load_or_build(self, DISTANCE_CACHE_DIR)
+        return self._distances
+
+class LocalField(dict):
+    """Campo de distancias limitado (índice compacto -> distancia); lo no visitado es inalcanzable"""
+    __slots__ = ()
+    
+    def __missing__(self, walk):
+        return 0xFFFFFFFF
+
+class MazeDistances:
+    """Distancias reales por el laberinto (BFS) entre celdas transitables.
+    
+    Con pocas celdas se guarda la tabla completa de todos los pares; en
+    laberintos grandes se calcula un campo de distancias por celda objetivo
+    cuando se pide y se guardan los últimos usados. En laberintos enormes el
+    campo solo cubre las celdas más cercanas al objetivo, para que cada
+    decisión cueste lo mismo sea cual sea el tamaño; desde más lejos los
+    fantasmas van en línea recta.
+    """
+    ALL_PAIRS_LIMIT = 2048  # Celdas transitables; la tabla ocupa 2 bytes por par
+    LOCAL_FIELD_LIMIT = 8192  # A partir de aquí los campos son locales
+    LOCAL_FIELD_CELLS = 1024  # Celdas que cubre un campo local
+    FIELD_CACHE_SIZE = 64
+    FILE_MAGIC = b"PMDIST1"
+    
+    def __init__(self, grid, table=None, walk_index=None, walk_cells=None):
+        self.width = grid.width
+        self.height = grid.height
+        
+        # Índice compacto de cada celda transitable (-1 para paredes y relleno)
+        # y su inversa; un paquete de niveles ya los trae calculados
+        if walk_index is not None:
+            self.walk_index = walk_index
+            self.cells = walk_cells
+        else:
+            self.walk_index = array('i', [-1]) * len(grid.cells)
+            self.cells = array('i')
+            for index, cell in enumerate(grid.cells):
+                if cell < WALL:
+                    self.walk_index[index] = len(self.cells)
+                    self.cells.append(index)
+        self.count = len(self.cells)
+        
+        # Para cada celda del grid (también paredes, los fantasmas pueden estar
+        # dentro), la celda transitable a la que lleva cada dirección o -1.
+        # Con campos locales no se guarda y se calcula al pedirla
+        self.local = self.count > self.LOCAL_FIELD_LIMIT
+        self.neighbors = None
+        if not self.local:
+            self.neighbors = [self.cell_neighbors(x, y)
+                              for y in range(self.height) for x in range(self.width)]
+        
+        self.table = table
+        if self.table is None and self.count <= self.ALL_PAIRS_LIMIT:
+            self.table = array('H')
+            for source in range(self.count):
+                self.table.extend(self.bfs(source, 'H'))
+        self.unreachable = 0xFFFF if self.table is not None else 0xFFFFFFFF
+        if self.table is not None:
+            table = memoryview(self.table)
+            self.rows = [table[row * self.count:(row + 1) * self.count] for row in range(self.count)]
+        self.targets = OrderedDict()
+        self.last_target = None
+        self.last_data = None
+    
+    def cell_neighbors(self, x, y):
+        # El túnel horizontal une la primera y la última columna
+        cell_neighbors = []
+        for direction in range(4):
+            next_x = (x + DIRECTION_DX[direction]) % self.width
+            next_y = y + DIRECTION_DY[direction]
+            if 0 <= next_y < self.height:
+                cell_neighbors.append(self.walk_index[next_y * self.width + next_x])
+            else:
+                cell_neighbors.append(-1)
+        return tuple(cell_neighbors)
+    
+    def local_field(self, source):
+        # BFS que se detiene al cubrir LOCAL_FIELD_CELLS celdas; las distancias
+        # que llega a asignar son exactas
+        field = LocalField({source: 0})
+        queue = deque([source])
+        width = self.width
+        size = len(self.walk_index)
+        walk_index = self.walk_index
+        cells = self.cells
+        while queue and len(field) < self.LOCAL_FIELD_CELLS:
+            current = queue.popleft()
+            index = cells[current]
+            x = index % width
+            next_distance = field[current] + 1
+            # Mismos vecinos que cell_neighbors, con el túnel en los extremos de la fila
+            for next_index in (index + 1 if x + 1 < width else index - x,
+                               index + width,
+                               index - 1 if x else index + width - 1,
+                               index - width):
+                if 0 <= next_index < size:
+                    neighbor = walk_index[next_index]
+                    if neighbor >= 0 and neighbor not in field:
+                        field[neighbor] = next_distance
+                        queue.append(neighbor)
+        return field
+    
+    def bfs(self, source, typecode):
+        unreachable = 0xFFFF if typecode == 'H' else 0xFFFFFFFF
+        distances = array(typecode, [unreachable]) * self.count
+        # Vecinos entre celdas transitables, indexados por índice compacto
+        walk_neighbors = self.walk_neighbors()
+        distances[source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            next_distance = distances[current] + 1
+            for neighbor in walk_neighbors[current]:
+                if distances[neighbor] == unreachable:
+                    distances[neighbor] = next_distance
+                    queue.append(neighbor)
+        return distances
+    
+    def walk_neighbors(self):
+        if not hasattr(self, "_walk_neighbors"):
+            self._walk_neighbors = [()] * self.count
+            for index, walk in enumerate(self.walk_index):
+                if walk >= 0:
+                    self._walk_neighbors[walk] = tuple(n for n in self.neighbors[index] if n >= 0)
+        return self._walk_neighbors
+    
+    def walk_index_at(self, cell_x, cell_y):
+        if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+            return self.walk_index[cell_y * self.width + cell_x]
+        return -1
+    
+    def field_to(self, cell_x, cell_y):
+        """Distancias de cada celda transitable hasta (cell_x, cell_y), o None si no es transitable"""
+        target = self.walk_index_at(cell_x, cell_y)
+        if target < 0:
+            return None
+        return self.target_data(target)[0]
+    
+    def target_data(self, target):
+        # (campo de distancias, mejor dirección desde cada celda) hacia un objetivo
+        if target == self.last_target:
+            return self.last_data
+        
+        data = self.targets.get(target)
+        if data is None:
+            if self.table is not None:
+                # La tabla es simétrica: la fila del objetivo sirve como campo
+                field = self.rows[target]
+            elif self.local:
+                field = self.local_field(target)
+            else:
+                field = self.bfs(target, 'I')
+            # Un campo local no tiene tabla de direcciones: se miran los vecinos en cada consulta
+            data = (field, None if self.local else self.directions_from_field(field))
+            self.targets[target] = data
+            if self.table is None and len(self.targets) > self.FIELD_CACHE_SIZE:
+                self.targets.popitem(last=False)
+        elif self.table is None:
+            self.targets.move_to_end(target)
+        
+        # Todos los fantasmas suelen pedir el mismo objetivo en el mismo tick
+        self.last_target = target
+        self.last_data = data
+        return data
+    
+    def directions_from_field(self, field):
+        # Para cada celda transitable, la primera dirección de menor distancia (o NO_DIRECTION)
+        directions = bytearray([NO_DIRECTION]) * self.count
+        for walk, index in enumerate(self.cells):
+            min_distance = self.unreachable
+            for direction, neighbor in enumerate(self.neighbors[index]):
+                if neighbor >= 0 and field[neighbor] < min_distance:
+                    min_distance = field[neighbor]
+                    directions[walk] = direction
+        return directions
+    
+    def best_direction(self, cell_x, cell_y, target_x, target_y):
+        """Dirección desde la celda que más acerca al objetivo por el laberinto, o None si no hay camino"""
+        width = self.width
+        if not (0 <= target_x < width and 0 <= target_y < self.height):
+            return None
+        target = self.walk_index[target_y * width + target_x]
+        if target < 0:
+            return None
+        if target == self.last_target:
+            field, directions = self.last_data
+        else:
+            field, directions = self.target_data(target)
+        
+        if directions is not None and 0 <= cell_x < width and 0 <= cell_y < self.height:
+            walk = self.walk_index[cell_y * width + cell_x]
+            if walk >= 0:
+                direction = directions[walk]
+                return None if direction == NO_DIRECTION else direction
+        
+        # Dentro de una pared (los fantasmas pueden estarlo) o con campo local: mirar las celdas vecinas
+        neighbors = self.neighbors_of(cell_x, cell_y)
+        if neighbors is None:
+            return None
+        best_direction = None
+        min_distance = self.unreachable
+        for direction, neighbor in enumerate(neighbors):
+            if neighbor >= 0 and field[neighbor] < min_distance:
+                min_distance = field[neighbor]
+                best_direction = direction
+        return best_direction
+    
+    def neighbors_of(self, cell_x, cell_y):
+        if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+            if self.neighbors is None:
+                return self.cell_neighbors(cell_x, cell_y)
+            return self.neighbors[cell_y * self.width + cell_x]
+        return None
+    
+    @classmethod
+    def load_or_build(cls, grid, cache_dir=None):
+        """Usa la tabla guardada en cache_dir para este laberinto si existe; si no, la calcula y la guarda"""
+        if cache_dir is None:
+            return cls(grid)
+        
+        path = os.path.join(cache_dir, "distances-%s.bin" % grid.maze_hash())
+        header = cls.FILE_MAGIC + sys.byteorder[0].encode()
+        walkable = bytes(grid.cells).translate(FREE_TABLE).count(1)
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(header)) == header:
+                    table = array('H')
+                    table.frombytes(f.read())
+                    # Un archivo cortado o de otro tamaño se trata como si no estuviera
+                    if len(table) == walkable * walkable:
+                        return cls(grid, table)
+        except (OSError, ValueError):
+            pass
+        
+        distances = cls(grid)
+        if distances.table is not None:
+            # Se escribe aparte y se sustituye de golpe: otro proceso que lo
+            # lea a la vez ve el archivo entero o ninguno
+            temp_path = None
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix="distances-", suffix=".tmp", dir=cache_dir)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(header)
+                    distances.table.tofile(f)
+                os.replace(temp_path, path)
+            except OSError:
+                if temp_path is not None and os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return distances
+
+MAZE_GRID = MazeGrid(MAZE)
+
+def grid_from_bytes(data):
+    """MazeGrid.from_bytes, pero el laberinto clásico es MAZE_GRID (con sus distancias ya calculadas)"""
+    grid = MazeGrid.from_bytes(data)
+    return MAZE_GRID if grid.same_maze(MAZE_GRID) else grid
+
+class SpriteCache:
+    """Sprites pre-rasterizados una sola vez por estado; dibujar una entidad es un blit.
+    
+    Los opacos usan el negro como colorkey en vez de alfa por píxel: se
+    copian más rápido, pero la forma no puede llevar negro. Se vacía solo si
+    CELL_SIZE cambia.
+    """
+    def __init__(self):
+        self.cell_size = None
+        self.sprites = {}
+    
+    def get(self, key, draw_shape, opaque=False):
+        if self.cell_size != CELL_SIZE:
+            self.sprites.clear()
+            self.cell_size = CELL_SIZE
+        
+        sprite = self.sprites.get((key, opaque))
+        if sprite is None:
+            # draw_shape(superficie, centro_x, centro_y) dibuja la forma centrada en la celda
+            if opaque:
+                sprite = opaque_surface((CELL_SIZE, CELL_SIZE))
+                sprite.fill(BLACK)
+                draw_shape(sprite, CELL_SIZE // 2, CELL_SIZE // 2)
+                sprite.set_colorkey(BLACK, pygame.RLEACCEL)
+            else:
+                sprite = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+                draw_shape(sprite, CELL_SIZE // 2, CELL_SIZE // 2)
+                if pygame.display.get_surface() is not None:
+                    sprite = sprite.convert_alpha()
+            self.sprites[(key, opaque)] = sprite
+        return sprite
+
+SPRITE_CACHE = SpriteCache()
+
+def opaque_surface(size):
+    """Superficie opaca; con ventana, en su formato para que los blits no conviertan píxeles"""
+    surface = pygame.Surface(size)
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert()
+    return surface
+
+class TextCache:
+    """Textos ya renderizados por (fuente, texto, color), con desalojo LRU"""
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+    
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        
+        surface = font.render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+class PelletStore:
+    """Puntos y power pellets como bitsets por celda: comer uno es una consulta O(1)
+    y copiar el almacén entero son un par de cientos de bytes"""
+    def __init__(self, grid, copy_from=None):
+        self.width = grid.width
+        self.height = grid.height
+        self.power_pellet_indices = grid.power_pellet_indices
+        self.eaten = []  # Celdas comidas en orden, para actualizar capas de dibujo
+        self.generation = 0  # Cambia cuando el contenido se sustituye entero (reset, load)
+        if copy_from is None:
+            self.dots = bytearray(grid.dot_bits)
+            self.power_pellets = bytearray(grid.power_pellet_bits)
+            self.dots_left = grid.dot_count
+            self.power_pellets_left = grid.power_pellet_count
+        else:
+            self.dots = bytearray(copy_from.dots)
+            self.power_pellets = bytearray(copy_from.power_pellets)
+            self.dots_left = copy_from.dots_left
+            self.power_pellets_left = copy_from.power_pellets_left
+    
+    @property
+    def remaining(self):
+        return self.dots_left + self.power_pellets_left
+    
+    def kind_at(self, index):
+        mask = 1 << (index & 7)
+        if self.dots[index >> 3] & mask:
+            return DOT
+        if self.power_pellets[index >> 3] & mask:
+            return POWER_PELLET
+        return EMPTY
+    
+    def get(self, cell_x, cell_y):
+        if 0 <= cell_x < self.width and 0 <= cell_y < self.height:
+            return self.kind_at(cell_y * self.width + cell_x)
+        return EMPTY
+    
+    def eat(self, cell_x, cell_y):
+        """Quita lo que haya en la celda y devuelve su tipo (EMPTY si no había nada)"""
+        if not (0 <= cell_x < self.width and 0 <= cell_y < self.height):
+            return EMPTY
+        index = cell_y * self.width + cell_x
+        byte = index >> 3
+        mask = 1 << (index & 7)
+        if self.dots[byte] & mask:
+            self.dots[byte] ^= mask
+            self.dots_left -= 1
+            kind = DOT
+        elif self.power_pellets[byte] & mask:
+            self.power_pellets[byte] ^= mask
+            self.power_pellets_left -= 1
+            kind = POWER_PELLET
+        else:
+            return EMPTY
+        self.eaten.append(index)
+        return kind
+    
+    def copy(self, grid):
+        return PelletStore(grid, self)
+    
+    def reset(self, grid):
+        """Vuelve a la plantilla del laberinto sin crear objetos nuevos"""
+        self.dots[:] = grid.dot_bits
+        self.power_pellets[:] = grid.power_pellet_bits
+        self.dots_left = grid.dot_count
+        self.power_pellets_left = grid.power_pellet_count
+        self.eaten = []
+        self.generation += 1
+    
+    def is_full(self, grid):
+        return self.dots == grid.dot_bits and self.power_pellets == grid.power_pellet_bits
+    
+    def to_bytes(self):
+        return bytes(self.dots) + bytes(self.power_pellets)
+    
+    def load(self, data):
+        """Sustituye el contenido por el de to_bytes()"""
+        size = len(self.dots)
+        if len(data) != size * 2:
+            raise ValueError("el tamaño de los puntos no coincide con el laberinto")
+        self.dots = bytearray(data[:size])
+        self.power_pellets = bytearray(data[size:])
+        self.eaten = []
+        self.generation += 1
+        self.dots_left = count_bits(self.dots)
+        self.power_pellets_left = count_bits(self.power_pellets)
+    
+    def __iter__(self):
+        # (celda_x, celda_y, tipo) de cada celda que aún tiene algo
+        for bits, kind in ((self.dots, DOT), (self.power_pellets, POWER_PELLET)):
+            for byte_index, byte in enumerate(bits):
+                while byte:
+                    low = byte & -byte
+                    index = byte_index * 8 + low.bit_length() - 1
+                    yield index % self.width, index // self.width, kind
+                    byte ^= low
+    
+    @property
+    def source(self):
+        # Almacén del que salen estos puntos; las capas de dibujo lo usan como identidad
+        return self
+
+class EatenPrefix:
+    """Los primeros elementos de una lista que solo crece (PelletStore.eaten), sin copiarla"""
+    __slots__ = ("items", "count")
+    
+    def __init__(self, items):
+        self.items = items
+        self.count = len(items)
+    
+    def __len__(self):
+        return self.count
+    
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.items[slice(*key.indices(self.count))]
+        return self.items[range(self.count)[key]]
+    
+    def __iter__(self):
+        return iter(self.items[:self.count])
+
+class PelletSnapshot(PelletStore):
+    """Copia de solo lectura de un PelletStore para dibujarla desde otro hilo.
+    
+    Copia los bitsets (un par de cientos de bytes), pero de eaten solo guarda
+    hasta dónde llegaba: reset() y load() no vacían la lista, la sustituyen.
+    """
+    def __init__(self, pellets):
+        self.width = pellets.width
+        self.height = pellets.height
+        self.power_pellet_indices = pellets.power_pellet_indices
+        self.eaten = EatenPrefix(pellets.eaten)
+        self.generation = pellets.generation
+        self.dots = bytes(pellets.dots)
+        self.power_pellets = bytes(pellets.power_pellets)
+        self.dots_left = pellets.dots_left
+        self.power_pellets_left = pellets.power_pellets_left
+        self.original = pellets.source
+    
+    @property
+    def source(self):
+        return self.original
+
+class GridMover:
+    """Movimiento de celda en celda, compartido por Pacman y los fantasmas.
+    
+    Las posiciones son enteros en subpíxeles y se avanza eje por eje, sin raíces
+    ni divisiones: el resultado es el mismo en cualquier plataforma. x e y dan la
+    posición en píxeles, para dibujar.
+    """
+    __slots__ = ("grid", "sub_x", "sub_y", "target_sub_x", "target_sub_y", "moving")
+    
+    @property
+    def x(self):
+        return self.sub_x / SUBPIXELS
+    
+    @property
+    def y(self):
+        return self.sub_y / SUBPIXELS
+    
+    def place(self, x, y):
+        """Parado en la posición (x, y) en píxeles"""
+        self.sub_x = self.target_sub_x = x * SUBPIXELS
+        self.sub_y = self.target_sub_y = y * SUBPIXELS
+        self.moving = False
+    
+    def get_current_cell(self):
+        return (self.sub_x // CELL_SUBPIXELS, self.sub_y // CELL_SUBPIXELS)
+    
+    def get_nearest_cell(self):
+        # Celda cuyo centro está más cerca del centro de la entidad
+        half = CELL_SUBPIXELS // 2
+        return ((self.sub_x + half) // CELL_SUBPIXELS, (self.sub_y + half) // CELL_SUBPIXELS)
+    
+    def start_towards(self, direction):
+        # Objetivo: la celda vecina en esa dirección
+        self.target_sub_x = (self.sub_x // CELL_SUBPIXELS + DIRECTION_DX[direction]) * CELL_SUBPIXELS
+        self.target_sub_y = (self.sub_y // CELL_SUBPIXELS + DIRECTION_DY[direction]) * CELL_SUBPIXELS
+        self.moving = True
+    
+    def move_towards_target(self, speed, arrive_within=None):
+        """Avanza speed subpíxeles; llega (y aplica el túnel) si le quedan arrive_within o menos"""
+        dx = self.target_sub_x - self.sub_x
+        dy = self.target_sub_y - self.sub_y
+        remaining = (dx if dx >= 0 else -dx) + (dy if dy >= 0 else -dy)
+        
+        if remaining <= (speed if arrive_within is None else arrive_within):
+            # Llegamos al objetivo; manejar teletransporte
+            self.sub_x = self.target_sub_x = self.grid.wrap_sub_x(self.target_sub_x)
+            self.sub_y = self.target_sub_y
+            self.moving = False
+        else:
+            # Por ejes y sin pasarse del objetivo
+            if dx:
+                self.sub_x += speed if dx > speed else -speed if dx < -speed else dx
+            if dy:
+                self.sub_y += speed if dy > speed else -speed if dy < -speed else dy
+
+class Pacman(GridMover):
+    __slots__ = ("direction", "next_direction", "animation_frame", "animation_speed",
+                 "speed", "mouth_open")
+    
+    def __init__(self, x, y, grid=MAZE_GRID):
+        self.grid = grid
+        self.animation_speed = 6
+        self.speed = PACMAN_SPEED
+        self.reset(x, y)
+    
+    def reset(self, x, y):
+        """Estado inicial en (x, y), como recién creado"""
+        self.place(x, y)
         self.direction = 0  # 0=derecha, 1=abajo, 2=izquierda, 3=arriba
         self.next_direction = None
         self.animation_frame = 0
-        self.animation_speed = 6
-        self.speed = 3
         self.mouth_open = True
         
-        # Para movimiento más suave
-        self.target_x = x
-        self.target_y = y
-        self.moving = False
-        
     def update(self):
         # Animación de la boca
         self.animation_frame += 1
@@ -98,79 +853,14 @@ class Pacman:
         
         # Movimiento suave
         if self.moving:
-            self.move_towards_target()
+            self.move_towards_target(self.speed)
     
     def can_move_in_direction(self, direction):
-        # Calcular próxima celda
-        next_cell_x = int(self.x // CELL_SIZE)
-        next_cell_y = int(self.y // CELL_SIZE)
-        
-        if direction == 0:  # Derecha
-            next_cell_x += 1
-        elif direction == 1:  # Abajo
-            next_cell_y += 1
-        elif direction == 2:  # Izquierda
-            next_cell_x -= 1
-        elif direction == 3:  # Arriba
-            next_cell_y -= 1
-        
-        # Verificar teletransporte horizontal
-        if next_cell_x < 0 or next_cell_x >= len(MAZE[0]):
-            return True
-        
-        # Verificar colisión con paredes
-        if (next_cell_y >= 0 and next_cell_y < len(MAZE) and 
-            next_cell_x >= 0 and next_cell_x < len(MAZE[0]) and 
-            MAZE[next_cell_y][next_cell_x] == '#'):
-            return False
-        
-        return True
+        # Una consulta a la tabla de salidas (incluye túneles y bordes)
+        return self.grid.can_move(self.sub_x // CELL_SUBPIXELS, self.sub_y // CELL_SUBPIXELS, direction)
     
     def start_movement(self):
-        # Calcular objetivo basado en dirección
-        target_x = int(self.x // CELL_SIZE) * CELL_SIZE
-        target_y = int(self.y // CELL_SIZE) * CELL_SIZE
-        
-        if self.direction == 0:  # Derecha
-            target_x += CELL_SIZE
-        elif self.direction == 1:  # Abajo
-            target_y += CELL_SIZE
-        elif self.direction == 2:  # Izquierda
-            target_x -= CELL_SIZE
-        elif self.direction == 3:  # Arriba
-            target_y -= CELL_SIZE
-        
-        self.target_x = target_x
-        self.target_y = target_y
-        self.moving = True
-    
-    def move_towards_target(self):
-        # Movimiento suave hacia el objetivo
-        dx = self.target_x - self.x
-        dy = self.target_y - self.y
-        
-        distance = math.sqrt(dx*dx + dy*dy)
-        
-        if distance <= self.speed:
-            # Llegamos al objetivo
-            self.x = self.target_x
-            self.y = self.target_y
-            self.moving = False
-            
-            # Manejar teletransporte
-            if self.x < 0:
-                self.x = SCREEN_WIDTH - CELL_SIZE
-                self.target_x = self.x
-            elif self.x >= SCREEN_WIDTH:
-                self.x = 0
-                self.target_x = self.x
-        else:
-            # Moverse hacia el objetivo
-            move_x = (dx / distance) * self.speed
-            move_y = (dy / distance) * self.speed
-            
-            self.x += move_x
-            self.y += move_y
+        self.start_towards(self.direction)
     
     def change_direction(self, new_direction):
         # Si podemos cambiar inmediatamente, hacerlo
@@ -180,12 +870,29 @@ class Pacman:
             # Guardar para el próximo movimiento
             self.next_direction = new_direction
     
-    def get_current_cell(self):
-        return (int(self.x // CELL_SIZE), int(self.y // CELL_SIZE))
+    def get_state(self):
+        next_direction = -1 if self.next_direction is None else self.next_direction
+        return (self.sub_x, self.sub_y, self.direction, next_direction, self.animation_frame,
+                self.mouth_open, self.target_sub_x, self.target_sub_y, self.moving)
+    
+    def set_state(self, state):
+        (self.sub_x, self.sub_y, self.direction, next_direction, self.animation_frame,
+         mouth_open, self.target_sub_x, self.target_sub_y, moving) = state
+        self.next_direction = None if next_direction < 0 else next_direction
+        self.mouth_open = bool(mouth_open)
+        self.moving = bool(moving)
+    
+    def copy(self):
+        pacman = Pacman.__new__(Pacman)
+        for name in GridMover.__slots__ + Pacman.__slots__:
+            setattr(pacman, name, getattr(self, name))
+        return pacman
     
-    def draw(self, screen):
-        center_x = self.x + CELL_SIZE // 2
-        center_y = self.y + CELL_SIZE // 2
+    def draw(self, screen, position=None, simple=False):
+        sprite = SPRITE_CACHE.get(("pacman", self.direction, self.mouth_open), self.draw_shape, simple)
+        screen.blit(sprite, position or (self.x, self.y))
+    
+    def draw_shape(self, screen, center_x, center_y):
         radius = CELL_SIZE // 2 - 2
         
         if self.mouth_open:
@@ -206,29 +913,35 @@ class Pacman:
             # Dibujar círculo completo
             pygame.draw.circle(screen, YELLOW, (center_x, center_y), radius)
 
-class Ghost:
-    def __init__(self, x, y, color, name):
-        self.x = x
-        self.y = y
+class Ghost(GridMover):
+    __slots__ = ("start_x", "start_y", "color", "original_color", "name", "rng", "direction",
+                 "speed", "frightened_speed", "mode", "mode_timer", "frightened_timer",
+                 "frightened_blink_timer", "is_frightened")
+    
+    def __init__(self, x, y, color, name, rng=random, grid=MAZE_GRID):
+        self.grid = grid
         self.start_x = x
         self.start_y = y
-        self.color = color
         self.original_color = color
         self.name = name
-        self.direction = random.randint(0, 3)
-        self.speed = 2
+        self.rng = rng  # Fuente de aleatoriedad de la partida
+        self.speed = GHOST_SPEED
+        self.frightened_speed = GHOST_FRIGHTENED_SPEED
+        self.reset()
+    
+    def reset(self):
+        """Estado inicial, como recién creado (la dirección se sortea de nuevo)"""
+        self.place(self.start_x, self.start_y)
+        self.color = self.original_color
+        self.direction = self.rng.randint(0, 3)
         self.mode = "chase"  # chase, scatter, frightened
         self.mode_timer = 0
         self.frightened_timer = 0
         self.frightened_blink_timer = 0
         self.is_frightened = False
         
-        # Para movimiento más suave
-        self.target_x = x
-        self.target_y = y
-        self.moving = False
-        
-    def update(self, pacman_x, pacman_y):
+    def update(self, pacman_sub_x, pacman_sub_y):
+        # Posición de Pacman en subpíxeles
         self.mode_timer += 1
         
         # Manejar modo asustado
@@ -257,124 +970,56 @@ class Ghost:
         
         # Si no nos estamos moviendo hacia un objetivo, empezar nuevo movimiento
         if not self.moving:
-            self.start_movement(pacman_x, pacman_y)
+            self.start_movement(pacman_sub_x, pacman_sub_y)
         
-        # Movimiento suave
+        # Movimiento suave; asustado va más lento pero llega con el mismo margen
         if self.moving:
-            self.move_towards_target()
+            if self.is_frightened:
+                self.move_towards_target(self.frightened_speed, self.speed)
+            else:
+                self.move_towards_target(self.speed)
     
-    def start_movement(self, pacman_x, pacman_y):
-        possible_directions = []
-        current_cell_x = int(self.x // CELL_SIZE)
-        current_cell_y = int(self.y // CELL_SIZE)
+    def start_movement(self, pacman_sub_x, pacman_sub_y):
+        current_cell_x = self.sub_x // CELL_SUBPIXELS
+        current_cell_y = self.sub_y // CELL_SUBPIXELS
         
-        for direction in range(4):
-            next_cell_x = current_cell_x
-            next_cell_y = current_cell_y
-            
-            if direction == 0:  # Derecha
-                next_cell_x += 1
-            elif direction == 1:  # Abajo
-                next_cell_y += 1
-            elif direction == 2:  # Izquierda
-                next_cell_x -= 1
-            elif direction == 3:  # Arriba
-                next_cell_y -= 1
-            
-            # Verificar teletransporte
-            if next_cell_x < 0 or next_cell_x >= len(MAZE[0]):
-                possible_directions.append(direction)
-                continue
-            
-            if not self.check_wall_collision_at_cell(next_cell_x, next_cell_y):
-                possible_directions.append(direction)
+        # Direcciones posibles desde la tabla de salidas (túneles incluidos)
+        possible_directions = DIRECTION_OPTIONS[self.grid.exits_at(current_cell_x, current_cell_y)]
         
         if possible_directions:
             if self.is_frightened:
                 # Movimiento aleatorio cuando está asustado
-                self.direction = random.choice(possible_directions)
+                self.direction = self.rng.choice(possible_directions)
             elif self.mode == "chase":
-                # Elegir dirección hacia Pacman
-                best_direction = self.direction
-                min_distance = float('inf')
+                # Elegir la dirección que más acerca a Pacman por el laberinto
+                # (distancias BFS precalculadas). Si no hay camino conocido, en
+                # línea recta como antes
+                best_direction = self.grid.distances().best_direction(
+                    current_cell_x, current_cell_y,
+                    (pacman_sub_x + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS,
+                    (pacman_sub_y + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS)
                 
-                for direction in possible_directions:
-                    next_x = current_cell_x * CELL_SIZE
-                    next_y = current_cell_y * CELL_SIZE
-                    
-                    if direction == 0:
-                        next_x += CELL_SIZE
-                    elif direction == 1:
-                        next_y += CELL_SIZE
-                    elif direction == 2:
-                        next_x -= CELL_SIZE
-                    elif direction == 3:
-                        next_y -= CELL_SIZE
-                    
-                    distance = math.sqrt((next_x - pacman_x)**2 + (next_y - pacman_y)**2)
-                    
-                    if distance < min_distance:
-                        min_distance = distance
-                        best_direction = direction
+                if best_direction is None:
+                    best_direction = self.direction
+                    min_distance = float('inf')
+                    for direction in possible_directions:
+                        next_x = (current_cell_x + DIRECTION_DX[direction]) * CELL_SUBPIXELS
+                        next_y = (current_cell_y + DIRECTION_DY[direction]) * CELL_SUBPIXELS
+                        distance = (next_x - pacman_sub_x)**2 + (next_y - pacman_sub_y)**2
+                        if distance < min_distance:
+                            min_distance = distance
+                            best_direction = direction
                 
                 self.direction = best_direction
             else:
                 # Movimiento aleatorio en modo scatter
-                if random.randint(0, 5) == 0:
-                    self.direction = random.choice(possible_directions)
-        
-        # Calcular objetivo
-        target_x = current_cell_x * CELL_SIZE
-        target_y = current_cell_y * CELL_SIZE
-        
-        if self.direction == 0:  # Derecha
-            target_x += CELL_SIZE
-        elif self.direction == 1:  # Abajo
-            target_y += CELL_SIZE
-        elif self.direction == 2:  # Izquierda
-            target_x -= CELL_SIZE
-        elif self.direction == 3:  # Arriba
-            target_y -= CELL_SIZE
-        
-        self.target_x = target_x
-        self.target_y = target_y
-        self.moving = True
-    
-    def move_towards_target(self):
-        # Movimiento suave hacia el objetivo
-        dx = self.target_x - self.x
-        dy = self.target_y - self.y
-        
-        distance = math.sqrt(dx*dx + dy*dy)
+                if self.rng.randint(0, 5) == 0:
+                    self.direction = self.rng.choice(possible_directions)
         
-        if distance <= self.speed:
-            # Llegamos al objetivo
-            self.x = self.target_x
-            self.y = self.target_y
-            self.moving = False
-            
-            # Manejar teletransporte
-            if self.x < 0:
-                self.x = SCREEN_WIDTH - CELL_SIZE
-                self.target_x = self.x
-            elif self.x >= SCREEN_WIDTH:
-                self.x = 0
-                self.target_x = self.x
-        else:
-            # Moverse hacia el objetivo
-            move_speed = self.speed * 0.7 if self.is_frightened else self.speed
-            move_x = (dx / distance) * move_speed
-            move_y = (dy / distance) * move_speed
-            
-            self.x += move_x
-            self.y += move_y
+        self.start_towards(self.direction)
     
     def check_wall_collision_at_cell(self, cell_x, cell_y):
-        if (cell_y >= 0 and cell_y < len(MAZE) and 
-            cell_x >= 0 and cell_x < len(MAZE[0]) and 
-            MAZE[cell_y][cell_x] == '#'):
-            return True
-        return False
+        return self.grid.is_blocked(cell_x, cell_y)
     
     def make_frightened(self):
         self.is_frightened = True
@@ -384,21 +1029,49 @@ class Ghost:
         self.mode = "frightened"
     
     def reset_position(self):
-        self.x = self.start_x
-        self.y = self.start_y
-        self.target_x = self.start_x
-        self.target_y = self.start_y
-        self.moving = False
+        self.place(self.start_x, self.start_y)
         self.is_frightened = False
         self.color = self.original_color
         self.mode = "chase"
     
-    def get_current_cell(self):
-        return (int(self.x // CELL_SIZE), int(self.y // CELL_SIZE))
+    def get_state(self):
+        return (self.sub_x, self.sub_y, *self.color, self.direction, GHOST_MODES.index(self.mode),
+                self.mode_timer, self.frightened_timer, self.frightened_blink_timer,
+                self.is_frightened, self.target_sub_x, self.target_sub_y, self.moving)
+    
+    def set_state(self, state):
+        (self.sub_x, self.sub_y, red, green, blue, self.direction, mode, self.mode_timer,
+         self.frightened_timer, self.frightened_blink_timer, is_frightened,
+         self.target_sub_x, self.target_sub_y, moving) = state
+        self.color = (red, green, blue)
+        self.mode = GHOST_MODES[mode]
+        self.is_frightened = bool(is_frightened)
+        self.moving = bool(moving)
+    
+    def copy(self, rng):
+        # rng: el generador de la partida a la que pertenece la copia
+        ghost = Ghost.__new__(Ghost)
+        for name in GridMover.__slots__ + Ghost.__slots__:
+            setattr(ghost, name, getattr(self, name))
+        ghost.rng = rng
+        return ghost
+    
+    def draw(self, screen, position=None, simple=False):
+        if simple:
+            sprite = SPRITE_CACHE.get(("ghost-simple", self.color), self.simple_shape, True)
+        else:
+            sprite = SPRITE_CACHE.get(("ghost", self.color, self.is_frightened), self.draw_shape)
+        screen.blit(sprite, position or (self.x, self.y))
+    
+    def simple_shape(self, screen, center_x, center_y):
+        # Cuerpo sin ondas ni pupilas, para la calidad reducida (sin negro: va con colorkey)
+        radius = CELL_SIZE // 2 - 2
+        pygame.draw.circle(screen, self.color, (center_x, center_y - 2), radius)
+        pygame.draw.rect(screen, self.color, (center_x - radius, center_y - 2, radius * 2, radius + 2))
+        pygame.draw.rect(screen, WHITE, (center_x - 6, center_y - 6, 4, 4))
+        pygame.draw.rect(screen, WHITE, (center_x + 2, center_y - 6, 4, 4))
     
-    def draw(self, screen):
-        center_x = self.x + CELL_SIZE // 2
-        center_y = self.y + CELL_SIZE // 2
+    def draw_shape(self, screen, center_x, center_y):
         radius = CELL_SIZE // 2 - 2
         
         # Cuerpo del fantasma (semicírculo + rectángulo)
@@ -432,6 +1105,8 @@ class Ghost:
             pygame.draw.circle(screen, BLACK, (center_x + 5, center_y - 6), 2)
 
 class BonusFruit:
+    __slots__ = ("x", "y", "fruit_type", "timer", "blink_timer", "visible")
+    
     def __init__(self, x, y, fruit_type):
         self.x = x
         self.y = y
@@ -450,45 +1125,80 @@ class BonusFruit:
         
         return self.timer > 0
     
-    def draw(self, screen):
+    def get_state(self):
+        return (self.x, self.y, BONUS_FRUITS.index(self.fruit_type),
+                self.timer, self.blink_timer, self.visible)
+    
+    @classmethod
+    def from_state(cls, state):
+        x, y, fruit_index, timer, blink_timer, visible = state
+        fruit = cls(x, y, BONUS_FRUITS[fruit_index])
+        fruit.timer = timer
+        fruit.blink_timer = blink_timer
+        fruit.visible = bool(visible)
+        return fruit
+    
+    def copy(self):
+        fruit = BonusFruit.__new__(BonusFruit)
+        for name in BonusFruit.__slots__:
+            setattr(fruit, name, getattr(self, name))
+        return fruit
+    
+    def draw(self, screen, position=None, simple=False):
         if self.visible:
-            center_x = self.x + CELL_SIZE // 2
-            center_y = self.y + CELL_SIZE // 2
+            x, y = position or (self.x, self.y)
+            center_x = x + CELL_SIZE // 2
+            center_y = y + CELL_SIZE // 2
             radius = CELL_SIZE // 3
             
             # Dibujar fruta como círculo con el color correspondiente
             pygame.draw.circle(screen, self.fruit_type["color"], (center_x, center_y), radius)
-            pygame.draw.circle(screen, WHITE, (center_x, center_y), radius, 2)
+            if not simple:
+                pygame.draw.circle(screen, WHITE, (center_x, center_y), radius, 2)
 
-class Game:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Pacman Vintage Arcade")
-        self.clock = pygame.time.Clock()
-        self.font = pygame.font.Font(None, 36)
-        self.small_font = pygame.font.Font(None, 24)
+class Simulation:
+    """Estado y lógica del juego, sin pantalla ni reloj (se puede usar sin inicializar SDL)"""
+    def __init__(self, seed=None, grid=MAZE_GRID):
+        # Generador propio: misma semilla, misma partida. Sin semilla se
+        # elige una al azar y se guarda, para poder grabar la partida
+        if seed is None:
+            seed = random.randrange(2**64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.grid = grid
         
         # Crear puntos y power pellets
-        self.dots = []
-        self.power_pellets = []
-        self.create_dots()
+        self.pellets = PelletStore(self.grid)
         
         # Crear Pacman
         start_x, start_y = self.find_start_position()
-        self.pacman = Pacman(start_x * CELL_SIZE, start_y * CELL_SIZE)
+        self.pacman = Pacman(start_x * CELL_SIZE, start_y * CELL_SIZE, self.grid)
         
         # Crear fantasmas
-        self.ghosts = [
-            Ghost(18 * CELL_SIZE, 10 * CELL_SIZE, RED, "Blinky"),
-            Ghost(19 * CELL_SIZE, 10 * CELL_SIZE, PINK, "Pinky"),
-            Ghost(20 * CELL_SIZE, 10 * CELL_SIZE, CYAN, "Inky"),
-            Ghost(21 * CELL_SIZE, 10 * CELL_SIZE, ORANGE, "Clyde")
-        ]
+        self.ghosts = self.create_ghosts()
+        
+        self.fruit_spawn_interval = 1800  # 30 segundos
+        self.profiler = None  # FrameProfiler de Game mientras se perfila
+        self.reset(seed)
+    
+    def reset(self, seed=None):
+        """Empieza otra partida reutilizando los objetos y el laberinto ya compilado.
+        
+        Queda igual que Simulation(seed) con el mismo laberinto.
+        """
+        if seed is None:
+            seed = random.randrange(2**64)
+        self.seed = seed
+        self.rng.seed(seed)
+        
+        self.pellets.reset(self.grid)
+        start_x, start_y = self.find_start_position()
+        self.pacman.reset(start_x * CELL_SIZE, start_y * CELL_SIZE)
+        self.reset_ghosts()
         
         # Sistema de frutas bonus
         self.bonus_fruit = None
         self.fruit_spawn_timer = 0
-        self.fruit_spawn_interval = 1800  # 30 segundos
         
         self.score = 0
         self.lives = 3
@@ -496,88 +1206,230 @@ class Game:
         self.win = False
         self.power_pellet_mode = False
         self.power_pellet_timer = 0
+        self.ticks = 0
+    
+    @property
+    def done(self):
+        return self.game_over or self.win
+    
+    def change_direction(self, direction):
+        self.pacman.change_direction(direction)
+    
+    def step(self, action=None):
+        """Avanza un tick. action: dirección 0-3 o None. Devuelve los puntos ganados"""
+        if action is not None:
+            self.change_direction(action)
+        
+        if self.game_over or self.win:
+            return 0
+        
+        score_before = self.score
+        self.ticks += 1
+        profiler = self.profiler
+        
+        self.pacman.update()
+        if profiler:
+            profiler.lap("pacman")
+        self.update_ghosts()
+        if profiler:
+            profiler.lap("ghosts")
+        
+        # Manejar modo power pellet
+        if self.power_pellet_mode:
+            self.power_pellet_timer -= 1
+            if self.power_pellet_timer <= 0:
+                self.power_pellet_mode = False
+        
+        # Manejar spawn de frutas bonus
+        self.fruit_spawn_timer += 1
+        if self.fruit_spawn_timer >= self.fruit_spawn_interval:
+            self.spawn_bonus_fruit()
+            self.fruit_spawn_timer = 0
+        
+        # Actualizar fruta bonus
+        if self.bonus_fruit:
+            if not self.bonus_fruit.update():
+                self.bonus_fruit = None
+        if profiler:
+            profiler.lap("timers")
+        
+        self.check_dot_collision()
+        self.check_ghost_collision()
+        if profiler:
+            profiler.lap("collision")
+        
+        return self.score - score_before
+    
+    # Todo lo que toca a los fantasmas en conjunto pasa por estos métodos, para
+    # que swarm.SwarmSimulation pueda guardarlos en arrays en vez de en objetos
+    
+    def create_ghosts(self):
+        return [
+            Ghost(cell_x * CELL_SIZE, cell_y * CELL_SIZE, color, name, self.rng, self.grid)
+            for (name, color), (cell_x, cell_y) in zip(GHOSTS, self.grid.ghost_start_cells)
+        ]
+    
+    def reset_ghosts(self):
+        for ghost in self.ghosts:
+            ghost.reset()
+    
+    def update_ghosts(self):
+        pacman_sub_x = self.pacman.sub_x
+        pacman_sub_y = self.pacman.sub_y
+        for ghost in self.ghosts:
+            ghost.update(pacman_sub_x, pacman_sub_y)
+    
+    def frighten_ghosts(self):
+        for ghost in self.ghosts:
+            ghost.make_frightened()
+    
+    def ghosts_to_bytes(self):
+        return b"".join(GHOST_STATE.pack(*ghost.get_state()) for ghost in self.ghosts)
+    
+    def load_ghosts(self, data, offset):
+        # Devuelve la posición en data justo después de los fantasmas
+        for ghost in self.ghosts:
+            ghost.set_state(GHOST_STATE.unpack_from(data, offset))
+            offset += GHOST_STATE.size
+        return offset
+    
+    def copy_ghosts(self, rng):
+        return [ghost.copy(rng) for ghost in self.ghosts]
+    
+    def get_state(self):
+        """Contadores y estado de la partida (sin entidades, puntos ni generador)"""
+        return (self.ticks, self.score, self.lives, self.game_over, self.win,
+                self.power_pellet_mode, self.power_pellet_timer, self.fruit_spawn_timer)
+    
+    def set_state(self, state):
+        (self.ticks, self.score, self.lives, game_over, win, power_pellet_mode,
+         self.power_pellet_timer, self.fruit_spawn_timer) = state
+        self.game_over = bool(game_over)
+        self.win = bool(win)
+        self.power_pellet_mode = bool(power_pellet_mode)
+    
+    def snapshot(self):
+        """Estado completo de la partida como bytes (el laberinto no se incluye)"""
+        version, mt_state, gauss_next = self.rng.getstate()
+        parts = [
+            SIM_STATE.pack(*self.get_state(), self.bonus_fruit is not None),
+            RNG_STATE.pack(*mt_state, gauss_next is not None, gauss_next or 0.0),
+            PACMAN_STATE.pack(*self.pacman.get_state()),
+        ]
+        parts.append(self.ghosts_to_bytes())
+        if self.bonus_fruit is not None:
+            parts.append(FRUIT_STATE.pack(*self.bonus_fruit.get_state()))
+        parts.append(self.pellets.to_bytes())
+        return b"".join(parts)
+    
+    def clone(self):
+        """Copia independiente de la partida para búsquedas en árbol; comparte el laberinto"""
+        sim = type(self).__new__(type(self))
+        sim.__dict__.update(self.__dict__)
+        sim.rng = random.Random.__new__(random.Random)
+        sim.rng.setstate(self.rng.getstate())
+        sim.pellets = self.pellets.copy(self.grid)
+        sim.pacman = self.pacman.copy()
+        sim.ghosts = self.copy_ghosts(sim.rng)
+        if self.bonus_fruit is not None:
+            sim.bonus_fruit = self.bonus_fruit.copy()
+        return sim
+    
+    def frame_snapshot(self):
+        """Copia de lo que dibuja Game, para publicarla desde el hilo de la simulación.
+        
+        Como clone() pero sin copiar el generador: nunca se avanza.
+        """
+        sim = type(self).__new__(type(self))
+        sim.__dict__.update(self.__dict__)
+        sim.profiler = None
+        sim.pellets = PelletSnapshot(self.pellets)
+        sim.pacman = self.pacman.copy()
+        sim.ghosts = self.copy_ghosts(self.rng)
+        if self.bonus_fruit is not None:
+            sim.bonus_fruit = self.bonus_fruit.copy()
+        return sim
+    
+    def restore(self, data):
+        """Vuelve al estado guardado con snapshot() en una partida del mismo laberinto"""
+        offset = 0
+        
+        def read(fmt):
+            nonlocal offset
+            values = fmt.unpack_from(data, offset)
+            offset += fmt.size
+            return values
+        
+        *state, has_fruit = read(SIM_STATE)
+        self.set_state(state)
+        
+        rng_state = read(RNG_STATE)
+        gauss_next = rng_state[-1] if rng_state[-2] else None
+        self.rng.setstate((3, rng_state[:625], gauss_next))
+        
+        self.pacman.set_state(read(PACMAN_STATE))
+        offset = self.load_ghosts(data, offset)
+        self.bonus_fruit = BonusFruit.from_state(read(FRUIT_STATE)) if has_fruit else None
+        
+        # load() cambia la generación del almacén: las capas de dibujo se reconstruyen
+        self.pellets.load(data[offset:])
     
     def find_start_position(self):
-        for y, row in enumerate(MAZE):
-            for x, cell in enumerate(row):
-                if cell == ' ' or cell == '.':
-                    return x, y
-        return 1, 1
+        return self.grid.start_cell
     
     def find_empty_position(self):
         """Encuentra una posición vacía para spawn de frutas"""
-        empty_positions = []
-        for y, row in enumerate(MAZE):
-            for x, cell in enumerate(row):
-                if cell == ' ' or cell == '.':
-                    empty_positions.append((x, y))
-        
-        if empty_positions:
-            return random.choice(empty_positions)
+        free_cells = self.grid.free_cells
+        if free_cells:
+            index = self.rng.choice(free_cells)
+            return (index % self.grid.width, index // self.grid.width)
         return (1, 1)
     
-    def create_dots(self):
-        for y, row in enumerate(MAZE):
-            for x, cell in enumerate(row):
-                if cell == '.':
-                    self.dots.append((x * CELL_SIZE + CELL_SIZE//2, 
-                                    y * CELL_SIZE + CELL_SIZE//2))
-                elif cell == 'o':
-                    self.power_pellets.append((x * CELL_SIZE + CELL_SIZE//2, 
-                                             y * CELL_SIZE + CELL_SIZE//2))
-    
     def spawn_bonus_fruit(self):
         if self.bonus_fruit is None:
-            fruit_type = random.choice(BONUS_FRUITS)
+            fruit_type = self.rng.choice(BONUS_FRUITS)
             x, y = self.find_empty_position()
             self.bonus_fruit = BonusFruit(x * CELL_SIZE, y * CELL_SIZE, fruit_type)
     
     def check_dot_collision(self):
-        pacman_center = (self.pacman.x + CELL_SIZE//2, self.pacman.y + CELL_SIZE//2)
-        
-        # Verificar puntos normales
-        for dot in self.dots[:]:  # Copia de la lista
-            if math.sqrt((pacman_center[0] - dot[0])**2 + 
-                        (pacman_center[1] - dot[1])**2) < CELL_SIZE//2:
-                self.dots.remove(dot)
-                self.score += 10
-        
-        # Verificar power pellets
-        for pellet in self.power_pellets[:]:
-            if math.sqrt((pacman_center[0] - pellet[0])**2 + 
-                        (pacman_center[1] - pellet[1])**2) < CELL_SIZE//2:
-                self.power_pellets.remove(pellet)
-                self.score += 50
-                
-                # Activar modo power pellet
-                self.power_pellet_mode = True
-                self.power_pellet_timer = 300  # 5 segundos
-                
-                # Hacer que todos los fantasmas se asusten
-                for ghost in self.ghosts:
-                    ghost.make_frightened()
+        # Solo la celda cuyo centro está más cerca puede estar a menos de media celda
+        cell_x, cell_y = self.pacman.get_nearest_cell()
+        eaten = self.pellets.eat(cell_x, cell_y)
+        if eaten == DOT:
+            self.score += 10
+        elif eaten == POWER_PELLET:
+            self.score += 50
+            
+            # Activar modo power pellet
+            self.power_pellet_mode = True
+            self.power_pellet_timer = 300  # 5 segundos
+            
+            # Hacer que todos los fantasmas se asusten
+            self.frighten_ghosts()
         
         # Verificar fruta bonus
         if self.bonus_fruit:
-            fruit_center = (self.bonus_fruit.x + CELL_SIZE//2, self.bonus_fruit.y + CELL_SIZE//2)
-            if math.sqrt((pacman_center[0] - fruit_center[0])**2 + 
-                        (pacman_center[1] - fruit_center[1])**2) < CELL_SIZE//2:
+            # Distancia entre centros al cuadrado, en subpíxeles
+            dx = self.pacman.sub_x - self.bonus_fruit.x * SUBPIXELS
+            dy = self.pacman.sub_y - self.bonus_fruit.y * SUBPIXELS
+            if dx * dx + dy * dy < FRUIT_HIT_DISTANCE_SQ:
                 self.score += self.bonus_fruit.fruit_type["points"]
                 self.bonus_fruit = None
         
         # Verificar victoria
-        if len(self.dots) == 0 and len(self.power_pellets) == 0:
+        if self.pellets.remaining == 0:
             self.win = True
     
     def check_ghost_collision(self):
-        pacman_center = (self.pacman.x + CELL_SIZE//2, self.pacman.y + CELL_SIZE//2)
+        pacman_x = self.pacman.sub_x
+        pacman_y = self.pacman.sub_y
         
         for ghost in self.ghosts:
-            ghost_center = (ghost.x + CELL_SIZE//2, ghost.y + CELL_SIZE//2)
-            distance = math.sqrt((pacman_center[0] - ghost_center[0])**2 + 
-                               (pacman_center[1] - ghost_center[1])**2)
+            # Distancia entre centros al cuadrado, en subpíxeles
+            dx = pacman_x - ghost.sub_x
+            dy = pacman_y - ghost.sub_y
             
-            if distance < CELL_SIZE * 0.8:
+            if dx * dx + dy * dy < GHOST_HIT_DISTANCE_SQ:
                 if ghost.is_frightened:
                     # Comer fantasma
                     self.score += 200
@@ -590,135 +1442,734 @@ class Game:
                     else:
                         # Resetear posición de Pacman
                         start_x, start_y = self.find_start_position()
-                        self.pacman.x = start_x * CELL_SIZE
-                        self.pacman.y = start_y * CELL_SIZE
-                        self.pacman.target_x = self.pacman.x
-                        self.pacman.target_y = self.pacman.y
-                        self.pacman.moving = False
+                        self.pacman.place(start_x * CELL_SIZE, start_y * CELL_SIZE)
                     break
     
+class SimulationThread:
+    """Avanza la partida en otro hilo a TICK_RATE ticks por segundo (Game(threaded=True)).
+    
+    Tras cada tick publica una copia de solo lectura (Simulation.frame_snapshot)
+    junto con la anterior, para interpolar: published es una sola tupla que se
+    sustituye entera, así que quien dibuja nunca ve un estado a medias. Las
+    órdenes del hilo principal llegan por commands, una deque: append y
+    popleft son atómicos y no hace falta ningún lock.
+    """
+    def __init__(self, sim, recorder=None):
+        self.sim = sim
+        self.recorder = recorder
+        self.commands = deque()  # ("direction", 0-3) o ("reset", semilla)
+        snapshot = sim.frame_snapshot()
+        self.published = (snapshot, snapshot, time.perf_counter())  # (anterior, actual, instante)
+        self.ticks = 0
+        self.dropped_time = 0.0  # Segundos descartados por ir demasiado atrasado
+        self.error = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+    
+    def apply_commands(self):
+        commands = self.commands
+        while commands:
+            command, argument = commands.popleft()
+            if command == "direction":
+                if self.sim.done:
+                    continue  # Como en Game.change_direction
+                if self.recorder:
+                    self.recorder.record_input(argument)
+                self.sim.change_direction(argument)
+            elif command == "reset":
+                if self.recorder:
+                    self.recorder.finish()
+                self.sim.reset(argument)
+                if self.recorder:
+                    self.recorder.start(self.sim)
+    
+    def run(self):
+        tick_seconds = 1.0 / TICK_RATE
+        next_tick = time.perf_counter()
+        try:
+            while not self.stopping.is_set():
+                now = time.perf_counter()
+                if now < next_tick:
+                    self.stopping.wait(next_tick - now)
+                    continue
+                
+                self.apply_commands()
+                self.sim.step()
+                if self.recorder:
+                    self.recorder.after_step()
+                self.ticks += 1
+                next_tick += tick_seconds
+                
+                # Si se quedó muy atrás no se intenta recuperar todo el retraso
+                if now - next_tick > MAX_TICKS_PER_FRAME * tick_seconds:
+                    self.dropped_time += now - next_tick
+                    next_tick = now
+                
+                # Terminada la partida ya no cambia nada hasta reiniciarla
+                current = self.published[1]
+                if self.sim.ticks != current.ticks or self.sim.pellets.generation != current.pellets.generation:
+                    self.published = (current, self.sim.frame_snapshot(), time.perf_counter())
+        except Exception as error:
+            # Se vuelve a lanzar en el hilo principal
+            self.error = error
+
+class Game:
+    def __init__(self, sim=None, dirty_rects=False, render_fps=60, recorder=None, offscreen=False,
+                 quality=None, threaded=False):
+        pygame.init()
+        # Sin ventana se dibuja en una Surface normal (frame_export.py); el
+        # parpadeo sigue entonces a los ticks de la partida y no al reloj
+        self.offscreen = offscreen
+        if offscreen:
+            self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        else:
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("Pacman Vintage Arcade")
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 36)
+        self.small_font = pygame.font.Font(None, 24)
+        self.text_cache = TextCache()
+        
+        self.sim = sim if sim is not None else Simulation()
+        
+        # Grabación opcional de cada partida (replay.SessionRecorder)
+        self.recorder = recorder
+        if self.recorder:
+            self.recorder.start(self.sim)
+        
+        # Capas cacheadas: paredes (solo cambian con el laberinto) y puntos
+        # (se borra cada punto al comerlo en vez de redibujarlos todos)
+        self.wall_layer = None
+        self.wall_layer_grid = None
+        self.pellet_layer = None
+        self.pellet_layer_store = None
+        self.pellet_layer_generation = 0
+        self.pellet_layer_eaten = 0
+        self.pellet_layer_template = None  # Capa con todos los puntos, para empezar partidas
+        self.pellet_layer_template_grid = None
+        self.pellet_dirty_rects = []
+        self.power_pellets_shown = False
+        
+        # Laberintos que no caben en pantalla: cámara que sigue a Pacman
+        # (viewport.MazeViewport); None si el laberinto cabe entero
+        self.viewport = None
+        self.viewport_grid = None
+        
+        # Modo de rectángulos sucios: solo se restaura y envía lo que cambió.
+        # F2 lo activa o desactiva; pixels_pushed mide lo enviado en el último frame
+        self.dirty_rects = dirty_rects
+        self.full_redraw = True
+        self.drawn_sprite_rects = []
+        self.drawn_hud = {}
+        self.pixels_pushed = 0
+        self.total_pixels_pushed = 0
+        
+        # Paso fijo de simulación con interpolación al dibujar
+        self.render_fps = render_fps
+        self.interpolation = 1.0
+        self.previous_sim = None
+        self.previous_positions = []
+        self.dropped_time = 0.0  # Segundos descartados por frames demasiado lentos
+        
+        # Con threaded=True la partida avanza en un SimulationThread y self.sim
+        # es la última copia que publicó; las órdenes van por su cola
+        self.threaded = threaded
+        self.sim_thread = None
+        
+        # Calidad de dibujado (quality.py): con quality=None la elige Game.run
+        # según el tiempo de cada frame; un número la fija. Sin ventana, completa
+        self.quality = QUALITY_LEVELS[quality or 0]
+        self.quality_governor = None
+        if quality is None and not offscreen:
+            self.quality_governor = QualityGovernor(1000 / (render_fps or TICK_RATE))
+        
+        # Perfilado por fases (F3 panel, F4 traza); active_profiler es None si está apagado
+        self.profiler = FrameProfiler()
+        self.active_profiler = None
+        self.profiler_font = None
+        self.profiler_rect = None
+    
+    def build_wall_layer(self, grid):
+        # Fondo completo de la pantalla con las paredes ya dibujadas
+        layer = opaque_surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        layer.fill(BLACK)
+        for y in range(grid.height):
+            for x in range(grid.width):
+                if grid.cell(x, y) == WALL:
+                    rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+                    pygame.draw.rect(layer, WALL_COLOR, rect)
+                    pygame.draw.rect(layer, BLUE, rect, 1)
+        return layer
+    
+    def build_pellet_layer(self, pellets):
+        # Los puntos normales no cambian salvo al comerlos; los power pellets
+        # parpadean y se dibujan aparte
+        layer = opaque_surface((pellets.width * CELL_SIZE, pellets.height * CELL_SIZE))
+        layer.fill(BLACK)
+        layer.set_colorkey(BLACK)
+        for cell_x, cell_y, kind in pellets:
+            if kind == DOT:
+                center = (cell_x * CELL_SIZE + CELL_SIZE//2, cell_y * CELL_SIZE + CELL_SIZE//2)
+                pygame.draw.circle(layer, WHITE, center, 2)
+        return layer
+    
+    def update_viewport(self, positions):
+        # Se crea al ver por primera vez un laberinto más grande que la zona de juego
+        grid = self.sim.grid
+        if self.viewport_grid is not grid:
+            self.viewport_grid = grid
+            self.viewport = None
+            if grid.pixel_width > SCREEN_WIDTH or grid.height > MAZE_HEIGHT:
+                from viewport import MazeViewport
+                self.viewport = MazeViewport(grid, SCREEN_WIDTH, MAZE_HEIGHT * CELL_SIZE)
+        if self.viewport:
+            # Centrada en la posición interpolada de Pacman, la misma con la que se dibuja
+            _, x, y = positions[0]
+            self.viewport.follow(x, y)
+    
+    def camera(self):
+        return self.viewport.camera if self.viewport else (0, 0)
+    
     def draw_maze(self):
-        for y, row in enumerate(MAZE):
-            for x, cell in enumerate(row):
-                rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                if cell == '#':
-                    pygame.draw.rect(self.screen, WALL_COLOR, rect)
-                    pygame.draw.rect(self.screen, BLUE, rect, 1)
+        if self.viewport:
+            self.screen.fill(BLACK)
+            self.viewport.draw(self.screen, self.sim.pellets)
+            return
+        if self.wall_layer_grid is not self.sim.grid:
+            self.wall_layer = self.build_wall_layer(self.sim.grid)
+            self.wall_layer_grid = self.sim.grid
+        self.screen.blit(self.wall_layer, (0, 0))
+    
+    def pellet_layer_current(self):
+        pellets = self.sim.pellets
+        return self.pellet_layer_store is pellets.source and self.pellet_layer_generation == pellets.generation
+    
+    def new_pellet_layer(self, pellets):
+        # Al empezar partida basta con copiar la capa inicial, sin dibujar cada punto
+        grid = self.sim.grid
+        if not pellets.is_full(grid):
+            return self.build_pellet_layer(pellets)
+        if self.pellet_layer_template_grid is not grid:
+            self.pellet_layer_template = self.build_pellet_layer(PelletStore(grid))
+            self.pellet_layer_template_grid = grid
+        return self.pellet_layer_template.copy()
     
     def draw_dots(self):
-        for dot in self.dots:
-            pygame.draw.circle(self.screen, WHITE, dot, 2)
+        pellets = self.sim.pellets
+        self.pellet_dirty_rects = []
+        if self.viewport:
+            # Los puntos van en los bloques de la cámara; aquí solo los power pellets
+            self.draw_power_pellets()
+            return
+        if not self.pellet_layer_current():
+            self.pellet_layer = self.new_pellet_layer(pellets)
+            self.pellet_layer_store = pellets.source
+            self.pellet_layer_generation = pellets.generation
+        else:
+            # Borrar solo lo que se comió desde el último frame
+            for index in pellets.eaten[self.pellet_layer_eaten:]:
+                cell_x = index % pellets.width
+                cell_y = index // pellets.width
+                rect = pygame.Rect(cell_x * CELL_SIZE, cell_y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+                self.pellet_layer.fill(BLACK, rect)
+                self.pellet_dirty_rects.append(rect)
+        self.pellet_layer_eaten = len(pellets.eaten)
+        self.screen.blit(self.pellet_layer, (0, 0))
+        self.draw_power_pellets()
+    
+    def draw_power_pellets(self):
+        # Power pellets parpadean
+        pellets = self.sim.pellets
+        self.power_pellets_shown = self.power_pellets_visible()
+        if self.power_pellets_shown:
+            camera_x, camera_y = self.camera()
+            for index in pellets.power_pellet_indices:
+                if pellets.kind_at(index):
+                    center = ((index % pellets.width) * CELL_SIZE + CELL_SIZE//2 - camera_x,
+                              (index // pellets.width) * CELL_SIZE + CELL_SIZE//2 - camera_y)
+                    pygame.draw.circle(self.screen, WHITE, center, 6)
+    
+    def power_pellets_visible(self):
+        # Parpadean cada 250 ms; con la calidad reducida se ven siempre
+        return not self.quality.blink or self.time_ms() % 500 < 250
+    
+    def time_ms(self):
+        # Reloj de las animaciones que no dependen de la simulación
+        if self.offscreen:
+            return self.sim.ticks * 1000 // TICK_RATE
+        return pygame.time.get_ticks()
+    
+    def save_positions(self):
+        # Posiciones antes de un tick, para interpolar al dibujar
+        self.previous_sim = self.sim
+        self.previous_positions = [(entity.x, entity.y) for entity in [self.sim.pacman, *self.sim.ghosts]]
+    
+    def sprite_positions(self):
+        """(entidad, x, y) de lo que se dibuja, interpolando entre el tick anterior y el actual"""
+        entities = [self.sim.pacman, *self.sim.ghosts]
+        alpha = self.interpolation
+        positions = []
+        if self.quality.interpolate and self.previous_sim is self.sim and alpha < 1:
+            for entity, (previous_x, previous_y) in zip(entities, self.previous_positions):
+                dx = entity.x - previous_x
+                dy = entity.y - previous_y
+                # Sin interpolar saltos (túnel, reaparición tras morir o ser comido)
+                if abs(dx) > CELL_SIZE or abs(dy) > CELL_SIZE:
+                    positions.append((entity, entity.x, entity.y))
+                else:
+                    positions.append((entity, previous_x + dx * alpha, previous_y + dy * alpha))
+        else:
+            positions = [(entity, entity.x, entity.y) for entity in entities]
+        
+        if self.sim.bonus_fruit:
+            positions.append((self.sim.bonus_fruit, self.sim.bonus_fruit.x, self.sim.bonus_fruit.y))
+        return positions
+    
+    def draw_sprites(self, positions):
+        camera_x, camera_y = self.camera()
+        simple = self.quality.simple_sprites
+        for entity, x, y in positions:
+            entity.draw(self.screen, (x - camera_x, y - camera_y), simple)
+    
+    def sprite_rects(self, positions):
+        # Celda de cada entidad, con un píxel de margen por las posiciones fraccionarias
+        return [pygame.Rect(int(x) - 1, int(y) - 1, CELL_SIZE + 2, CELL_SIZE + 2)
+                for _, x, y in positions]
+    
+    def hud_items(self):
+        # (campo, fuente, texto, color, ancla, posición)
+        items = [
+            ("score", self.font, f"SCORE: {self.sim.score}", YELLOW, "topleft", (10, SCREEN_HEIGHT - 90)),
+            ("lives", self.font, f"LIVES: {self.sim.lives}", YELLOW, "topleft", (10, SCREEN_HEIGHT - 50)),
+            ("title", self.font, "PACMAN VINTAGE", YELLOW, "center", (SCREEN_WIDTH//2, SCREEN_HEIGHT - 70)),
+        ]
+        
+        # Indicador de power pellet
+        if self.sim.power_pellet_mode:
+            items.append(("power", self.small_font, f"POWER MODE: {self.sim.power_pellet_timer // 60 + 1}s",
+                          CYAN, "topleft", (SCREEN_WIDTH - 200, SCREEN_HEIGHT - 90)))
+        
+        # Mostrar puntos de fruta bonus
+        if self.sim.bonus_fruit:
+            items.append(("bonus", self.small_font, f"BONUS: {self.sim.bonus_fruit.fruit_type['points']}",
+                          self.sim.bonus_fruit.fruit_type['color'], "topleft", (SCREEN_WIDTH - 200, SCREEN_HEIGHT - 50)))
         
-        for pellet in self.power_pellets:
-            # Power pellets parpadean
-            if pygame.time.get_ticks() % 500 < 250:
-                pygame.draw.circle(self.screen, WHITE, pellet, 6)
+        # Mensajes de fin de partida, sobre el laberinto con fondo negro
+        if self.sim.game_over:
+            items.append(("game_over", self.font, "GAME OVER - Press R to Restart", RED,
+                          "center", (SCREEN_WIDTH//2, SCREEN_HEIGHT//2)))
+        if self.sim.win:
+            items.append(("win", self.font, "YOU WIN! - Press R to Restart", GREEN,
+                          "center", (SCREEN_WIDTH//2, SCREEN_HEIGHT//2)))
+        return items
+    
+    def draw_hud_item(self, item):
+        # Devuelve el rectángulo que ocupa en pantalla
+        key, font, text, color, anchor, position = item
+        surface = self.text_cache.render(font, text, color)
+        rect = surface.get_rect(**{anchor: position})
+        if key in ("game_over", "win"):
+            rect = rect.inflate(20, 10)
+            pygame.draw.rect(self.screen, BLACK, rect)
+            self.screen.blit(surface, surface.get_rect(center=rect.center))
+        else:
+            self.screen.blit(surface, rect)
+        return rect
     
     def draw_ui(self):
-        # Puntuación
-        score_text = self.font.render(f"SCORE: {self.score}", True, YELLOW)
-        self.screen.blit(score_text, (10, SCREEN_HEIGHT - 90))
+        self.drawn_hud = {}
+        for item in self.hud_items():
+            self.drawn_hud[item[0]] = (item[2], item[3], self.draw_hud_item(item))
+    
+    def draw_frame(self):
+        """Dibuja el frame completo (el fondo con las paredes cubre la pantalla entera)"""
+        profiler = self.active_profiler
+        positions = self.sprite_positions()
+        self.update_viewport(positions)
+        self.draw_maze()
+        if profiler:
+            profiler.lap("draw_maze")
+        self.draw_dots()
+        if profiler:
+            profiler.lap("draw_dots")
+        self.draw_sprites(positions)
+        if profiler:
+            profiler.lap("sprites")
+        self.draw_ui()
+        if profiler:
+            profiler.lap("ui")
+        self.drawn_sprite_rects = self.sprite_rects(positions)
+    
+    def draw_frame_dirty(self):
+        """Redibuja solo lo que cambió desde el último frame y devuelve esos rectángulos"""
+        # Mantener las capas al día (puntos comidos desde el último frame).
+        # Con cámara todo se desplaza al moverse Pacman: se redibuja entero
+        if (self.viewport_grid is not self.sim.grid or self.viewport or
+                self.wall_layer_grid is not self.sim.grid or not self.pellet_layer_current()):
+            self.draw_frame()
+            return [self.screen.get_rect()]
+        self.draw_dots_dirty()
         
-        # Vidas
-        lives_text = self.font.render(f"LIVES: {self.lives}", True, YELLOW)
-        self.screen.blit(lives_text, (10, SCREEN_HEIGHT - 50))
+        positions = self.sprite_positions()
+        sprite_rects = self.sprite_rects(positions)
+        dirty = self.drawn_sprite_rects + sprite_rects + self.pellet_dirty_rects
         
-        # Título
-        title_text = self.font.render("PACMAN VINTAGE", True, YELLOW)
-        title_rect = title_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT - 70))
-        self.screen.blit(title_text, title_rect)
+        # Power pellets que cambiaron de estado de parpadeo
+        if self.power_pellets_visible() != self.power_pellets_shown:
+            pellets = self.sim.pellets
+            for index in pellets.power_pellet_indices:
+                dirty.append(pygame.Rect((index % pellets.width) * CELL_SIZE,
+                                         (index // pellets.width) * CELL_SIZE, CELL_SIZE, CELL_SIZE))
         
-        # Indicador de power pellet
-        if self.power_pellet_mode:
-            power_text = self.small_font.render(f"POWER MODE: {self.power_pellet_timer // 60 + 1}s", True, CYAN)
-            self.screen.blit(power_text, (SCREEN_WIDTH - 200, SCREEN_HEIGHT - 90))
+        # Campos del HUD que cambiaron, desaparecieron o quedan debajo de algo que se redibuja
+        items = self.hud_items()
+        redraw = []
+        keys = set()
+        for item in items:
+            key, _, text, color = item[:4]
+            keys.add(key)
+            drawn = self.drawn_hud.get(key)
+            if drawn is None or drawn[:2] != (text, color) or drawn[2].collidelist(dirty) != -1:
+                redraw.append(item)
+                if drawn is not None:
+                    dirty.append(drawn[2])
+        for key in list(self.drawn_hud):
+            if key not in keys:
+                dirty.append(self.drawn_hud.pop(key)[2])
         
-        # Mostrar puntos de fruta bonus
-        if self.bonus_fruit:
-            fruit_text = self.small_font.render(f"BONUS: {self.bonus_fruit.fruit_type['points']}", True, self.bonus_fruit.fruit_type['color'])
-            self.screen.blit(fruit_text, (SCREEN_WIDTH - 200, SCREEN_HEIGHT - 50))
+        # Restaurar el fondo (paredes y puntos) solo en esas zonas
+        for rect in dirty:
+            self.screen.blit(self.wall_layer, rect, rect)
+            self.screen.blit(self.pellet_layer, rect, rect)
         
-        if self.game_over:
-            game_over_text = self.font.render("GAME OVER - Press R to Restart", True, RED)
-            text_rect = game_over_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            pygame.draw.rect(self.screen, BLACK, text_rect.inflate(20, 10))
-            self.screen.blit(game_over_text, text_rect)
+        self.draw_power_pellets()
+        self.draw_sprites(positions)
+        for item in redraw:
+            rect = self.draw_hud_item(item)
+            self.drawn_hud[item[0]] = (item[2], item[3], rect)
+            dirty.append(rect)
         
-        if self.win:
-            win_text = self.font.render("YOU WIN! - Press R to Restart", True, GREEN)
-            text_rect = win_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
-            pygame.draw.rect(self.screen, BLACK, text_rect.inflate(20, 10))
-            self.screen.blit(win_text, text_rect)
+        self.drawn_sprite_rects = sprite_rects
+        return dirty
+    
+    def draw_dots_dirty(self):
+        # Igual que draw_dots pero sin volcar la capa entera en pantalla
+        pellets = self.sim.pellets
+        self.pellet_dirty_rects = []
+        for index in pellets.eaten[self.pellet_layer_eaten:]:
+            rect = pygame.Rect((index % pellets.width) * CELL_SIZE,
+                               (index // pellets.width) * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+            self.pellet_layer.fill(BLACK, rect)
+            self.pellet_dirty_rects.append(rect)
+        self.pellet_layer_eaten = len(pellets.eaten)
+    
+    def present(self, interpolation=1.0):
+        """Dibuja y envía el frame a la pantalla; cuenta los píxeles enviados.
+        
+        interpolation: fracción del tick actual ya transcurrida (1 = sin interpolar)
+        """
+        self.interpolation = interpolation
+        profiler = self.active_profiler
+        if (self.dirty_rects or self.quality.dirty_rects) and not self.full_redraw:
+            screen_rect = self.screen.get_rect()
+            rects = self.draw_frame_dirty()
+            if profiler:
+                profiler.lap("draw_dirty")
+                if profiler.overlay:
+                    # El panel es opaco y se redibuja entero cada frame
+                    rects.append(self.draw_profiler_overlay())
+            rects = [rect.clip(screen_rect) for rect in rects]
+            pygame.display.update(rects)
+            self.pixels_pushed = sum(rect.width * rect.height for rect in rects)
+        else:
+            self.draw_frame()
+            if profiler and profiler.overlay:
+                self.draw_profiler_overlay()
+            pygame.display.flip()
+            self.pixels_pushed = SCREEN_WIDTH * SCREEN_HEIGHT
+            self.full_redraw = False
+        if profiler:
+            profiler.lap("flip")
+        self.total_pixels_pushed += self.pixels_pushed
+    
+    def render_frame(self):
+        """Dibuja el frame entero del tick actual, sin interpolar ni enviarlo a la ventana"""
+        self.interpolation = 1.0
+        self.draw_frame()
+        return self.screen
+    
+    def draw_profiler_overlay(self):
+        if self.profiler_font is None:
+            self.profiler_font = pygame.font.SysFont("couriernew,dejavusansmono,monospace", 14)
+        rect = self.profiler.draw_overlay(self.screen, self.profiler_font)
+        # Si el panel cambia de tamaño, lo que tapaba antes hay que redibujarlo
+        if self.profiler_rect is not None and rect != self.profiler_rect:
+            self.full_redraw = True
+        self.profiler_rect = rect
+        self.active_profiler.lap("overlay")
+        return rect
+    
+    def update_profiling(self):
+        # Se llama entre frames, para que ninguna fase quede a medias
+        self.active_profiler = self.profiler if self.profiler.enabled else None
+        # El perfilador no es seguro entre hilos: con SimulationThread solo mide el dibujado
+        if not self.sim_thread:
+            self.sim.profiler = self.active_profiler
+    
+    def toggle_profiler_overlay(self):
+        self.profiler.toggle_overlay()
+        self.full_redraw = True
+    
+    def start_trace(self, path=None, frames=None):
+        path = path or time.strftime("pacman-trace-%Y%m%d-%H%M%S.json")
+        if frames is None:
+            self.profiler.start_trace(path)
+        else:
+            self.profiler.start_trace(path, frames)
+    
+    def set_quality(self, quality):
+        self.quality = quality
+        self.full_redraw = True
+    
+    def update_quality(self, frame_seconds):
+        # Tiempo de trabajo del frame (sin la espera del reloj) al regulador de calidad
+        governor = self.quality_governor
+        reason = governor.record(frame_seconds * 1000)
+        if reason:
+            self.set_quality(governor.quality)
+        elif self.profiler.notes:
+            return
+        # Las líneas del panel solo cambian con el nivel: se rehacen en el primer
+        # frame y tras cada cambio, que queda en governor.changes con su motivo
+        self.profiler.notes = [governor.describe()]
+        if reason:
+            self.profiler.notes.append(f"frame {governor.frames}: {reason}")
+    
+    def toggle_dirty_rects(self):
+        self.dirty_rects = not self.dirty_rects
+        self.full_redraw = True
+    
+    def reset(self, seed=None):
+        """Partida nueva sin tocar ventana, fuentes ni cachés: solo el estado del juego"""
+        if self.sim_thread:
+            # La partida es del hilo de la simulación: se le pide que la reinicie
+            self.sim_thread.commands.append(("reset", seed))
+        else:
+            if self.recorder:
+                self.recorder.finish()
+            self.sim.reset(seed)
+            if self.recorder:
+                self.recorder.start(self.sim)
+        self.previous_sim = None  # Nada que interpolar con la partida anterior
+        self.full_redraw = True
     
     def restart_game(self):
-        self.__init__()
+        self.reset()
+    
+    def change_direction(self, direction):
+        # Todas las entradas del jugador pasan por aquí para poder grabarlas
+        if self.sim_thread:
+            self.sim_thread.commands.append(("direction", direction))
+            return
+        # Acabada la partida ya no hay ticks: una flecha no se graba ni se
+        # aplica, porque la repetición no la reproduciría tras el último tick
+        if self.sim.done:
+            return
+        if self.recorder:
+            self.recorder.record_input(direction)
+        self.sim.change_direction(direction)
+    
+    def handle_events(self):
+        # Devuelve False al cerrar la ventana
+        running = True
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RIGHT:
+                    self.change_direction(0)
+                elif event.key == pygame.K_DOWN:
+                    self.change_direction(1)
+                elif event.key == pygame.K_LEFT:
+                    self.change_direction(2)
+                elif event.key == pygame.K_UP:
+                    self.change_direction(3)
+                elif event.key == pygame.K_r and self.sim.done:
+                    self.restart_game()
+                elif event.key == pygame.K_F2:
+                    self.toggle_dirty_rects()
+                elif event.key == pygame.K_F3:
+                    self.toggle_profiler_overlay()
+                elif event.key == pygame.K_F4:
+                    self.start_trace()
+        return running
     
     def run(self):
+        # Paso fijo: la simulación avanza a TICK_RATE ticks por segundo pase
+        # lo que pase con el dibujado, que va a render_fps (0 = sin límite)
+        if self.threaded:
+            self.run_threaded()
+            return
+        tick_seconds = 1.0 / TICK_RATE
+        accumulator = 0.0
+        previous_time = time.perf_counter()
         running = True
+        self.update_profiling()
         
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RIGHT:
-                        self.pacman.change_direction(0)
-                    elif event.key == pygame.K_DOWN:
-                        self.pacman.change_direction(1)
-                    elif event.key == pygame.K_LEFT:
-                        self.pacman.change_direction(2)
-                    elif event.key == pygame.K_UP:
-                        self.pacman.change_direction(3)
-                    elif event.key == pygame.K_r and (self.game_over or self.win):
-                        self.restart_game()
+            profiler = self.active_profiler
+            if profiler:
+                profiler.begin_frame()
+            now = time.perf_counter()
+            accumulator += now - previous_time
+            previous_time = now
             
-            if not self.game_over and not self.win:
-                # Actualizar juego
-                self.pacman.update()
-                for ghost in self.ghosts:
-                    ghost.update(self.pacman.x, self.pacman.y)
-                
-                # Manejar modo power pellet
-                if self.power_pellet_mode:
-                    self.power_pellet_timer -= 1
-                    if self.power_pellet_timer <= 0:
-                        self.power_pellet_mode = False
-                
-                # Manejar spawn de frutas bonus
-                self.fruit_spawn_timer += 1
-                if self.fruit_spawn_timer >= self.fruit_spawn_interval:
-                    self.spawn_bonus_fruit()
-                    self.fruit_spawn_timer = 0
-                
-                # Actualizar fruta bonus
-                if self.bonus_fruit:
-                    if not self.bonus_fruit.update():
-                        self.bonus_fruit = None
-                
-                self.check_dot_collision()
-                self.check_ghost_collision()
+            running = self.handle_events()
+            if profiler:
+                profiler.lap("input")
             
-            # Dibujar todo
-            self.screen.fill(BLACK)
-            self.draw_maze()
-            self.draw_dots()
-            self.pacman.draw(self.screen)
-            for ghost in self.ghosts:
-                ghost.draw(self.screen)
+            # Actualizar juego
+            ticks = 0
+            while accumulator >= tick_seconds and ticks < MAX_TICKS_PER_FRAME:
+                self.save_positions()
+                self.sim.step()
+                if self.recorder:
+                    self.recorder.after_step()
+                accumulator -= tick_seconds
+                ticks += 1
             
-            # Dibujar fruta bonus
-            if self.bonus_fruit:
-                self.bonus_fruit.draw(self.screen)
+            # Si un frame tardó demasiado no se intenta recuperar todo el retraso
+            if accumulator >= tick_seconds:
+                self.dropped_time += accumulator - tick_seconds
+                accumulator = tick_seconds
             
-            self.draw_ui()
+            # Dibujar todo
+            self.present(min(accumulator / tick_seconds, 1.0))
+            self.end_frame(now)
+        
+        self.quit()
+    
+    def run_threaded(self):
+        """Como run, pero la partida avanza en un SimulationThread y aquí solo se dibuja.
+        
+        Un dibujado lento ya no frena la simulación: blit, draw y flip sueltan
+        el GIL mientras trabajan.
+        """
+        tick_seconds = 1.0 / TICK_RATE
+        self.sim_thread = SimulationThread(self.sim, self.recorder)
+        self.sim_thread.start()
+        running = True
+        self.update_profiling()
+        
+        while running:
+            profiler = self.active_profiler
+            if profiler:
+                profiler.begin_frame()
+            now = time.perf_counter()
+            running = self.handle_events()
+            if profiler:
+                profiler.lap("input")
             
-            pygame.display.flip()
-            self.clock.tick(60)
+            # Última copia publicada; se interpola desde la anterior según el
+            # tiempo que lleva publicada
+            previous, current, published_at = self.sim_thread.published
+            self.sim = self.previous_sim = current
+            self.previous_positions = [(entity.x, entity.y) for entity in [previous.pacman, *previous.ghosts]]
+            self.present(min((time.perf_counter() - published_at) / tick_seconds, 1.0))
+            if self.sim_thread.error:
+                raise self.sim_thread.error
+            self.end_frame(now)
+        
+        self.sim_thread.stop()
+        self.sim = self.sim_thread.sim
+        self.dropped_time = self.sim_thread.dropped_time
+        self.sim_thread = None
+        self.quit()
+    
+    def end_frame(self, frame_start):
+        # Calidad, espera del reloj y cierre del frame en el perfilador
+        if self.quality_governor:
+            self.update_quality(time.perf_counter() - frame_start)
+        if self.quality.fps_divisor > 1:
+            self.clock.tick((self.render_fps or TICK_RATE) // self.quality.fps_divisor)
+        else:
+            self.clock.tick(self.render_fps)
         
+        profiler = self.active_profiler
+        if profiler:
+            profiler.lap("wait")
+            profiler.end_frame()
+        self.update_profiling()
+    
+    def quit(self):
+        if self.recorder:
+            self.recorder.finish()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    import argparse
+    parser = argparse.ArgumentParser(description="Pacman Vintage Arcade")
+    parser.add_argument("--fps", type=int, default=60, help="límite de frames por segundo al dibujar (0 = sin límite)")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--record", metavar="DIR", help="guardar una repetición de cada partida en DIR")
+    output.add_argument("--spectate", metavar="PUERTO", type=int,
+                        help="retransmitir la partida a espectadores (spectator.py watch HOST:PUERTO)")
+    parser.add_argument("--spectate-host", default="127.0.0.1",
+                        help="dirección donde escucha --spectate (0.0.0.0 = todas las interfaces)")
+    # Las repeticiones y los espectadores rehacen la partida con los cuatro fantasmas clásicos
+    output.add_argument("--swarm", metavar="N", type=int, help="jugar contra N fantasmas (swarm.py, requiere NumPy)")
+    parser.add_argument("--quality", type=int, choices=range(len(QUALITY_LEVELS)), default=None,
+                        help="fijar la calidad de dibujado (0 = completa); por defecto se adapta al tiempo de frame")
+    parser.add_argument("--threaded", action="store_true",
+                        help="avanzar la simulación en otro hilo y dibujar en este")
+    parser.add_argument("--trace", metavar="PATH", help="grabar los primeros frames como traza de Chrome/Perfetto")
+    parser.add_argument("--trace-frames", type=int, default=300, help="frames que graba --trace")
+    level = parser.add_mutually_exclusive_group()
+    level.add_argument("--maze", metavar="ANCHOxALTO", help="jugar en un laberinto generado (mazegen.py)")
+    level.add_argument("--levels", metavar="PATH", help="paquete de niveles (levels.py), compilado o en texto")
+    parser.add_argument("--maze-seed", type=int, default=None, help="semilla del laberinto generado")
+    parser.add_argument("--level", default="0", help="número o nombre del nivel de --levels")
+    args = parser.parse_args()
+    
+    recorder = None
+    if args.record:
+        from replay import SessionRecorder
+        recorder = SessionRecorder(args.record)
+    elif args.spectate:
+        from spectator import SpectatorBroadcast
+        recorder = SpectatorBroadcast(args.spectate, host=args.spectate_host)
+    
+    sim = None
+    grid = MAZE_GRID
+    if args.maze:
+        from mazegen import generate_grid
+        width, height = (int(size) for size in args.maze.lower().split("x"))
+        grid = generate_grid(width, height, args.maze_seed)
+    elif args.levels:
+        from levels import LevelPack
+        grid = LevelPack.open(args.levels).grid(args.level)
+    if args.swarm:
+        from swarm import SwarmSimulation
+        sim = SwarmSimulation(args.swarm, grid=grid)
+    elif grid is not MAZE_GRID:
+        sim = Simulation(grid=grid)
+    
+    game = Game(sim, render_fps=args.fps, recorder=recorder, quality=args.quality,
+                threaded=args.threaded)
+    if args.trace:
+        game.start_trace(args.trace, args.trace_frames)
+    try:
+        game.run()
+    finally:
+        # Las trazas se avisan al salir; en la partida las muestra el panel (F3)
+        for trace_path in game.profiler.saved_traces:
+            print(f"Traza guardada en {trace_path}")
@@ -0,0 +1,163 @@
+"""Perfilado por fases de cada frame de Game.run.
+
+El bucle marca el final de cada fase con lap(nombre): el tiempo desde la marca
+anterior se suma a esa fase. Con el perfilado apagado Game y Simulation no
+llaman a nada (solo comprueban si hay perfilador activo).
+
+- F3: panel con p50/p99 de cada fase en los últimos frames y gráfica del tiempo de frame
+- F4: graba los próximos frames en un JSON de Chrome trace / Perfetto
+"""
+import json
+import time
+from collections import deque
+
+import pygame
+
+HISTORY_FRAMES = 240  # Frames que entran en las estadísticas y la gráfica
+TRACE_FRAMES = 300  # Frames que se graban con F4
+OVERLAY_REFRESH = 15  # El texto del panel se regenera cada tantos frames
+
+# Orden en el panel; las fases que no estén aquí van al final
+PHASES = ("input", "pacman", "ghosts", "timers", "collision",
+          "draw_maze", "draw_dots", "sprites", "ui", "draw_dirty", "overlay", "flip", "wait")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class FrameProfiler:
+    """Tiempos por fase de cada frame, estadísticas móviles y exportación de trazas"""
+    def __init__(self, history=HISTORY_FRAMES):
+        self.history = history
+        self.overlay = False
+        self.frame_start = 0.0
+        self.last = 0.0
+        self.current = {}  # fase -> segundos en el frame en curso
+        self.phase_history = {}  # fase -> deque de ms por frame
+        self.frame_times = deque(maxlen=history)  # ms por frame
+        self.frames = 0
+        self.notes = []  # Líneas extra para el panel (p. ej. la calidad de dibujado)
+
+        # Traza en curso: eventos (fase, inicio, duración) en segundos
+        self.trace_path = None
+        self.trace_frames_left = 0
+        self.trace_events = []
+        self.trace_origin = 0.0
+        self.saved_traces = []  # Rutas ya escritas, para el panel y la salida del juego
+
+        self.overlay_surface = None
+        self.overlay_frame = -OVERLAY_REFRESH
+
+    @property
+    def enabled(self):
+        return self.overlay or self.trace_path is not None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+
+    def start_trace(self, path, frames=TRACE_FRAMES):
+        """Graba los próximos frames y al terminar escribe la traza en path"""
+        self.trace_path = path
+        self.trace_frames_left = frames
+        self.trace_events = []
+        self.trace_origin = time.perf_counter()
+
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+        self.current = {}
+
+    def lap(self, phase):
+        # Tiempo desde la marca anterior para esta fase
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + now - self.last
+        if self.trace_path is not None:
+            self.trace_events.append((phase, self.last, now - self.last))
+        self.last = now
+
+    def end_frame(self):
+        """Cierra el frame; devuelve la ruta de la traza si se acaba de escribir"""
+        now = time.perf_counter()
+        self.frames += 1
+        self.frame_times.append((now - self.frame_start) * 1e3)
+        for phase in set(self.phase_history) | set(self.current):
+            if phase not in self.phase_history:
+                self.phase_history[phase] = deque(maxlen=self.history)
+            self.phase_history[phase].append(self.current.get(phase, 0.0) * 1e3)
+
+        if self.trace_path is None:
+            return None
+        self.trace_events.append(("frame", self.frame_start, now - self.frame_start))
+        self.trace_frames_left -= 1
+        if self.trace_frames_left > 0:
+            return None
+        path = self.trace_path
+        self.write_trace(path)
+        self.saved_traces.append(path)
+        self.trace_path = None
+        self.trace_events = []
+        return path
+
+    def stats(self):
+        """[(fase, p50 ms, p99 ms)] en el orden de PHASES"""
+        order = {phase: index for index, phase in enumerate(PHASES)}
+        rows = []
+        for phase in sorted(self.phase_history, key=lambda p: (order.get(p, len(order)), p)):
+            values = sorted(self.phase_history[phase])
+            rows.append((phase, percentile(values, 0.5), percentile(values, 0.99)))
+        return rows
+
+    def write_trace(self, path):
+        # Formato "Trace Event" de Chrome; Perfetto y chrome://tracing lo abren.
+        # Las fases quedan anidadas dentro de su frame
+        events = [{"name": name, "ph": "X", "pid": 1, "tid": 1,
+                   "ts": (start - self.trace_origin) * 1e6, "dur": duration * 1e6}
+                  for name, start, duration in self.trace_events]
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": 1,
+                       "args": {"name": "Game.run"}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def draw_overlay(self, screen, font, budget_ms=1000 / 60):
+        """Dibuja el panel (opaco) y devuelve su rectángulo"""
+        if self.overlay_surface is None or self.frames - self.overlay_frame >= OVERLAY_REFRESH:
+            self.overlay_surface = self.render_overlay(font, budget_ms)
+            self.overlay_frame = self.frames
+        rect = self.overlay_surface.get_rect(topright=(screen.get_width() - 10, 10))
+        screen.blit(self.overlay_surface, rect)
+
+        # La gráfica se dibuja cada frame; la línea gris es el presupuesto de un tick
+        graph = pygame.Rect(rect.left + 8, rect.bottom - 58, rect.width - 16, 50)
+        pygame.draw.rect(screen, (0, 0, 0), graph)
+        scale = graph.height / (budget_ms * 2)
+        budget_y = graph.bottom - int(budget_ms * scale)
+        pygame.draw.line(screen, (90, 90, 90), (graph.left, budget_y), (graph.right - 1, budget_y))
+        times = list(self.frame_times)[-graph.width:]
+        for offset, value in enumerate(times):
+            height = min(int(value * scale), graph.height)
+            color = (0, 200, 0) if value <= budget_ms else (230, 60, 60)
+            x = graph.right - len(times) + offset
+            pygame.draw.line(screen, color, (x, graph.bottom - 1), (x, graph.bottom - height))
+        return rect
+
+    def render_overlay(self, font, budget_ms):
+        rows = self.stats()
+        frame_values = sorted(self.frame_times)
+        lines = [f"{'fase':10} {'p50':>6} {'p99':>6} ms",
+                 f"{'frame':10} {percentile(frame_values, 0.5):6.2f} {percentile(frame_values, 0.99):6.2f}"]
+        lines += [f"{phase:10} {p50:6.2f} {p99:6.2f}" for phase, p50, p99 in rows]
+        lines += self.notes
+        if self.trace_path is not None:
+            lines.append(f"grabando traza: {self.trace_frames_left}")
+        elif self.saved_traces:
+            lines.append(f"traza: {self.saved_traces[-1]}")
+
+        line_height = font.get_linesize()
+        width = max(font.size(line)[0] for line in lines) + 16
+        surface = pygame.Surface((max(width, 200), len(lines) * line_height + 16 + 66))
+        surface.fill((20, 20, 40))
+        for index, line in enumerate(lines):
+            surface.blit(font.render(line, True, (220, 220, 220)), (8, 8 + index * line_height))
+        return surface
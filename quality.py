@@ -0,0 +1,95 @@
+"""Calidad de dibujado adaptativa: baja de nivel cuando los frames no caben en el presupuesto.
+
+Game.run pasa a QualityGovernor el tiempo de trabajo de cada frame (todo
+menos la espera de clock.tick). Si el p90 de los últimos frames pasa del 90 %
+del presupuesto (1 / render_fps) se baja un nivel; si durante unos segundos
+queda por debajo de la mitad se sube uno. Cada cambio queda anotado con su
+motivo en changes. Si una subida se deshace enseguida, la siguiente espera el
+doble, para no oscilar entre dos niveles.
+
+Los niveles van de menos a más visibles: los rectángulos sucios no cambian la
+imagen; luego se deja de interpolar y de hacer parpadear los power pellets;
+después los sprites pasan a formas simples sin alfa (blits con colorkey, un
+40 % más baratos), y por último se dibuja a la mitad de frames por segundo.
+La simulación sigue siempre a TICK_RATE ticks por segundo.
+"""
+from collections import deque, namedtuple
+
+from profiler import percentile
+
+QualityLevel = namedtuple("QualityLevel", ["name", "dirty_rects", "interpolate", "blink",
+                                           "simple_sprites", "fps_divisor"])
+
+QUALITY_LEVELS = (
+    QualityLevel("completa", False, True, True, False, 1),
+    QualityLevel("rectángulos sucios", True, True, True, False, 1),
+    QualityLevel("sin interpolar ni parpadeo", True, False, False, False, 1),
+    QualityLevel("sprites simples", True, False, False, True, 1),
+    QualityLevel("mitad de frames", True, False, False, True, 2),
+)
+
+DOWNGRADE_FRAMES = 30  # Frames que se miran para bajar de nivel
+UPGRADE_FRAMES = 180  # Frames con margen antes de subir (se duplica si una subida falla)
+MAX_UPGRADE_FRAMES = 60 * 60
+HIGH_WATER = 0.9  # Fracción del presupuesto a partir de la cual se baja
+LOW_WATER = 0.5  # Fracción del presupuesto por debajo de la cual se sube
+FRAME_PERCENTILE = 0.9
+MAX_CHANGES = 32  # Cambios que se guardan en changes
+
+
+class QualityGovernor:
+    """Elige el nivel de QUALITY_LEVELS según los tiempos de frame recientes"""
+    def __init__(self, budget_ms, level=0, max_level=len(QUALITY_LEVELS) - 1):
+        self.budget_ms = budget_ms
+        self.level = level
+        self.max_level = max_level
+        self.frame_times = deque(maxlen=UPGRADE_FRAMES)  # ms de trabajo por frame en el nivel actual
+        self.upgrade_frames = UPGRADE_FRAMES
+        self.frames = 0
+        self.frames_at_level = 0
+        self.last_was_upgrade = False
+        self.changes = deque(maxlen=MAX_CHANGES)  # (frame, nivel anterior, nivel nuevo, motivo)
+
+    @property
+    def quality(self):
+        return QUALITY_LEVELS[self.level]
+
+    def describe(self):
+        return f"calidad {self.level}/{self.max_level} ({self.quality.name})"
+
+    def record(self, frame_ms):
+        """Añade el tiempo de trabajo de un frame; devuelve el motivo si cambia de nivel"""
+        self.frames += 1
+        self.frames_at_level += 1
+        self.frame_times.append(frame_ms)
+
+        if self.level < self.max_level and self.frames_at_level >= DOWNGRADE_FRAMES:
+            recent = sorted(list(self.frame_times)[-DOWNGRADE_FRAMES:])
+            slow = percentile(recent, FRAME_PERCENTILE)
+            limit = self.budget_ms * HIGH_WATER
+            if slow > limit:
+                # Una subida que no aguanta hace esperar más a la siguiente
+                if self.last_was_upgrade and self.frames_at_level < self.upgrade_frames:
+                    self.upgrade_frames = min(self.upgrade_frames * 2, MAX_UPGRADE_FRAMES)
+                else:
+                    self.upgrade_frames = UPGRADE_FRAMES
+                return self.change(self.level + 1, False,
+                                   f"p90 {slow:.1f} ms > {limit:.1f} ms en {len(recent)} frames")
+
+        if self.level > 0 and self.frames_at_level >= self.upgrade_frames:
+            recent = sorted(self.frame_times)
+            slow = percentile(recent, FRAME_PERCENTILE)
+            limit = self.budget_ms * LOW_WATER
+            if slow < limit:
+                return self.change(self.level - 1, True,
+                                   f"p90 {slow:.1f} ms < {limit:.1f} ms en {len(recent)} frames")
+        return None
+
+    def change(self, level, upgrade, reason):
+        self.changes.append((self.frames, self.level, level, reason))
+        self.level = level
+        self.last_was_upgrade = upgrade
+        # Los tiempos del nivel anterior ya no sirven
+        self.frame_times.clear()
+        self.frames_at_level = 0
+        return reason
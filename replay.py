@@ -0,0 +1,362 @@
+"""Grabación y reproducción de partidas.
+
+Un archivo de repetición guarda la semilla de la partida, el laberinto, las
+pulsaciones de dirección con el tick en que llegaron y cada cierto tiempo una
+instantánea del estado completo. Reproducir es volver a simular sin pantalla a toda velocidad;
+para saltar a un tick se parte de la instantánea anterior más cercana.
+
+    python pacman.py --record replays/
+    python replay.py replays/partida.pmr --verify
+    python replay.py replays/partida.pmr --watch --seek 3600
+    python replay.py --check
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import Simulation, MAZE_GRID, TICK_RATE, grid_from_bytes
+
+SNAPSHOT_INTERVAL = TICK_RATE * 30  # Una instantánea cada 30 segundos de juego
+
+FILE_MAGIC = b"PMREPLAY"
+FILE_VERSION = 3  # 2: posiciones en punto fijo; 3: con el laberinto (MazeGrid.to_bytes)
+# versión, semilla, hash del laberinto, último tick, puntos finales,
+# resumen del estado final, nº de entradas, bytes de entradas, nº de instantáneas
+HEADER = struct.Struct("<BQ20sIi16sIII")
+MAZE_SIZE = struct.Struct("<I")  # Bytes del laberinto, justo después de la cabecera
+SNAPSHOT_ENTRY = struct.Struct("<II")  # tick, longitud
+
+
+def state_digest(sim):
+    return hashlib.blake2b(sim.snapshot(), digest_size=16).digest()
+
+
+def encode_inputs(inputs):
+    """Entradas (tick, dirección) como varints de (ticks desde la anterior << 2 | dirección)"""
+    out = bytearray()
+    last_tick = 0
+    for tick, direction in inputs:
+        value = (tick - last_tick) << 2 | direction
+        last_tick = tick
+        while value >= 0x80:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_inputs(data, count):
+    inputs = []
+    tick = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            tick += value >> 2
+            inputs.append((tick, value & 3))
+            value = shift = 0
+    if len(inputs) != count or shift:
+        raise ValueError("entradas de la repetición corruptas")
+    return inputs
+
+
+class Replay:
+    """Semilla, entradas por tick e instantáneas de una partida grabada"""
+    def __init__(self, seed, maze_hash, inputs=(), snapshots=(), final_tick=0,
+                 final_score=0, final_digest=bytes(16), grid=None):
+        self.seed = seed
+        self.maze_hash = maze_hash
+        self.grid = grid  # Laberinto de la partida; None en archivos de antes de la versión 3
+        self.inputs = list(inputs)  # (tick, dirección) en orden
+        self.input_ticks = [tick for tick, _ in self.inputs]
+        self.snapshots = list(snapshots)  # (tick, bytes de Simulation.snapshot) en orden
+        self.snapshot_ticks = [tick for tick, _ in self.snapshots]
+        self.final_tick = final_tick
+        self.final_score = final_score
+        self.final_digest = final_digest
+
+    def save(self, path, exclusive=False):
+        """Escribe el archivo; con exclusive=True falla (FileExistsError) si ya existe"""
+        inputs = encode_inputs(self.inputs)
+        maze = (self.grid or MAZE_GRID).to_bytes()
+        with open(path, "xb" if exclusive else "wb") as f:
+            f.write(FILE_MAGIC)
+            f.write(HEADER.pack(FILE_VERSION, self.seed, bytes.fromhex(self.maze_hash),
+                                self.final_tick, self.final_score, self.final_digest,
+                                len(self.inputs), len(inputs), len(self.snapshots)))
+            f.write(MAZE_SIZE.pack(len(maze)))
+            f.write(maze)
+            f.write(inputs)
+            for tick, data in self.snapshots:
+                f.write(SNAPSHOT_ENTRY.pack(tick, len(data)))
+                f.write(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{path} no es un archivo de repetición")
+        offset = len(FILE_MAGIC)
+        (version, seed, maze_hash, final_tick, final_score, final_digest,
+         input_count, input_size, snapshot_count) = HEADER.unpack_from(data, offset)
+        if version not in (2, FILE_VERSION):
+            raise ValueError(f"versión de repetición no soportada: {version}")
+        offset += HEADER.size
+        grid = None
+        if version >= 3:
+            size, = MAZE_SIZE.unpack_from(data, offset)
+            offset += MAZE_SIZE.size
+            grid = grid_from_bytes(data[offset:offset + size])
+            offset += size
+            if grid.maze_hash() != maze_hash.hex():
+                raise ValueError("el laberinto de la repetición no coincide con su hash")
+        inputs = decode_inputs(data[offset:offset + input_size], input_count)
+        offset += input_size
+        snapshots = []
+        for _ in range(snapshot_count):
+            tick, size = SNAPSHOT_ENTRY.unpack_from(data, offset)
+            offset += SNAPSHOT_ENTRY.size
+            snapshots.append((tick, data[offset:offset + size]))
+            offset += size
+        return cls(seed, maze_hash.hex(), inputs, snapshots, final_tick, final_score, final_digest, grid)
+
+    def simulation(self, grid=None):
+        """Partida nueva en el tick 0, por defecto en el laberinto grabado"""
+        grid = grid or self.grid or MAZE_GRID
+        if grid.maze_hash() != self.maze_hash:
+            raise ValueError("la repetición se grabó con otro laberinto")
+        return Simulation(seed=self.seed, grid=grid)
+
+    def seek(self, tick, grid=None):
+        """Partida en el tick pedido, partiendo de la instantánea anterior más cercana"""
+        tick = min(tick, self.final_tick)
+        sim = self.simulation(grid)
+        index = bisect.bisect_right(self.snapshot_ticks, tick) - 1
+        if index >= 0:
+            sim.restore(self.snapshots[index][1])
+        self.advance(sim, tick)
+        return sim
+
+    def advance(self, sim, until=None):
+        """Simula sin pantalla hasta el tick until (por defecto el final), aplicando las entradas grabadas"""
+        until = self.final_tick if until is None else min(until, self.final_tick)
+        inputs = self.inputs
+        ticks = self.input_ticks
+        index = bisect.bisect_left(ticks, sim.ticks)
+        while sim.ticks < until and not sim.done:
+            while index < len(ticks) and ticks[index] == sim.ticks:
+                sim.change_direction(inputs[index][1])
+                index += 1
+            sim.step()
+        return sim
+
+    def apply_final_inputs(self, sim):
+        """Aplica las entradas del último tick, que no llegan a ningún step
+        (una flecha justo antes de cerrar la ventana) pero sí cambian el estado
+        final grabado"""
+        index = bisect.bisect_left(self.input_ticks, self.final_tick)
+        for _, direction in self.inputs[index:]:
+            sim.change_direction(direction)
+        return sim
+
+    def verify(self, grid=None):
+        """Reproduce desde el principio y comprueba instantáneas y estado final.
+
+        Devuelve una lista de discrepancias (vacía si todo coincide).
+        """
+        sim = self.simulation(grid)
+        problems = []
+        for tick, data in self.snapshots:
+            self.advance(sim, tick)
+            if sim.snapshot() != data:
+                problems.append(f"la instantánea del tick {tick} no coincide")
+        self.advance(sim)
+        if sim.ticks == self.final_tick:
+            self.apply_final_inputs(sim)
+        if sim.ticks != self.final_tick:
+            problems.append(f"la partida terminó en el tick {sim.ticks}, no en el {self.final_tick}")
+        if sim.score != self.final_score:
+            problems.append(f"puntuación {sim.score}, se grabó {self.final_score}")
+        if state_digest(sim) != self.final_digest:
+            problems.append("el estado final no coincide")
+        return problems
+
+
+class ReplayRecorder:
+    """Graba una partida: entradas por tick e instantáneas periódicas"""
+    def __init__(self, sim, snapshot_interval=SNAPSHOT_INTERVAL):
+        if not isinstance(sim.seed, int) or not 0 <= sim.seed < 2**64:
+            raise ValueError("solo se pueden grabar partidas con semilla entera de 64 bits")
+        self.sim = sim
+        self.snapshot_interval = snapshot_interval
+        self.inputs = []
+        self.snapshots = []
+
+    def record_input(self, direction):
+        # Se aplica antes del siguiente tick, así que se guarda con el tick actual
+        self.inputs.append((self.sim.ticks, direction))
+
+    def after_step(self):
+        ticks = self.sim.ticks
+        if ticks % self.snapshot_interval == 0 and (not self.snapshots or self.snapshots[-1][0] != ticks):
+            self.snapshots.append((ticks, self.sim.snapshot()))
+
+    def replay(self):
+        sim = self.sim
+        return Replay(sim.seed, sim.grid.maze_hash(), self.inputs, self.snapshots,
+                      sim.ticks, sim.score, state_digest(sim), sim.grid)
+
+
+class SessionRecorder:
+    """Guarda en una carpeta un archivo de repetición por cada partida de Game"""
+    def __init__(self, directory, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.recorder = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, sim):
+        self.recorder = ReplayRecorder(sim, self.snapshot_interval)
+
+    def record_input(self, direction):
+        self.recorder.record_input(direction)
+
+    def after_step(self):
+        self.recorder.after_step()
+
+    def finish(self):
+        """Escribe la partida en curso y devuelve la ruta del archivo"""
+        if self.recorder is None:
+            return None
+        replay = self.recorder.replay()
+        self.recorder = None
+        base = time.strftime("%Y%m%d-%H%M%S") + f"-{replay.seed:016x}"
+        # Dos partidas en el mismo segundo y con la misma semilla no se pisan
+        for attempt in itertools.count():
+            name = base + (f"-{attempt}" if attempt else "") + ".pmr"
+            path = os.path.join(self.directory, name)
+            try:
+                replay.save(path, exclusive=True)
+                return path
+            except FileExistsError:
+                continue
+
+
+def watch(replay, start_tick=0):
+    """Muestra la repetición en pantalla. Espacio pausa, flechas saltan 10 segundos, Esc sale"""
+    import pygame
+    from pacman import Game
+
+    game = Game(replay.seek(start_tick))
+    game.previous_sim = None
+    paused = False
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    running = False
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    jump = TICK_RATE * 10 * (1 if event.key == pygame.K_RIGHT else -1)
+                    game.sim = replay.seek(max(0, game.sim.ticks + jump))
+
+        if not paused and game.sim.ticks < replay.final_tick and not game.sim.done:
+            game.save_positions()
+            replay.advance(game.sim, game.sim.ticks + 1)
+        game.present()
+        game.clock.tick(TICK_RATE)
+    pygame.quit()
+
+
+def check_sessions(seed=5):
+    """Graba sin ventana partidas con una flecha al final y comprueba que se
+    verifican. Devuelve la lista de problemas (vacía si todo coincide)"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from pacman import Game, SimulationThread
+
+    problems = []
+    # (nombre, ticks a jugar o None hasta el final, con SimulationThread)
+    cases = [("flecha tras acabar la partida", None, False),
+             ("flecha justo antes de cerrar", 100, False),
+             ("flecha tras acabar, en modo con hilo", None, True)]
+    with tempfile.TemporaryDirectory() as directory:
+        for name, ticks, threaded in cases:
+            recorder = SessionRecorder(directory)
+            game = Game(Simulation(seed=seed), recorder=recorder, offscreen=True)
+            if threaded:
+                # Sin arrancar el hilo: las órdenes se aplican a mano
+                game.sim_thread = SimulationThread(game.sim, recorder)
+            while not game.sim.done and (ticks is None or game.sim.ticks < ticks):
+                game.sim.step()
+                recorder.after_step()
+            game.change_direction(1)
+            if threaded:
+                game.sim_thread.apply_commands()
+            replay = Replay.load(recorder.finish())
+            if game.sim.done and replay.input_ticks and replay.input_ticks[-1] == replay.final_tick:
+                problems.append(f"{name}: se grabó una entrada con la partida acabada")
+            problems += [f"{name}: {problem}" for problem in replay.verify()]
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce una partida grabada")
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--seek", type=int, default=None, help="tick al que saltar")
+    parser.add_argument("--verify", action="store_true",
+                        help="reproducir desde el tick 0 y comprobar que todo coincide")
+    parser.add_argument("--watch", action="store_true", help="ver la repetición en pantalla")
+    parser.add_argument("--check", action="store_true",
+                        help="grabar y verificar sin ventana partidas con entradas al final")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        problems = check_sessions()
+        for problem in problems:
+            print(problem)
+        print("OK" if not problems else "NO COINCIDE")
+        return 1 if problems else 0
+    if args.path is None:
+        parser.error("falta la ruta de la repetición")
+
+    replay = Replay.load(args.path)
+    print(f"semilla {replay.seed}  ticks {replay.final_tick} "
+          f"({replay.final_tick / TICK_RATE:.0f}s)  entradas {len(replay.inputs)}  "
+          f"instantáneas {len(replay.snapshots)}  puntuación {replay.final_score}")
+
+    if args.watch:
+        watch(replay, args.seek or 0)
+        return 0
+
+    start = time.perf_counter()
+    if args.verify:
+        problems = replay.verify()
+        elapsed = time.perf_counter() - start
+        for problem in problems:
+            print(problem)
+        print(f"{'OK' if not problems else 'NO COINCIDE'}  {elapsed:.2f}s  "
+              f"{replay.final_tick / elapsed:.0f} ticks/s")
+        return 1 if problems else 0
+
+    tick = replay.final_tick if args.seek is None else args.seek
+    sim = replay.seek(tick)
+    elapsed = time.perf_counter() - start
+    print(f"tick {sim.ticks}: puntuación {sim.score}  vidas {sim.lives}  ({elapsed * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Ejecuta muchas partidas sin pantalla repartidas en un pool de procesos.
+
+Cada partida usa su propia semilla, así que los mismos parámetros dan siempre
+los mismos resultados sin importar cuántos procesos se usen.
+
+    python rollouts.py --games 100000 --seed 0
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Los procesos hijos importan pacman; no hace falta el saludo de pygame en cada uno
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import Simulation
+
+GameResult = namedtuple("GameResult", ["seed", "score", "lives_lost", "ticks", "win"])
+
+MAX_TICKS = 60 * 60 * 10  # 10 minutos de juego
+
+
+def random_policy(sim, rng):
+    """Bot de prueba: elige una dirección al azar al llegar a cada celda o de vez en cuando"""
+    if not sim.pacman.moving or rng.random() < 0.02:
+        return rng.randint(0, 3)
+    return None
+
+
+def play_game(seed, policy=random_policy, max_ticks=MAX_TICKS):
+    sim = Simulation(seed=seed)
+    # La política tiene su propio generador para no alterar el de la partida
+    policy_rng = random.Random(f"{seed}:policy")
+    lives = sim.lives
+    while not sim.done and sim.ticks < max_ticks:
+        sim.step(policy(sim, policy_rng))
+    return GameResult(seed, sim.score, lives - sim.lives, sim.ticks, sim.win)
+
+
+def play_chunk(seeds, policy=random_policy, max_ticks=MAX_TICKS):
+    return [play_game(seed, policy, max_ticks) for seed in seeds]
+
+
+def run_rollouts(seeds, policy=random_policy, max_ticks=MAX_TICKS,
+                 workers=None, chunk_size=256):
+    """Genera listas de GameResult a medida que cada bloque de partidas termina.
+
+    Los bloques pueden llegar desordenados; cada resultado lleva su semilla.
+    Como mucho hay dos bloques por proceso en vuelo, así la memoria no crece
+    con el número de partidas. policy debe ser una función de nivel de módulo
+    para poder enviarse a los procesos.
+    """
+    workers = workers or os.cpu_count() or 1
+    seeds = iter(seeds)
+
+    def next_chunk():
+        chunk = []
+        for seed in seeds:
+            chunk.append(seed)
+            if len(chunk) == chunk_size:
+                break
+        return chunk
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        while True:
+            while len(pending) < workers * 2:
+                chunk = next_chunk()
+                if not chunk:
+                    break
+                pending.add(pool.submit(play_chunk, chunk, policy, max_ticks))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partidas sin pantalla en paralelo")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="semilla de la primera partida")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = wins = total_score = total_ticks = 0
+    seeds = range(args.seed, args.seed + args.games)
+    for chunk in run_rollouts(seeds, max_ticks=args.max_ticks,
+                              workers=args.workers, chunk_size=args.chunk_size):
+        for result in chunk:
+            games += 1
+            wins += result.win
+            total_score += result.score
+            total_ticks += result.ticks
+        print(f"\r{games}/{args.games} partidas", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    if games:
+        print(f"partidas: {games}  victorias: {wins}  "
+              f"puntuación media: {total_score / games:.1f}  "
+              f"ticks medios: {total_ticks / games:.1f}")
+    print(f"{elapsed:.1f}s  {games / elapsed:.1f} partidas/s  {total_ticks / elapsed:.0f} ticks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""Retransmisión de partidas en directo a espectadores por TCP (asyncio).
+
+En vez de imágenes se mandan cambios de estado tick a tick: los campos de las
+entidades que cambiaron (como diferencias en varints), las celdas comidas y
+los contadores de la partida. Cada cierto tiempo se manda un keyframe con el
+estado completo (Simulation.snapshot), que es lo que recibe primero quien se
+conecta tarde junto con los cambios desde entonces. El cliente reconstruye la
+partida en una Simulation y la dibuja con Game.
+
+    python spectator.py serve --port 8765              # partida de un bot, en bucle
+    python pacman.py --spectate 8765                   # retransmitir la partida del jugador
+    python spectator.py watch localhost:8765
+    python spectator.py loadtest --clients 300 --seconds 10
+
+Mensajes: cabecera (tipo, longitud) y contenido.
+- HELLO: versión y laberinto (MazeGrid.to_bytes: dimensiones, salidas, túnel y celdas en zlib)
+- KEYFRAME: Simulation.snapshot() en zlib
+- DELTA: cambios de un tick (ver StateEncoder.delta)
+"""
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import Simulation, BonusFruit, MAZE_GRID, TICK_RATE, grid_from_bytes
+
+PROTOCOL_VERSION = 2  # 2: el laberinto lleva la salida de Pacman y el túnel
+HELLO = 0
+KEYFRAME = 1
+DELTA = 2
+MESSAGE_HEADER = struct.Struct("<BI")  # tipo, longitud del contenido
+HELLO_HEADER = struct.Struct("<B20s")  # versión, hash del laberinto; después MazeGrid.to_bytes()
+
+KEYFRAME_INTERVAL = TICK_RATE * 5  # Un keyframe cada 5 segundos de juego
+MAX_CLIENT_BUFFER = 256 * 1024  # Bytes pendientes de enviar a partir de los que un espectador se salta mensajes
+RESTART_DELAY = TICK_RATE * 3  # Ticks de pausa entre partidas en el modo serve
+
+# Fruta en un DELTA: sin fruta antes ni ahora, desaparece, aparece o cambia
+FRUIT_NONE = 0
+FRUIT_REMOVED = 1
+FRUIT_ADDED = 2
+FRUIT_CHANGED = 3
+FRUIT_FIELDS = 6  # Campos de BonusFruit.get_state
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def write_changes(out, old, new):
+    """Máscara de campos que cambian y la diferencia de cada uno (zigzag, varint)"""
+    mask = 0
+    differences = []
+    for index, (before, after) in enumerate(zip(old, new)):
+        if before != after:
+            mask |= 1 << index
+            differences.append(after - before)
+    write_varint(out, mask)
+    for difference in differences:
+        write_varint(out, difference << 1 if difference >= 0 else (-difference << 1) - 1)
+
+
+def read_changes(data, offset, old):
+    mask, offset = read_varint(data, offset)
+    new = list(old)
+    index = 0
+    while mask:
+        if mask & 1:
+            value, offset = read_varint(data, offset)
+            new[index] += -((value + 1) >> 1) if value & 1 else value >> 1
+        mask >>= 1
+        index += 1
+    return tuple(new), offset
+
+
+def message(kind, payload):
+    return MESSAGE_HEADER.pack(kind, len(payload)) + payload
+
+
+def entity_states(sim):
+    return [sim.get_state(), sim.pacman.get_state()] + [ghost.get_state() for ghost in sim.ghosts]
+
+
+def view_digest(sim):
+    """Resumen de lo que ve un espectador: contadores, entidades, fruta y puntos (no el generador)"""
+    state = entity_states(sim)
+    if sim.bonus_fruit is not None:
+        state.append(sim.bonus_fruit.get_state())
+    digest = hashlib.blake2b(repr(state).encode(), digest_size=16)
+    digest.update(sim.pellets.to_bytes())
+    return digest.hexdigest()
+
+
+def grid_from_hello(payload):
+    version, maze_hash = HELLO_HEADER.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"versión de protocolo no soportada: {version}")
+    grid = grid_from_bytes(payload[HELLO_HEADER.size:])
+    if grid.maze_hash() != maze_hash.hex():
+        raise ValueError("el laberinto recibido no coincide con su hash")
+    return grid
+
+
+class StateEncoder:
+    """Convierte una Simulation, tick a tick, en mensajes para los espectadores.
+
+    Se usa desde el hilo que avanza la partida; los mensajes son bytes listos
+    para enviar a todos los espectadores.
+    """
+    def __init__(self, sim, keyframe_interval=KEYFRAME_INTERVAL):
+        self.sim = sim
+        self.keyframe_interval = keyframe_interval
+        self.states = None
+        self.fruit_state = None
+        self.pellets = None
+        self.pellet_generation = 0
+        self.pellets_eaten = 0
+        self.keyframe_tick = 0
+
+    def hello(self):
+        grid = self.sim.grid
+        payload = HELLO_HEADER.pack(PROTOCOL_VERSION, bytes.fromhex(grid.maze_hash()))
+        return message(HELLO, payload + grid.to_bytes())
+
+    def keyframe(self):
+        sim = self.sim
+        self.states = entity_states(sim)
+        self.fruit_state = sim.bonus_fruit.get_state() if sim.bonus_fruit is not None else None
+        self.pellets = sim.pellets
+        self.pellet_generation = sim.pellets.generation
+        self.pellets_eaten = len(sim.pellets.eaten)
+        self.keyframe_tick = sim.ticks
+        return message(KEYFRAME, zlib.compress(sim.snapshot(), 1))
+
+    def update(self):
+        """(mensaje, es keyframe) con lo que cambió desde la última llamada, o None si nada"""
+        sim = self.sim
+        pellets = sim.pellets
+        # Partida nueva o estado restaurado: no se puede expresar como cambios
+        if (self.states is None or pellets is not self.pellets or pellets.generation != self.pellet_generation
+                or sim.ticks < self.keyframe_tick or sim.ticks - self.keyframe_tick >= self.keyframe_interval):
+            return self.keyframe(), True
+        return self.delta()
+
+    def delta(self):
+        # Contadores, Pacman, cada fantasma, fruta y celdas comidas, en ese orden
+        sim = self.sim
+        states = entity_states(sim)
+        fruit_state = sim.bonus_fruit.get_state() if sim.bonus_fruit is not None else None
+        eaten = sim.pellets.eaten[self.pellets_eaten:]
+        if states == self.states and fruit_state == self.fruit_state and not eaten:
+            return None
+
+        out = bytearray()
+        for old, new in zip(self.states, states):
+            write_changes(out, old, new)
+        if fruit_state is None:
+            out.append(FRUIT_NONE if self.fruit_state is None else FRUIT_REMOVED)
+        elif self.fruit_state is None:
+            out.append(FRUIT_ADDED)
+            write_changes(out, (0,) * FRUIT_FIELDS, fruit_state)
+        else:
+            out.append(FRUIT_CHANGED)
+            write_changes(out, self.fruit_state, fruit_state)
+        write_varint(out, len(eaten))
+        for index in eaten:
+            write_varint(out, index)
+
+        self.states = states
+        self.fruit_state = fruit_state
+        self.pellets_eaten = len(sim.pellets.eaten)
+        return message(DELTA, bytes(out)), False
+
+
+class SpectatorClient:
+    """Reconstruye la partida retransmitida en self.sim a partir de los mensajes"""
+    def __init__(self):
+        self.sim = None
+        self.states = None
+        self.fruit_state = None
+        self.bytes_received = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    def apply(self, kind, payload):
+        self.bytes_received += MESSAGE_HEADER.size + len(payload)
+        if kind == HELLO:
+            self.sim = Simulation(seed=0, grid=grid_from_hello(payload))
+            self.states = None
+        elif kind == KEYFRAME:
+            self.sim.restore(zlib.decompress(payload))
+            self.states = entity_states(self.sim)
+            fruit = self.sim.bonus_fruit
+            self.fruit_state = fruit.get_state() if fruit is not None else None
+            self.keyframes += 1
+        elif kind == DELTA and self.states is not None:
+            self.apply_delta(payload)
+            self.deltas += 1
+
+    def apply_delta(self, payload):
+        sim = self.sim
+        offset = 0
+        states = []
+        for old in self.states:
+            new, offset = read_changes(payload, offset, old)
+            states.append(new)
+        sim.set_state(states[0])
+        sim.pacman.set_state(states[1])
+        for ghost, state in zip(sim.ghosts, states[2:]):
+            ghost.set_state(state)
+        self.states = states
+
+        fruit = payload[offset]
+        offset += 1
+        if fruit == FRUIT_REMOVED:
+            self.fruit_state = None
+        elif fruit == FRUIT_ADDED:
+            self.fruit_state, offset = read_changes(payload, offset, (0,) * FRUIT_FIELDS)
+        elif fruit == FRUIT_CHANGED:
+            self.fruit_state, offset = read_changes(payload, offset, self.fruit_state)
+        if fruit != FRUIT_NONE:
+            sim.bonus_fruit = BonusFruit.from_state(self.fruit_state) if self.fruit_state else None
+
+        # Comer por PelletStore.eat deja la celda en pellets.eaten, que es lo que borra Game
+        count, offset = read_varint(payload, offset)
+        width = sim.grid.width
+        for _ in range(count):
+            index, offset = read_varint(payload, offset)
+            sim.pellets.eat(index % width, index // width)
+
+    async def receive(self, reader):
+        """Aplica mensajes hasta que el servidor cierra la conexión"""
+        while True:
+            try:
+                header = await reader.readexactly(MESSAGE_HEADER.size)
+                kind, size = MESSAGE_HEADER.unpack(header)
+                payload = await reader.readexactly(size)
+            except asyncio.IncompleteReadError:
+                return
+            self.apply(kind, payload)
+
+
+class SpectatorServer:
+    """Envía a cada espectador el saludo, el último keyframe y los cambios desde entonces,
+    y después cada mensaje nuevo.
+
+    publish() no espera a nadie: un espectador que no lee lo bastante rápido se
+    salta mensajes y se pone al día con el último keyframe cuando su conexión
+    se vacía, así que la partida nunca se frena por él.
+    """
+    def __init__(self, hello, max_buffer=MAX_CLIENT_BUFFER):
+        self.hello = hello  # StateEncoder.hello() de la partida que se retransmite
+        self.max_buffer = max_buffer
+        self.keyframe = None
+        self.backlog = []  # DELTA desde el último keyframe
+        self.clients = {}  # writer -> al día (recibe cada mensaje)
+        self.server = None
+        self.bytes_sent = 0
+
+    async def start(self, host="localhost", port=8765):
+        self.server = await asyncio.start_server(self.handle_client, host, port, backlog=1024)
+        return self.server
+
+    def catch_up(self, writer):
+        data = b"".join([self.keyframe] + self.backlog)
+        writer.write(data)
+        self.bytes_sent += len(data)
+        self.clients[writer] = True
+
+    def publish(self, data, keyframe=False):
+        if keyframe:
+            self.keyframe = data
+            self.backlog = []
+        else:
+            self.backlog.append(data)
+        for writer, synced in self.clients.items():
+            transport = writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                self.clients[writer] = False
+            elif synced:
+                writer.write(data)
+                self.bytes_sent += len(data)
+            else:
+                self.catch_up(writer)
+
+    async def handle_client(self, reader, writer):
+        writer.write(self.hello)
+        self.clients[writer] = False
+        if self.keyframe is not None:
+            self.catch_up(writer)
+        try:
+            # Los espectadores no mandan nada; se espera a que cierren
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def close(self):
+        # Lo pendiente se envía antes de cerrar cada conexión
+        for writer in list(self.clients):
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def run_game(server, encoder, policy, ticks=None):
+    """Avanza la partida de encoder a TICK_RATE y publica cada tick; al terminar empieza otra.
+
+    Con ticks se para tras ese número de ticks y devuelve el retraso de cada
+    uno respecto a su hora prevista, en segundos.
+    """
+    loop = asyncio.get_running_loop()
+    sim = encoder.sim
+    server.publish(*encoder.update())
+    rng = random.Random(sim.seed)
+    tick_seconds = 1.0 / TICK_RATE
+    next_tick = loop.time()
+    lateness = []
+    done_ticks = 0
+    count = 0
+    while ticks is None or count < ticks:
+        next_tick += tick_seconds
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        if ticks is not None:
+            lateness.append(max(0.0, loop.time() - next_tick))
+        if sim.done:
+            done_ticks += 1
+            if done_ticks >= RESTART_DELAY:
+                sim.reset(rng.randrange(2**64))
+                done_ticks = 0
+        else:
+            sim.step(policy(sim, rng))
+        update = encoder.update()
+        if update is not None:
+            server.publish(*update)
+        count += 1
+    return lateness
+
+
+class SpectatorBroadcast:
+    """Retransmite la partida de Game: se pasa como recorder y publica cada tick.
+
+    El servidor corre en su propio hilo con su bucle de asyncio; el hilo del
+    juego solo codifica el tick y le pasa los bytes.
+    """
+    def __init__(self, port=8765, host="localhost"):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.encoder = None
+        self.loop = None
+
+    def start(self, sim):
+        self.encoder = StateEncoder(sim)
+        if self.server is None:
+            # El servidor arranca con la primera partida, que da el laberinto del saludo
+            self.server = SpectatorServer(self.encoder.hello())
+            self.loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def serve():
+                asyncio.set_event_loop(self.loop)
+                self.loop.run_until_complete(self.server.start(self.host, self.port))
+                started.set()
+                self.loop.run_forever()
+
+            threading.Thread(target=serve, name="spectator", daemon=True).start()
+            started.wait()
+        self.loop.call_soon_threadsafe(self.server.publish, *self.encoder.update())
+
+    def record_input(self, direction):
+        pass
+
+    def after_step(self):
+        update = self.encoder.update()
+        if update is not None:
+            self.loop.call_soon_threadsafe(self.server.publish, *update)
+
+    def finish(self):
+        return None
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+async def watch(host, port):
+    """Muestra la partida retransmitida; Esc sale"""
+    import pygame
+    from pacman import Game
+
+    client = SpectatorClient()
+    reader, writer = await asyncio.open_connection(host, port)
+    receiving = asyncio.ensure_future(client.receive(reader))
+    while client.states is None and not receiving.done():
+        await asyncio.sleep(0.01)
+    if client.states is None:
+        print("el servidor cerró la conexión")
+        return
+
+    game = Game(client.sim)
+    running = True
+    while running and not receiving.done():
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                running = False
+        game.present()
+        await asyncio.sleep(1.0 / TICK_RATE)
+    writer.close()
+    pygame.quit()
+
+
+def run_clients(host, port, count, results):
+    # Proceso aparte con su propio bucle: count espectadores sin pantalla
+    async def main():
+        clients = [SpectatorClient() for _ in range(count)]
+        connections = [await asyncio.open_connection(host, port) for _ in clients]
+        await asyncio.gather(*(client.receive(reader)
+                               for client, (reader, _) in zip(clients, connections)))
+        results.put([(view_digest(client.sim) if client.sim else None,
+                      client.bytes_received, client.keyframes, client.deltas) for client in clients])
+    asyncio.run(main())
+
+
+async def loadtest(clients, seconds, port, seed, processes):
+    """Partida de un bot retransmitida a muchos espectadores en localhost.
+
+    Comprueba que todos terminan con el mismo estado que el servidor y mide
+    el retraso de los ticks y los bytes enviados.
+    """
+    from rollouts import random_policy
+
+    sim = Simulation(seed=seed)
+    encoder = StateEncoder(sim)
+    server = SpectatorServer(encoder.hello())
+    await server.start("localhost", port)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=run_clients,
+                                       args=("localhost", port, clients // processes + (i < clients % processes), results))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    # Esperar a que se conecten todos antes de empezar
+    while len(server.clients) < clients:
+        await asyncio.sleep(0.01)
+
+    start = time.perf_counter()
+    lateness = await run_game(server, encoder, random_policy, seconds * TICK_RATE)
+    elapsed = time.perf_counter() - start
+    await server.close()
+
+    loop = asyncio.get_running_loop()
+    states = []
+    for _ in workers:
+        states += await loop.run_in_executor(None, results.get)
+    for worker in workers:
+        worker.join()
+
+    expected = view_digest(sim)
+    matched = sum(digest == expected for digest, *_ in states)
+    lateness.sort()
+    received = sum(size for _, size, _, _ in states)
+    print(f"{clients} espectadores, {len(lateness)} ticks en {elapsed:.1f}s")
+    print(f"retraso por tick: p50 {lateness[len(lateness) // 2] * 1e3:.2f} ms  "
+          f"p99 {lateness[int(len(lateness) * 0.99)] * 1e3:.2f} ms  máx {lateness[-1] * 1e3:.2f} ms")
+    print(f"{received / max(len(states), 1) / len(lateness):.1f} bytes por tick y espectador "
+          f"(keyframe {len(server.keyframe)} bytes)")
+    print(f"{matched}/{len(states)} espectadores con el mismo estado que el servidor")
+    return 0 if matched == clients else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retransmisión de partidas a espectadores")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="retransmitir partidas de un bot, una tras otra")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--seed", type=int, default=None)
+    serve.add_argument("--maze", metavar="ANCHOxALTO", help="laberinto generado (mazegen.py)")
+    serve.add_argument("--maze-seed", type=int, default=None)
+    watch_parser = commands.add_parser("watch", help="ver una retransmisión")
+    watch_parser.add_argument("address", help="HOST:PUERTO")
+    load = commands.add_parser("loadtest", help="muchos espectadores en localhost")
+    load.add_argument("--clients", type=int, default=300)
+    load.add_argument("--seconds", type=int, default=10)
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--processes", type=int, default=2, help="procesos para los espectadores")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        from rollouts import random_policy
+
+        grid = MAZE_GRID
+        if args.maze:
+            from mazegen import generate_grid
+            width, height = (int(size) for size in args.maze.lower().split("x"))
+            grid = generate_grid(width, height, args.maze_seed)
+
+        async def serve_forever():
+            encoder = StateEncoder(Simulation(seed=args.seed, grid=grid))
+            server = SpectatorServer(encoder.hello())
+            await server.start(args.host, args.port)
+            print(f"retransmitiendo en {args.host}:{args.port}")
+            await run_game(server, encoder, random_policy)
+        asyncio.run(serve_forever())
+    elif args.command == "watch":
+        asyncio.run(watch(*parse_address(args.address)))
+    else:
+        return asyncio.run(loadtest(args.clients, args.seconds, args.port, args.seed, args.processes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
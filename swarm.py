@@ -0,0 +1,459 @@
+"""Modo enjambre: cientos de fantasmas en arrays NumPy (requiere NumPy).
+
+GhostSwarm guarda posiciones, direcciones, modos y temporizadores de todos los
+fantasmas en un array por campo y los mueve con operaciones vectorizadas, con
+las mismas reglas que pacman.Ghost. Para la persecución se usa un solo campo de
+distancias hacia la celda de Pacman, compartido por todo el enjambre. Las
+colisiones con Pacman pasan por un índice de fantasmas por celda: solo se mira
+la distancia de los que están en las nueve celdas alrededor de Pacman.
+
+    from swarm import SwarmSimulation
+    sim = SwarmSimulation(300, seed=1)
+
+    python pacman.py --swarm 300
+    python swarm.py --ghosts 10 100 300 1000
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from pacman import (Simulation, Ghost, MAZE_GRID, GHOSTS, WHITE, DARK_BLUE, CELL_SIZE,
+                    SUBPIXELS, CELL_SUBPIXELS, GHOST_SPEED, GHOST_FRIGHTENED_SPEED,
+                    GHOST_HIT_DISTANCE_SQ)
+from batch_sim import compile_maze, DX, DY, CHASE, SCATTER, FRIGHTENED
+
+SPAWN_CLEARANCE = 8  # Celdas (en manhattan) libres de fantasmas alrededor de la salida de Pacman
+SWARM_RNG_STATE = struct.Struct("<16s16sBI")  # Estado del PCG64 del enjambre
+
+
+class SwarmGhost:
+    """Vista de un fantasma del enjambre con la interfaz que usan Game y Observation"""
+    __slots__ = ("swarm", "index", "original_color")
+
+    draw = Ghost.draw
+    draw_shape = Ghost.draw_shape
+    simple_shape = Ghost.simple_shape
+
+    def __init__(self, swarm, index):
+        self.swarm = swarm
+        self.index = index
+        self.original_color = GHOSTS[index % len(GHOSTS)][1]
+
+    @property
+    def x(self):
+        return int(self.swarm.x[self.index]) / SUBPIXELS
+
+    @property
+    def y(self):
+        return int(self.swarm.y[self.index]) / SUBPIXELS
+
+    @property
+    def is_frightened(self):
+        return bool(self.swarm.frightened[self.index])
+
+    @property
+    def color(self):
+        # Mismo parpadeo que Ghost.update al final del modo asustado
+        swarm = self.swarm
+        if not swarm.frightened[self.index]:
+            return self.original_color
+        if swarm.frightened_timer[self.index] < 120 and swarm.blink_timer[self.index] % 10 < 5:
+            return WHITE
+        return DARK_BLUE
+
+    def get_nearest_cell(self):
+        half = CELL_SUBPIXELS // 2
+        return ((int(self.swarm.x[self.index]) + half) // CELL_SUBPIXELS,
+                (int(self.swarm.y[self.index]) + half) // CELL_SUBPIXELS)
+
+
+class GhostSwarm:
+    """count fantasmas en arrays (struct of arrays). Se recorre como una lista de SwarmGhost"""
+    FIELDS = ("x", "y", "target_x", "target_y", "start_x", "start_y", "direction", "mode",
+              "mode_timer", "frightened_timer", "blink_timer", "frightened", "moving")
+
+    def __init__(self, count, grid=MAZE_GRID, seed=None):
+        self.count = count
+        self.grid = grid
+        self.exits = compile_maze(grid)[0]
+        self.rng = np.random.Generator(np.random.PCG64(seed))
+
+        # Distancias por el laberinto: un campo por celda objetivo, como Ghost
+        self.distances = grid.distances()
+        self.walk_index = np.frombuffer(self.distances.walk_index, dtype=np.int32)
+        self.field_target = None
+        self.field = None
+        self.local_field = None  # Con campos locales: array denso reutilizado y celdas escritas
+        self.local_field_cells = None
+
+        # Un array por campo; posiciones en subpíxeles como en pacman.GridMover
+        self.x = np.zeros(count, dtype=np.int64)
+        self.y = np.zeros(count, dtype=np.int64)
+        self.target_x = np.zeros(count, dtype=np.int64)
+        self.target_y = np.zeros(count, dtype=np.int64)
+        self.start_x = np.zeros(count, dtype=np.int64)
+        self.start_y = np.zeros(count, dtype=np.int64)
+        self.direction = np.zeros(count, dtype=np.int64)
+        self.mode = np.zeros(count, dtype=np.int64)
+        self.mode_timer = np.zeros(count, dtype=np.int64)
+        self.frightened_timer = np.zeros(count, dtype=np.int64)
+        self.blink_timer = np.zeros(count, dtype=np.int64)
+        self.frightened = np.zeros(count, dtype=bool)
+        self.moving = np.zeros(count, dtype=bool)
+
+        # Índice por celda: fantasmas ordenados por la celda más cercana
+        self.cell_order = np.arange(count)
+        self.sorted_cells = np.zeros(count, dtype=np.int64)
+
+        self.views = [SwarmGhost(self, index) for index in range(count)]
+        self.reset(seed)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __getitem__(self, index):
+        return self.views[index]
+
+    def reset(self, seed=None):
+        """Fantasmas repartidos por celdas libres lejos de Pacman, en persecución y parados"""
+        self.rng = np.random.Generator(np.random.PCG64(seed))
+        grid = self.grid
+        free_cells = np.frombuffer(grid.free_cells, dtype=np.uint32).astype(np.int64)
+        start_x, start_y = grid.start_cell
+        far = (np.abs(free_cells % grid.width - start_x) +
+               np.abs(free_cells // grid.width - start_y)) > SPAWN_CLEARANCE
+        spawn = free_cells[far]
+        if len(spawn):
+            cells = self.rng.choice(spawn, self.count, replace=self.count > len(spawn))
+        else:
+            # Laberinto sin sitio: a la casa de fantasmas, como los cuatro clásicos
+            house = [y * grid.width + x for x, y in grid.ghost_start_cells]
+            cells = np.resize(np.array(house, dtype=np.int64), self.count)
+        self.start_x[:] = cells % grid.width * CELL_SUBPIXELS
+        self.start_y[:] = cells // grid.width * CELL_SUBPIXELS
+
+        self.x[:] = self.target_x[:] = self.start_x
+        self.y[:] = self.target_y[:] = self.start_y
+        self.direction[:] = self.rng.integers(0, 4, self.count)
+        self.mode[:] = CHASE
+        # Temporizadores desfasados: el enjambre no cambia de modo todo a la vez
+        self.mode_timer[:] = self.rng.integers(0, 300, self.count)
+        self.frightened_timer[:] = 0
+        self.blink_timer[:] = 0
+        self.frightened[:] = False
+        self.moving[:] = False
+        self.index_cells()
+
+    def update(self, pacman_sub_x, pacman_sub_y):
+        """Un tick de todo el enjambre, como Ghost.update para cada fantasma"""
+        self.mode_timer += 1
+
+        # Modo asustado
+        frightened = self.frightened
+        self.frightened_timer -= frightened
+        self.blink_timer += frightened
+        ends = frightened & (self.frightened_timer <= 0)
+        if ends.any():
+            frightened &= ~ends
+            self.mode[ends] = CHASE
+
+        # Alternar chase/scatter (solo si no está asustado)
+        toggle = ~frightened & (self.mode_timer > 300)
+        if toggle.any():
+            self.mode[toggle] = np.where(self.mode[toggle] == CHASE, SCATTER, CHASE)
+            self.mode_timer[toggle] = 0
+
+        start = ~self.moving
+        if start.any():
+            self.start_movement(np.flatnonzero(start), pacman_sub_x, pacman_sub_y)
+
+        self.move_towards_target()
+        self.index_cells()
+
+    def start_movement(self, ghosts, pacman_sub_x, pacman_sub_y):
+        # ghosts: índices de los fantasmas parados, que eligen dirección
+        cell_x = self.x[ghosts] // CELL_SUBPIXELS
+        cell_y = self.y[ghosts] // CELL_SUBPIXELS
+        height, width = self.grid.height, self.grid.width
+        exits = self.exits[np.clip(cell_y + 2, 0, height + 3), np.clip(cell_x + 2, 0, width + 3)]
+        possible = (exits[:, None] >> np.arange(4) & 1).astype(bool)
+        direction = self.direction[ghosts]
+        decide = exits != 0
+        frightened = decide & self.frightened[ghosts]
+        chase = decide & ~frightened & (self.mode[ghosts] == CHASE)
+        scatter = decide & ~frightened & (self.mode[ghosts] == SCATTER)
+
+        if chase.any():
+            direction[chase] = self.chase_directions(cell_x[chase], cell_y[chase], possible[chase],
+                                                     direction[chase], pacman_sub_x, pacman_sub_y)
+
+        # Asustado: dirección posible al azar; scatter: una vez de cada seis
+        random_pick = frightened | (scatter & (self.rng.integers(0, 6, len(ghosts)) == 0))
+        if random_pick.any():
+            options = possible[random_pick]
+            pick = (self.rng.random(len(options)) * options.sum(axis=1)).astype(np.int64)
+            direction[random_pick] = (options.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+
+        self.direction[ghosts] = direction
+        self.target_x[ghosts] = (cell_x + DX[direction]) * CELL_SUBPIXELS
+        self.target_y[ghosts] = (cell_y + DY[direction]) * CELL_SUBPIXELS
+        self.moving[ghosts] = True
+
+    def chase_field(self, target):
+        # Distancias de cada celda transitable hasta target como array, reutilizado
+        # mientras Pacman no cambie de celda
+        if target == self.field_target:
+            return self.field
+        distances = self.distances
+        field = distances.target_data(target)[0]
+        if distances.table is not None:
+            self.field = np.frombuffer(field, dtype=np.uint16)
+        elif not distances.local:
+            self.field = np.frombuffer(field, dtype=np.uint32)
+        else:
+            # Campo local (diccionario): se vuelca en un array denso que se limpia
+            # celda a celda, sin recorrer el laberinto entero
+            if self.local_field is None:
+                self.local_field = np.full(distances.count, distances.unreachable, dtype=np.uint32)
+            else:
+                self.local_field[self.local_field_cells] = distances.unreachable
+            self.local_field_cells = np.fromiter(field.keys(), dtype=np.int64, count=len(field))
+            self.local_field[self.local_field_cells] = np.fromiter(field.values(), dtype=np.uint32,
+                                                                   count=len(field))
+            self.field = self.local_field
+        self.field_target = target
+        return self.field
+
+    def chase_directions(self, cell_x, cell_y, possible, direction, pacman_sub_x, pacman_sub_y):
+        # Como Ghost.start_movement en chase: la vecina más cercana a Pacman por
+        # el laberinto y, sin camino conocido, la posible más cercana en línea recta
+        height, width = self.grid.height, self.grid.width
+        unreachable = self.distances.unreachable
+        best = np.full(len(cell_x), -1, dtype=np.int64)
+
+        target_x = (pacman_sub_x + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+        target_y = (pacman_sub_y + CELL_SUBPIXELS // 2) // CELL_SUBPIXELS
+        target = -1
+        if 0 <= target_x < width and 0 <= target_y < height:
+            target = int(self.walk_index[target_y * width + target_x])
+        if target >= 0:
+            field = self.chase_field(target)
+            # Vecinas transitables de cada celda, con el túnel horizontal (MazeDistances.cell_neighbors)
+            inside = (cell_x >= 0) & (cell_x < width) & (cell_y >= 0) & (cell_y < height)
+            next_x = (cell_x[:, None] + DX) % width
+            next_y = cell_y[:, None] + DY
+            valid = inside[:, None] & (next_y >= 0) & (next_y < height)
+            neighbors = np.where(valid, self.walk_index[np.clip(next_y, 0, height - 1) * width + next_x], -1)
+            path = np.where(neighbors >= 0, field[np.maximum(neighbors, 0)], unreachable)
+            nearest = path.argmin(axis=1)
+            known = path[np.arange(len(path)), nearest] < unreachable
+            best[known] = nearest[known]
+
+        straight = best < 0
+        if straight.any():
+            next_x = (cell_x[straight, None] + DX) * CELL_SUBPIXELS - pacman_sub_x
+            next_y = (cell_y[straight, None] + DY) * CELL_SUBPIXELS - pacman_sub_y
+            distance = np.where(possible[straight], next_x * next_x + next_y * next_y,
+                                np.iinfo(np.int64).max)
+            best[straight] = distance.argmin(axis=1)
+        return np.where(best >= 0, best, direction)
+
+    def move_towards_target(self):
+        # GridMover.move_towards_target para todos a la vez; asustados más lentos
+        # pero llegan con el mismo margen
+        moving = self.moving
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        arrive = moving & (np.abs(dx) + np.abs(dy) <= GHOST_SPEED)
+        advance = moving & ~arrive
+        speed = np.where(self.frightened, GHOST_FRIGHTENED_SPEED, GHOST_SPEED)
+        np.add(self.x, np.maximum(np.minimum(dx, speed), -speed), out=self.x, where=advance)
+        np.add(self.y, np.maximum(np.minimum(dy, speed), -speed), out=self.y, where=advance)
+
+        if arrive.any():
+            # Llegada y teletransporte horizontal
+            grid = self.grid
+            target_x = self.target_x
+            target_x[arrive & (target_x < 0)] = grid.tunnel_left_x * SUBPIXELS
+            target_x[arrive & (target_x >= grid.sub_width)] = grid.tunnel_right_x * SUBPIXELS
+            np.copyto(self.x, target_x, where=arrive)
+            np.copyto(self.y, self.target_y, where=arrive)
+            moving &= ~arrive
+
+    def index_cells(self):
+        # Índice por celda más cercana (con una celda de margen para el túnel):
+        # los fantasmas ordenados por celda, para buscar por rangos
+        half = CELL_SUBPIXELS // 2
+        cells = ((self.y + half) // CELL_SUBPIXELS + 1) * (self.grid.width + 2) + (self.x + half) // CELL_SUBPIXELS + 1
+        self.cell_order = np.argsort(cells, kind="stable")
+        self.sorted_cells = cells[self.cell_order]
+
+    def near(self, cell_x, cell_y):
+        """Índices, en orden, de los fantasmas cuya celda más cercana está a una celda o menos"""
+        stride = self.grid.width + 2
+        # Filas cell_y - 1 .. cell_y + 1 (con el margen): rango [centro - 1, centro + 2) en cada una
+        rows = [(cell_y + row) * stride + cell_x + 1 for row in range(3)]
+        bounds = np.searchsorted(self.sorted_cells, [edge for row in rows for edge in (row - 1, row + 2)]).tolist()
+        order = self.cell_order
+        return sorted(index for first, last in zip(bounds[::2], bounds[1::2])
+                      for index in order[first:last].tolist())
+
+    def make_frightened(self):
+        self.frightened[:] = True
+        self.frightened_timer[:] = 300
+        self.blink_timer[:] = 0
+        self.mode[:] = FRIGHTENED
+
+    def reset_position(self, ghost):
+        self.x[ghost] = self.target_x[ghost] = self.start_x[ghost]
+        self.y[ghost] = self.target_y[ghost] = self.start_y[ghost]
+        self.moving[ghost] = False
+        self.frightened[ghost] = False
+        self.mode[ghost] = CHASE
+
+    def to_bytes(self):
+        state = self.rng.bit_generator.state
+        rng_state = SWARM_RNG_STATE.pack(state["state"]["state"].to_bytes(16, "little"),
+                                         state["state"]["inc"].to_bytes(16, "little"),
+                                         state["has_uint32"], state["uinteger"])
+        return rng_state + b"".join(getattr(self, name).tobytes() for name in self.FIELDS)
+
+    def load(self, data, offset):
+        """Carga el estado de to_bytes() y devuelve la posición justo después"""
+        state, inc, has_uint32, uinteger = SWARM_RNG_STATE.unpack_from(data, offset)
+        self.rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": int.from_bytes(state, "little"), "inc": int.from_bytes(inc, "little")},
+            "has_uint32": has_uint32, "uinteger": uinteger,
+        }
+        offset += SWARM_RNG_STATE.size
+        for name in self.FIELDS:
+            values = getattr(self, name)
+            values[:] = np.frombuffer(data, dtype=values.dtype, count=self.count, offset=offset)
+            offset += values.nbytes
+        self.index_cells()
+        return offset
+
+    def copy(self):
+        swarm = GhostSwarm.__new__(GhostSwarm)
+        swarm.__dict__.update(self.__dict__)
+        swarm.rng = np.random.Generator(np.random.PCG64())
+        swarm.rng.bit_generator.state = self.rng.bit_generator.state
+        for name in self.FIELDS + ("cell_order", "sorted_cells"):
+            setattr(swarm, name, getattr(self, name).copy())
+        swarm.local_field = None
+        swarm.field_target = None
+        swarm.views = [SwarmGhost(swarm, index) for index in range(self.count)]
+        return swarm
+
+
+class SwarmSimulation(Simulation):
+    """Simulation con count fantasmas en un GhostSwarm en lugar de los cuatro clásicos.
+
+    Misma semilla, misma partida; snapshot, restore, clone y reset funcionan igual.
+    """
+    def __init__(self, count, seed=None, grid=MAZE_GRID):
+        self.ghost_count = count
+        super().__init__(seed, grid)
+
+    def create_ghosts(self):
+        return GhostSwarm(self.ghost_count, self.grid)
+
+    def reset_ghosts(self):
+        # La semilla del enjambre sale del generador de la partida
+        self.ghosts.reset(self.rng.getrandbits(64))
+
+    def update_ghosts(self):
+        self.ghosts.update(self.pacman.sub_x, self.pacman.sub_y)
+
+    def frighten_ghosts(self):
+        self.ghosts.make_frightened()
+
+    def ghosts_to_bytes(self):
+        return self.ghosts.to_bytes()
+
+    def load_ghosts(self, data, offset):
+        return self.ghosts.load(data, offset)
+
+    def copy_ghosts(self, rng):
+        return self.ghosts.copy()
+
+    def check_ghost_collision(self):
+        # Fase amplia: solo los fantasmas de las celdas vecinas a la de Pacman.
+        # Después, como Simulation.check_ghost_collision, en orden de fantasma
+        swarm = self.ghosts
+        pacman_x = self.pacman.sub_x
+        pacman_y = self.pacman.sub_y
+        cell_x, cell_y = self.pacman.get_nearest_cell()
+        for ghost in swarm.near(cell_x, cell_y):
+            dx = pacman_x - int(swarm.x[ghost])
+            dy = pacman_y - int(swarm.y[ghost])
+            if dx * dx + dy * dy < GHOST_HIT_DISTANCE_SQ:
+                if swarm.frightened[ghost]:
+                    # Comer fantasma
+                    self.score += 200
+                    swarm.reset_position(ghost)
+                else:
+                    # Pacman muere
+                    self.lives -= 1
+                    if self.lives <= 0:
+                        self.game_over = True
+                    else:
+                        start_x, start_y = self.find_start_position()
+                        self.pacman.place(start_x * CELL_SIZE, start_y * CELL_SIZE)
+                    break
+
+
+def scalar_ghosts(count, grid, rng):
+    # El mismo número de pacman.Ghost en una lista, para comparar
+    cells = grid.ghost_start_cells
+    return [Ghost(cells[index % len(cells)][0] * CELL_SIZE, cells[index % len(cells)][1] * CELL_SIZE,
+                  GHOSTS[index % len(GHOSTS)][1], GHOSTS[index % len(GHOSTS)][0], rng, grid)
+            for index in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el coste por tick del enjambre de fantasmas")
+    parser.add_argument("--ghosts", type=int, nargs="+", default=[4, 100, 300, 1000])
+    parser.add_argument("--ticks", type=int, default=600)
+    args = parser.parse_args(argv)
+
+    print(f"{'fantasmas':>10} {'enjambre us/tick':>17} {'Ghost us/tick':>14}")
+    for count in args.ghosts:
+        sim = SwarmSimulation(count, seed=0)
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            if sim.done:
+                sim.reset(rng.randrange(2**64))
+            sim.step(rng.randint(0, 3) if rng.random() < 0.05 else None)
+        swarm_time = (time.perf_counter() - start) / args.ticks
+
+        # Lo mismo con objetos Ghost: update y la distancia a cada uno
+        sim = Simulation(seed=0)
+        ghosts = scalar_ghosts(count, sim.grid, sim.rng)
+        start = time.perf_counter()
+        for _ in range(args.ticks):
+            sim.pacman.update()
+            for ghost in ghosts:
+                ghost.update(sim.pacman.sub_x, sim.pacman.sub_y)
+                dx = sim.pacman.sub_x - ghost.sub_x
+                dy = sim.pacman.sub_y - ghost.sub_y
+                dx * dx + dy * dy < GHOST_HIT_DISTANCE_SQ
+        scalar_time = (time.perf_counter() - start) / args.ticks
+        print(f"{count:>10} {swarm_time * 1e6:>17.1f} {scalar_time * 1e6:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Cámara para laberintos más grandes que la pantalla.
+
+La cámara sigue a Pacman y solo se dibujan los bloques de celdas visibles.
+Cada bloque (paredes y puntos) se rasteriza la primera vez que se ve y se
+guarda en una caché LRU; al comer un punto se borra del bloque si está en la
+caché. El coste por frame depende del tamaño de la pantalla, no del laberinto.
+"""
+from collections import OrderedDict
+
+import pygame
+
+from pacman import CELL_SIZE, BLACK, BLUE, WHITE, WALL_COLOR, WALL, DOT, opaque_surface
+
+CHUNK_CELLS = 16  # Celdas por lado de cada bloque
+CHUNK_CACHE_SIZE = 48  # Bloques en memoria (una pantalla usa unos 12)
+
+
+class MazeViewport:
+    """Ventana de width x height píxeles sobre el laberinto, con bloques cacheados"""
+    def __init__(self, grid, width, height):
+        self.grid = grid
+        self.width = width
+        self.height = height
+        self.chunk_size = CHUNK_CELLS * CELL_SIZE
+        self.camera_x = 0
+        self.camera_y = 0
+        self.max_camera_x = max(grid.width * CELL_SIZE - width, 0)
+        self.max_camera_y = max(grid.height * CELL_SIZE - height, 0)
+
+        self.chunks = OrderedDict()  # (bloque x, bloque y) -> Surface
+        self.pellets = None
+        self.pellet_generation = 0
+        self.pellets_eaten = 0
+
+    @property
+    def camera(self):
+        return (self.camera_x, self.camera_y)
+
+    def follow(self, x, y):
+        """Centra la cámara en la celda cuya esquina está en (x, y), sin salirse del laberinto"""
+        self.camera_x = min(max(int(x) + CELL_SIZE // 2 - self.width // 2, 0), self.max_camera_x)
+        self.camera_y = min(max(int(y) + CELL_SIZE // 2 - self.height // 2, 0), self.max_camera_y)
+
+    def sync_pellets(self, pellets):
+        # Partida nueva o estado restaurado: los bloques se rehacen al verlos
+        if pellets.source is not self.pellets or pellets.generation != self.pellet_generation:
+            self.chunks.clear()
+            self.pellets = pellets.source
+            self.pellet_generation = pellets.generation
+            self.pellets_eaten = len(pellets.eaten)
+            return
+
+        # Borrar de los bloques cacheados solo lo que se comió desde el último frame
+        width = self.grid.width
+        for index in pellets.eaten[self.pellets_eaten:]:
+            cell_x = index % width
+            cell_y = index // width
+            chunk = self.chunks.get((cell_x // CHUNK_CELLS, cell_y // CHUNK_CELLS))
+            if chunk is not None:
+                chunk.fill(BLACK, ((cell_x % CHUNK_CELLS) * CELL_SIZE,
+                                   (cell_y % CHUNK_CELLS) * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+        self.pellets_eaten = len(pellets.eaten)
+
+    def chunk(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        surface = self.chunks.get(key)
+        if surface is not None:
+            self.chunks.move_to_end(key)
+            return surface
+
+        surface = self.build_chunk(chunk_x, chunk_y)
+        self.chunks[key] = surface
+        if len(self.chunks) > CHUNK_CACHE_SIZE:
+            self.chunks.popitem(last=False)
+        return surface
+
+    def build_chunk(self, chunk_x, chunk_y):
+        # Paredes y puntos de un bloque, igual que Game.build_wall_layer y build_pellet_layer
+        grid = self.grid
+        surface = opaque_surface((self.chunk_size, self.chunk_size))
+        surface.fill(BLACK)
+        first_x = chunk_x * CHUNK_CELLS
+        first_y = chunk_y * CHUNK_CELLS
+        for cell_y in range(first_y, min(first_y + CHUNK_CELLS, grid.height)):
+            for cell_x in range(first_x, min(first_x + CHUNK_CELLS, grid.width)):
+                left = (cell_x - first_x) * CELL_SIZE
+                top = (cell_y - first_y) * CELL_SIZE
+                cell = grid.cell(cell_x, cell_y)
+                if cell == WALL:
+                    rect = pygame.Rect(left, top, CELL_SIZE, CELL_SIZE)
+                    pygame.draw.rect(surface, WALL_COLOR, rect)
+                    pygame.draw.rect(surface, BLUE, rect, 1)
+                elif cell == DOT and self.pellets.kind_at(cell_y * grid.width + cell_x) == DOT:
+                    pygame.draw.circle(surface, WHITE, (left + CELL_SIZE // 2, top + CELL_SIZE // 2), 2)
+        return surface
+
+    def draw(self, screen, pellets):
+        """Dibuja los bloques visibles (paredes y puntos) con la cámara actual"""
+        self.sync_pellets(pellets)
+        chunk_size = self.chunk_size
+        for chunk_y in range(self.camera_y // chunk_size, (self.camera_y + self.height - 1) // chunk_size + 1):
+            for chunk_x in range(self.camera_x // chunk_size, (self.camera_x + self.width - 1) // chunk_size + 1):
+                # Lo que asoma por debajo de la ventana se recorta
+                position = (chunk_x * chunk_size - self.camera_x, chunk_y * chunk_size - self.camera_y)
+                area = pygame.Rect(0, 0, chunk_size, min(chunk_size, self.height - position[1]))
+                screen.blit(self.chunk(chunk_x, chunk_y), position, area)